@@ -1,7 +1,6 @@
 import streamlit as st
 import requests
 import json
-import yaml
 import pandas as pd
 import os
 from dotenv import load_dotenv
@@ -56,87 +55,72 @@ model_b_id = "global.anthropic.claude-haiku-4-5-20251001-v1:0"
 
 st.sidebar.info(f"Comparing:\n1. Claude 3 Haiku\n2. Claude 4.5 Haiku")
 
-def run_eval(target_provider, target_model_id, run_name):
+MODELS = [
+    {"provider": "bedrock", "model_id": model_a_id, "name": "Claude 3 Haiku"},
+    {"provider": "bedrock", "model_id": model_b_id, "name": "Claude 4.5 Haiku"},
+]
+
+
+def run_comparison(targets):
     config_path = ".llm-reliability.yaml"
     if not os.path.exists(config_path):
         config_path = "config.yaml"
-    
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
-    
-    config["target_model"]["provider"] = target_provider
-    config["target_model"]["model_id"] = target_model_id
-    
-    temp_config = f"temp_config_{run_name}.yaml"
-    with open(temp_config, "w") as f:
-        yaml.dump(config, f)
-    
+
     try:
-        resp = requests.post("http://localhost:8000/evaluate", json={"config_path": os.path.abspath(temp_config)})
-        if os.path.exists(temp_config):
-            os.remove(temp_config)
+        resp = requests.post(
+            "http://localhost:8000/compare",
+            json={"targets": targets, "config_path": os.path.abspath(config_path)},
+        )
         if resp.status_code == 200:
             return resp.json()
         else:
-            st.error(f"Run failed ({run_name}): {resp.text}")
+            st.error(f"Comparison failed: {resp.text}")
             return None
     except Exception as e:
         st.error(f"Connection error: {e}")
         return None
 
 if st.sidebar.button("Run Side-by-Side Comparison"):
-    col1, col2 = st.columns(2)
-    
-    with st.spinner("Evaluating Model A (Claude 3 Haiku)..."):
-        res_a = run_eval("bedrock", model_a_id, "claude_3")
-    
-    with st.spinner("Evaluating Model B (Claude 4.5 Haiku)..."):
-        res_b = run_eval("bedrock", model_b_id, "claude_4_5")
-        
-    if res_a and res_b:
+    # One call: shared prompts, models run concurrently, shared claims verified once
+    with st.spinner("Evaluating models..."):
+        result = run_comparison(MODELS)
+
+    if result:
         st.subheader("📊 Comparison Table")
-        
+
         metrics = ["Total Claims", "Supported", "Weakly Supported", "Unsupported", "Hallucination", "Decision"]
-        
-        data = {
-            "Metric": metrics,
-            "Claude 3 Haiku": [
-                res_a["score"].get("total_claims", 0),
-                res_a["score"].get("supported", 0),
-                res_a["score"].get("weakly_supported", 0),
-                res_a["score"].get("unsupported", 0),
-                res_a["score"].get("risk", 0.0),
-                res_a["score"].get("decision", "unknown").upper()
-            ],
-            "Claude 4.5 Haiku": [
-                res_b["score"].get("total_claims", 0),
-                res_b["score"].get("supported", 0),
-                res_b["score"].get("weakly_supported", 0),
-                res_b["score"].get("unsupported", 0),
-                res_b["score"].get("risk", 0.0),
-                res_b["score"].get("decision", "unknown").upper()
+
+        data = {"Metric": metrics}
+        for model in result["models"]:
+            score = model["score"]
+            data[model["name"]] = [
+                score.get("total_claims", 0),
+                score.get("supported", 0),
+                score.get("weakly_supported", 0),
+                score.get("unsupported", 0),
+                score.get("risk", 0.0),
+                score.get("decision", "unknown").upper()
             ]
-        }
         df = pd.DataFrame(data)
         # FORCE everything to string to avoid PyArrow being too smart/broken
         df = df.astype(str)
         st.table(df)
-        
+
+        shared = result.get("shared", {})
+        st.caption(
+            f"{result.get('num_prompts', 0)} shared prompts · {shared.get('total_claims', 0)} claims · "
+            f"{shared.get('verifications_saved', 0)} verifications reused across models"
+        )
+
         # Details Columns
-        c1, c2 = st.columns(2)
-        with c1:
-            st.header("☁️ Claude 3 Haiku Details")
-            for v in res_a["details"]["verdicts"]:
-                with st.expander(f"Claim: {v['claim'][:60]}..."):
-                    st.write(f"**Verdict:** {v['label']}")
-                    st.write(f"**Justification:** {v['justification']}")
-                    
-        with c2:
-            st.header("✨ Claude 4.5 Haiku Details")
-            for v in res_b["details"]["verdicts"]:
-                with st.expander(f"Claim: {v['claim'][:60]}..."):
-                    st.write(f"**Verdict:** {v['label']}")
-                    st.write(f"**Justification:** {v['justification']}")
+        columns = st.columns(len(result["models"]))
+        for column, model in zip(columns, result["models"]):
+            with column:
+                st.header(f"🔎 {model['name']} Details")
+                for v in model["details"]["verdicts"]:
+                    with st.expander(f"Claim: {v['claim'][:60]}..."):
+                        st.write(f"**Verdict:** {v['label']}")
+                        st.write(f"**Justification:** {v['justification']}")
     else:
         st.error("Could not complete comparison.")
 
@@ -0,0 +1,246 @@
+import hashlib
+import random
+import re
+import threading
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seed so signatures (and therefore clusters) are reproducible across runs
+_rng = random.Random(1804)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(256)
+]
+
+
+def _normalize(text: str) -> str:
+    """
+    Lowercase, drop punctuation and collapse whitespace.
+    """
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _tokens(normalized: str) -> set[str]:
+    words = normalized.split()
+    # Unigrams plus bigrams so word order matters a little
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _numbers(normalized: str) -> set[str]:
+    return {w for w in normalized.split() if any(ch.isdigit() for ch in w)}
+
+
+def _minhash(tokens: set[str], num_perm: int) -> list[int]:
+    """
+    MinHash signature: each token is hashed once, then permuted with
+    num_perm universal hash functions (a*x + b mod p); the signature keeps
+    the minimum per function.
+    """
+    hashes = [
+        int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+        for t in tokens
+    ]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS[:num_perm]
+    ]
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def cluster_claims(claims: list[dict], threshold: float = 0.85, num_perm: int = 64,
+                   bands: int = 16) -> list[list[int]]:
+    """
+    Group claim positions into clusters of exact and near-duplicates.
+    Exact duplicates share a normalized text; near-duplicates are found with
+    MinHash LSH (bands x rows = num_perm) and confirmed by token Jaccard
+    similarity >= threshold. Claims that mention different numbers are never
+    merged. Clusters are ordered by their first member.
+    """
+    parent = list(range(len(claims)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    normalized = [_normalize(c.get("text", "")) for c in claims]
+
+    # 1. Exact duplicates after normalization
+    first_by_text = {}
+    for i, norm in enumerate(normalized):
+        if norm in first_by_text:
+            union(first_by_text[norm], i)
+        else:
+            first_by_text[norm] = i
+
+    # 2. Near duplicates among the distinct texts
+    if threshold < 1.0:
+        num_perm = min(num_perm, len(_PERMUTATIONS))
+        bands = max(1, min(bands, num_perm))
+        rows = num_perm // bands
+        distinct = list(first_by_text.values())
+        tokens = {i: _tokens(normalized[i]) for i in distinct}
+        buckets = {}
+        for i in distinct:
+            if not tokens[i]:
+                continue
+            signature = _minhash(tokens[i], rows * bands)
+            for band in range(bands):
+                key = (band, tuple(signature[band * rows:(band + 1) * rows]))
+                buckets.setdefault(key, []).append(i)
+
+        checked = set()
+        for members in buckets.values():
+            for a_pos, a in enumerate(members):
+                for b in members[a_pos + 1:]:
+                    if (a, b) in checked:
+                        continue
+                    checked.add((a, b))
+                    if _numbers(normalized[a]) != _numbers(normalized[b]):
+                        continue
+                    if _jaccard(tokens[a], tokens[b]) >= threshold:
+                        union(a, b)
+
+    clusters = {}
+    for i in range(len(claims)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda members: members[0])
+
+
+class OnlineDeduper:
+    """
+    Incremental counterpart of cluster_claims for streaming execution:
+    each claim is matched against the representatives seen so far (exact
+    normalized text first, then MinHash LSH + Jaccard) as it arrives.
+    Safe to share between threads.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.num_perm = min(num_perm, len(_PERMUTATIONS))
+        self.bands = max(1, min(bands, self.num_perm))
+        self.rows = self.num_perm // self.bands
+        self._lock = threading.Lock()
+        self._by_text: dict[str, int] = {}
+        self._buckets: dict[tuple, list[int]] = {}
+        self._reps: list[tuple[str, set[str]]] = []
+
+    def add(self, text: str) -> tuple[int, bool]:
+        """
+        Register a claim text. Returns (representative number, is_new);
+        is_new is True when the claim starts a new cluster.
+        """
+        normalized = _normalize(text)
+        with self._lock:
+            if not self.enabled:
+                self._reps.append((normalized, set()))
+                return len(self._reps) - 1, True
+            if normalized in self._by_text:
+                return self._by_text[normalized], False
+
+            tokens = _tokens(normalized)
+            keys = []
+            if self.threshold < 1.0 and tokens:
+                signature = _minhash(tokens, self.rows * self.bands)
+                keys = [
+                    (band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+                    for band in range(self.bands)
+                ]
+                candidates = sorted({rep for key in keys for rep in self._buckets.get(key, [])})
+                for rep in candidates:
+                    rep_normalized, rep_tokens = self._reps[rep]
+                    if _numbers(rep_normalized) == _numbers(normalized) \
+                            and _jaccard(rep_tokens, tokens) >= self.threshold:
+                        self._by_text[normalized] = rep
+                        return rep, False
+
+            rep = len(self._reps)
+            self._reps.append((normalized, tokens))
+            self._by_text[normalized] = rep
+            for key in keys:
+                self._buckets.setdefault(key, []).append(rep)
+            return rep, True
+
+
+def online_deduper(config: dict) -> OnlineDeduper:
+    """
+    OnlineDeduper configured from the config's dedup section.
+    """
+    dedup_config = config.get("dedup", {})
+    return OnlineDeduper(
+        threshold=float(dedup_config.get("threshold", 0.85)),
+        num_perm=int(dedup_config.get("num_perm", 64)),
+        bands=int(dedup_config.get("bands", 16)),
+        enabled=dedup_config.get("enabled", True),
+    )
+
+
+def dedupe_claims(state: dict) -> None:
+    """
+    Collapse exact and near-duplicate claims before retrieval and verification.
+    Only one representative per cluster (its first occurrence) stays in
+    state["claims"]; the full list is kept in state["all_claims"] and the
+    clusters (lists of positions in it) in state["claim_clusters"] for
+    fan_out_verdicts.
+    Controlled by the config's dedup section (enabled, threshold, num_perm, bands).
+    """
+    claims = state.get("claims", [])
+    dedup_config = state.get("config", {}).get("dedup", {})
+    if not dedup_config.get("enabled", True) or len(claims) < 2:
+        return
+
+    clusters = cluster_claims(
+        claims,
+        threshold=float(dedup_config.get("threshold", 0.85)),
+        num_perm=int(dedup_config.get("num_perm", 64)),
+        bands=int(dedup_config.get("bands", 16)),
+    )
+
+    state["all_claims"] = claims
+    state["claims"] = [claims[members[0]] for members in clusters]
+    state["claim_clusters"] = clusters
+    print(f"Deduplicated {len(claims)} claims into {len(clusters)} unique claims.")
+
+
+def fan_out_verdicts(state: dict) -> None:
+    """
+    Copy each representative's verdict to every member of its cluster and
+    restore the full claim list, so score_risk counts every extracted claim.
+    Copies for members other than the representative carry "duplicate_of"
+    (the representative's text): they are not independent verifications.
+    No-op if dedupe_claims did not run.
+    """
+    if "all_claims" not in state:
+        return
+
+    all_claims = state.pop("all_claims")
+    clusters = state.pop("claim_clusters", [])
+    verdict_by_text = {v.get("claim"): v for v in state.get("verdicts", [])}
+
+    member_verdicts = []
+    for members in clusters:
+        representative = verdict_by_text.get(all_claims[members[0]].get("text", ""))
+        if representative is None:
+            continue
+        for position in members:
+            verdict = dict(representative)
+            verdict["claim"] = all_claims[position].get("text", "")
+            if position != members[0]:
+                verdict["duplicate_of"] = representative.get("claim", "")
+            member_verdicts.append((position, verdict))
+
+    state["claims"] = all_claims
+    state["verdicts"] = [v for _, v in sorted(member_verdicts, key=lambda pv: pv[0])]
+    print(f"Fanned out verdicts to {len(state['verdicts'])} claims.")
@@ -1,76 +1,185 @@
 from src.wrappers.bedrock import call_llm
+from src.agents.llm_json import strip_code_fences
 import json
 import uuid
 
-def extract_claims(state: dict) -> None:
-    """
-    Extract factual claims from model responses.
-    Updates state["claims"].
-    """
-    responses = state.get("responses", [])
-    claims = []
-    
-    extraction_prompt_template = """
+EXTRACTION_PROMPT_TEMPLATE = """
     Identify the main factual claims in the following text.
     Return ONLY a JSON list of strings, where each string is a claim.
     If the text is empty, irrelevant, or contains no factual claims, return an empty list [].
     Do not include explanations, intro, or markdown.
-    
+
     Text: {text}
-    
+
     Output JSON: []
     """
-    
-    for item in responses:
-        response_text = item.get("response", "")
-        prompt = item.get("prompt", "")
-        
-        if response_text.startswith("ERROR:"):
-            continue
-            
-        extraction_prompt = extraction_prompt_template.format(text=response_text)
-        
-        try:
-            claims_json_str = call_llm(extraction_prompt)
-            # Clean up potential markdown code blocks
-            claims_json_str = claims_json_str.strip()
-            claims_llm_response = call_llm(extraction_prompt)
-            
-            # Robust JSON extraction
-            content_to_parse = claims_llm_response.strip()
-            if "```json" in content_to_parse:
-                content_to_parse = content_to_parse.split("```json")[1].split("```")[0].strip()
-            elif "```" in content_to_parse:
-                 content_to_parse = content_to_parse.split("```")[1].split("```")[0].strip()
-            
+
+BATCH_EXTRACTION_PROMPT_TEMPLATE = """
+    Identify the main factual claims in EACH of the following texts. Every text is labelled with an ID.
+    Return ONLY a JSON object that maps every ID (as a string) to a JSON list of strings, where each string is a claim from that text.
+    If a text is empty, irrelevant, or contains no factual claims, map its ID to an empty list [].
+    Do not include explanations, intro, or markdown.
+
+    {texts}
+
+    Output JSON: {{"0": ["claim", ...], "1": []}}
+    """
+
+# Rough characters-per-token ratio used to budget batches without a tokenizer.
+CHARS_PER_TOKEN = 4
+# Output tokens reserved per response in a batched request, capped by the model limit.
+OUTPUT_TOKENS_PER_RESPONSE = 600
+MAX_OUTPUT_TOKENS = 4096
+
+
+def _claims_from_data(extracted_data) -> list:
+    """
+    Normalize the parsed LLM output to a list of claims.
+    Accepts either a list of strings or a dict with a "claims" key.
+    """
+    if isinstance(extracted_data, list):
+        return extracted_data
+    if isinstance(extracted_data, dict) and "claims" in extracted_data:
+        return extracted_data["claims"]
+    print(f"Warning: Extracted data not a list or dict with 'claims' key: {extracted_data}")
+    return []
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _make_batches(items: list, batch_size: int, max_batch_tokens: int) -> list[list]:
+    """
+    Group response items into batches of at most batch_size items whose
+    combined text stays under max_batch_tokens. An item that alone exceeds the
+    budget gets a batch of its own.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        tokens = _estimate_tokens(item.get("response", ""))
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_batch_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _extract_single(response_text: str) -> list:
+    """
+    Extract claims from one response with a dedicated verifier call.
+    """
+    extraction_prompt = EXTRACTION_PROMPT_TEMPLATE.format(text=response_text)
+    content_to_parse = strip_code_fences(call_llm(extraction_prompt))
+    try:
+        return _claims_from_data(json.loads(content_to_parse))
+    except json.JSONDecodeError:
+        print(f"Failed to parse JSON for claims: {content_to_parse[:100]}...")
+        return []
+
+
+def _extract_batch(batch: list) -> dict:
+    """
+    Extract claims from several responses with one verifier call.
+    Returns {position in batch: claims} for every response the verifier
+    answered; positions missing from the result need a per-response retry.
+    """
+    texts = "\n\n".join(
+        f"[ID {i}]\n{item.get('response', '')}" for i, item in enumerate(batch)
+    )
+    prompt = BATCH_EXTRACTION_PROMPT_TEMPLATE.format(texts=texts)
+    max_tokens = min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_RESPONSE * len(batch))
+    content_to_parse = strip_code_fences(call_llm(prompt, max_tokens=max_tokens))
+    try:
+        data = json.loads(content_to_parse)
+    except json.JSONDecodeError:
+        print(f"Failed to parse batched JSON for claims, falling back to per-response: {content_to_parse[:100]}...")
+        return {}
+    if not isinstance(data, dict):
+        print("Warning: Batched extraction did not return a JSON object, falling back to per-response.")
+        return {}
+
+    results = {}
+    for i in range(len(batch)):
+        value = data.get(str(i))
+        if isinstance(value, list):
+            results[i] = value
+    return results
+
+
+def extract_claims(state: dict) -> None:
+    """
+    Extract factual claims from model responses.
+    With evaluation.extraction_batch_size > 1, several responses are packed
+    into a single verifier request (bounded by evaluation.extraction_batch_tokens);
+    responses the batched reply does not cover are retried one by one.
+    Updates state["claims"].
+    """
+    responses = state.get("responses", [])
+    eval_config = state.get("config", {}).get("evaluation", {})
+    batch_size = max(1, int(eval_config.get("extraction_batch_size", 1)))
+    max_batch_tokens = int(eval_config.get("extraction_batch_tokens", 6000))
+
+    items = [r for r in responses if not r.get("response", "").startswith("ERROR:")]
+    claims = []
+
+    for batch in _make_batches(items, batch_size, max_batch_tokens):
+        batch_claims = {}
+        if len(batch) > 1:
             try:
-                extracted_data = json.loads(content_to_parse)
-                # Assuming the LLM is instructed to return a list of strings directly,
-                # or a dictionary with a "claims" key containing a list.
-                # Adjusting based on the original code's expectation of a list.
-                if isinstance(extracted_data, list):
-                    item_claims = extracted_data
-                elif isinstance(extracted_data, dict) and "claims" in extracted_data:
-                    item_claims = extracted_data["claims"]
+                batch_claims = _extract_batch(batch)
+            except Exception as e:
+                print(f"Error extracting claims from batch of {len(batch)} responses: {e}")
+
+        for i, item in enumerate(batch):
+            response_text = item.get("response", "")
+            prompt = item.get("prompt", "")
+
+            if i in batch_claims:
+                item_claims = batch_claims[i]
+            else:
+                try:
+                    item_claims = _extract_single(response_text)
+                except Exception as e:
+                    print(f"Error extracting claims from response: {e}")
+                    continue
+
+            for c in item_claims:
+                if isinstance(c, str):  # Ensure the claim itself is a string
+                    claims.append({
+                        "id": str(uuid.uuid4()),
+                        "text": c,
+                        "source_prompt": prompt,
+                        "source_response": response_text
+                    })
                 else:
-                    item_claims = []
-                    print(f"Warning: Extracted data not a list or dict with 'claims' key: {extracted_data}")
-
-                for c in item_claims:
-                    if isinstance(c, str): # Ensure the claim itself is a string
-                        claims.append({
-                            "id": str(uuid.uuid4()),
-                            "text": c, # Changed 'claim' to 'text' to match original structure
-                            "source_prompt": prompt, # Changed 'r["prompt"]' to 'prompt'
-                            "source_response": response_text # Changed 'r["response"]' to 'response_text'
-                        })
-                    else:
-                        print(f"Warning: Claim item is not a string: {c}")
-            except json.JSONDecodeError:
-                print(f"Failed to parse JSON for claims: {content_to_parse[:100]}...")
-
-        except Exception as e:
-            print(f"Error extracting claims from response: {e}")
-            
+                    print(f"Warning: Claim item is not a string: {c}")
+
     state["claims"] = claims
     print(f"Extracted {len(claims)} claims.")
+
+
+def split_claims_by_response(responses: list, claims: list) -> list[list]:
+    """
+    Group claims (as produced by extract_claims, in response order) under
+    the response they came from. A forward scan matching source
+    prompt/response is enough even when responses repeat.
+    """
+    per_response = [[] for _ in responses]
+    position = 0
+    for claim in claims:
+        while position < len(responses) and (
+            responses[position].get("prompt", "") != claim.get("source_prompt")
+            or responses[position].get("response", "") != claim.get("source_response")
+        ):
+            position += 1
+        if position == len(responses):
+            break
+        per_response[position].append(claim)
+    return per_response
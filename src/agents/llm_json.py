@@ -0,0 +1,10 @@
+def strip_code_fences(text: str) -> str:
+    """
+    Pull the JSON payload out of an LLM reply that may be wrapped in markdown.
+    """
+    content = text.strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+    return content
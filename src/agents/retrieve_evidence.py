@@ -1,48 +1,64 @@
-from src.wrappers.elasticsearch_helper import search_docs, vector_search
+from src.wrappers.elasticsearch_helper import multi_search_docs
+from src.wrappers.bedrock import embed_many
+
+RETRIEVAL_MODES = ("bm25", "hybrid")
+
 
 def retrieve_evidence(state: dict) -> None:
     """
     Retrieve evidence for extracted claims using Elasticsearch.
+    retrieval.mode selects plain BM25 ("bm25") or BM25 + kNN fused with
+    reciprocal rank fusion ("hybrid", tuned by retrieval.k,
+    retrieval.num_candidates and retrieval.rrf_k). All claims are searched
+    through batched _msearch requests of retrieval.msearch_batch_size, and
+    claim embeddings for hybrid mode are computed up front with embed_many.
     Updates state["evidence"].
     """
     claims = state.get("claims", [])
     config = state.get("config", {})
     es_config = config.get("elasticsearch", {})
     index_name = es_config.get("index", "trusted_docs")
-    
-    evidence_list = []
-    
-    for claim_obj in claims:
-        claim_text = claim_obj.get("text", "")
-        if not claim_text:
-            continue
-            
-        # Try retrieving evidence using text match or vector search
-        # Using vector search for semantic similarity if possible
+
+    retrieval_config = config.get("retrieval", {})
+    mode = retrieval_config.get("mode", "bm25")
+    if mode not in RETRIEVAL_MODES:
+        print(f"Unknown retrieval mode '{mode}', using bm25.")
+        mode = "bm25"
+    k = int(retrieval_config.get("k", 10))
+    num_candidates = int(retrieval_config.get("num_candidates", 100))
+    rrf_k = int(retrieval_config.get("rrf_k", 60))
+    top_n = int(retrieval_config.get("top_n", 3))
+    batch_size = int(retrieval_config.get("msearch_batch_size", 50))
+
+    claims = [c for c in claims if c.get("text", "")]
+    # Identical claim texts are searched once
+    texts = list(dict.fromkeys(c["text"] for c in claims))
+
+    vectors = None
+    if mode == "hybrid" and texts:
         try:
-            # We default to vector search for better semantic matching
-            # But might fallback to text search if vector search fails or isn't set up
-            # For simplicity, let's try text search first as it is safer without embeddings set up
-            # However, prompt-driven retrieval usually benefits from vector search.
-            # Let's try text search first as it is simpler.
-            docs = search_docs(claim_text, index=index_name)
-            
-            # If search_docs returns nothing, maybe try keywords?
-            # Or assume search_docs uses an analyzer that handles some varying terms.
-            
-            # We collect top docs
-            evidence_list.append({
-                "claim": claim_obj,
-                "documents": docs[:3] # Top 3 docs
-            })
-            
+            vectors = embed_many(texts, config=config)
         except Exception as e:
-            print(f"Error retrieving evidence for claim '{claim_text[:20]}...': {e}")
-            # Try appending with empty docs to avoid breaking chain
-            evidence_list.append({
-                "claim": claim_obj,
-                "documents": []
-            })
-            
+            print(f"Claim embedding failed, falling back to BM25 only: {e}")
+
+    try:
+        results = multi_search_docs(
+            texts, index=index_name, mode=mode, k=k, num_candidates=num_candidates,
+            rrf_k=rrf_k, vectors=vectors, batch_size=batch_size, config=config,
+        )
+        docs_by_text = dict(zip(texts, results))
+    except Exception as e:
+        print(f"Error retrieving evidence for {len(texts)} claims: {e}")
+        # Continue with empty docs to avoid breaking chain
+        docs_by_text = {}
+
+    evidence_list = [
+        {
+            "claim": claim_obj,
+            "documents": docs_by_text.get(claim_obj["text"], [])[:top_n]  # Top docs
+        }
+        for claim_obj in claims
+    ]
+
     state["evidence"] = evidence_list
     print(f"Retrieved evidence for {len(evidence_list)} claims.")
@@ -1,40 +1,77 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from src.wrappers.bedrock import call_llm
-from src.wrappers.ollama import call_ollama
+from src.wrappers.ollama import call_ollama, ollama_settings
+from src.budget import in_context, llm_role
 
+# Default number of in-flight prompts per provider. A local Ollama usually
+# serves one generation at a time; Bedrock can take several in parallel.
+DEFAULT_CONCURRENCY = {
+    "ollama": 1,
+    "bedrock": 4,
+}
 
-def run_model(state: dict) -> None:
+
+def run_prompt(prompt: str, provider: str, model_id: str, ollama_base: str,
+               ollama: dict | None = None) -> dict:
     """
-    Run the LLM *under test* on generated prompts.
-    Supports: ollama | bedrock (Claude as model-under-test).
-    Updates state["responses"].
+    Run a single prompt against the target model. ollama is the run's
+    ollama_settings(config); without it the default config's are used.
+    Errors are recorded as an "ERROR:" response instead of raised.
+    """
+    try:
+        with llm_role("target"):
+            if provider == "ollama":
+                text = call_ollama(prompt, model_id=model_id, base_url=ollama_base, settings=ollama)
+            elif provider == "bedrock":
+                # Claude as model-under-test — still verified independently
+                text = call_llm(prompt, model_id_override=model_id)
+            else:
+                text = f"ERROR: Unknown provider '{provider}'"
+    except Exception as e:
+        print(f"Error on prompt '{prompt[:30]}…': {e}")
+        text = f"ERROR: {e}"
+    return {"prompt": prompt, "response": text}
+
+
+def target_settings(config: dict) -> tuple[str, str, int, str]:
+    """
+    Resolve (provider, model_id, concurrency, ollama_base_url) for the target model.
     """
-    config = state.get("config", {})
     target = config.get("target_model", {})
     provider = target.get("provider", "ollama")
     model_id = target.get("model_id", "llama3.2")
+    concurrency = max(1, int(target.get("concurrency", DEFAULT_CONCURRENCY.get(provider, 1))))
 
     # Allow env override for CI (e.g. remote Ollama URL)
     ollama_base = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+    return provider, model_id, concurrency, ollama_base
+
+
+def run_model(state: dict) -> None:
+    """
+    Run the LLM *under test* on generated prompts.
+    Supports: ollama | bedrock (Claude as model-under-test).
+    Prompts run concurrently, bounded by target_model.concurrency
+    (defaults per provider); responses keep prompt order.
+    Updates state["responses"].
+    """
+    config = state.get("config", {})
+    provider, model_id, concurrency, ollama_base = target_settings(config)
+    ollama = ollama_settings(config)
 
     prompts = state.get("prompts", [])
-    responses = []
 
-    print(f"Running target model ({provider}/{model_id})...")
+    print(f"Running target model ({provider}/{model_id}) with concurrency {concurrency}...")
 
-    for prompt in prompts:
-        try:
-            if provider == "ollama":
-                text = call_ollama(prompt, model_id=model_id, base_url=ollama_base)
-            elif provider == "bedrock":
-                # Claude as model-under-test — still verified independently
-                text = call_llm(prompt, model_id_override=model_id)
-            else:
-                text = f"ERROR: Unknown provider '{provider}'"
-            responses.append({"prompt": prompt, "response": text})
-        except Exception as e:
-            print(f"Error on prompt '{prompt[:30]}…': {e}")
-            responses.append({"prompt": prompt, "response": f"ERROR: {e}"})
+    if concurrency == 1 or len(prompts) <= 1:
+        responses = [run_prompt(p, provider, model_id, ollama_base, ollama) for p in prompts]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(prompts))) as pool:
+            # map() yields results in submission order
+            responses = list(pool.map(
+                in_context(lambda p: run_prompt(p, provider, model_id, ollama_base, ollama)), prompts
+            ))
 
     state["responses"] = responses
     print(f"Collected {len(responses)} responses.")
@@ -1,6 +1,40 @@
+from statistics import NormalDist
+
+
+def reliability_interval(successes: float, total: int, confidence: float = 0.95) -> tuple[float, float]:
+    """
+    Wilson score interval for the reliability proportion. successes may be
+    fractional (weakly supported claims count as half).
+    """
+    if total <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * ((p * (1 - p) / total + z * z / (4 * total * total)) ** 0.5) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def decision_settled(score: dict, thresholds: dict) -> bool:
+    """
+    True when the whole reliability interval falls on one side of each
+    threshold, so more samples could not change the decision.
+    """
+    low, high = score.get("interval", (0.0, 1.0))
+    deploy = thresholds.get("deploy", 0.8)
+    warn = thresholds.get("warn", 0.5)
+    return low >= deploy or high < warn or (low >= warn and high < deploy)
+
+
 def score_risk(state: dict) -> None:
     """
     Calculate risk score based on verdicts and configuration thresholds.
+    The score includes a Wilson interval on reliability at
+    evaluation.confidence (default 0.95) and the number of samples it is
+    based on. Counts and reliability cover every claim, but the interval
+    only counts distinct verifications: verdicts copied onto near-duplicate
+    claims ("duplicate_of") would make it look narrower than the evidence.
     Updates state["score"].
     """
     verdicts = state.get("verdicts", [])
@@ -12,7 +46,9 @@ def score_risk(state: dict) -> None:
             "total_claims": 0,
             "supported": 0,
             "weakly_supported": 0,
-            "unsupported": 0
+            "unsupported": 0,
+            "interval": [0.0, 1.0],
+            "samples": 0,
         }
         return
 
@@ -53,6 +89,11 @@ def score_risk(state: dict) -> None:
     elif omniscience_score >= thresholds.get("warn", 0.5):
         decision = "warn"
         
+    confidence = float(config.get("evaluation", {}).get("confidence", 0.95))
+    distinct = [v.get("label") for v in verdicts if "duplicate_of" not in v]
+    successes = distinct.count("supported") + 0.5 * distinct.count("weakly_supported")
+    low, high = reliability_interval(successes, len(distinct), confidence)
+
     state["score"] = {
         "risk": hallucination_score, # Mapped to 'Hallucination' in dashboard
         "decision": decision,
@@ -60,7 +101,10 @@ def score_risk(state: dict) -> None:
         "supported": supported,
         "weakly_supported": weakly_supported,
         "unsupported": unsupported,
-        "reliability": omniscience_score 
+        "reliability": omniscience_score,
+        "interval": [low, high],
+        "confidence": confidence,
+        "samples": len(distinct),
     }
     
     print(f"Scored Hallucination: {hallucination_score:.2f} | Reliability: {omniscience_score:.2f} | Decision: {decision}")
@@ -1,80 +1,215 @@
 from src.wrappers.bedrock import call_llm
+from src.agents.llm_json import strip_code_fences
+import hashlib
 import json
 
-def verify_claims(state: dict) -> None:
-    """
-    Verify claims against retrieved evidence.
-    Updates state["verdicts"].
-    """
-    evidence_list = state.get("evidence", [])
-    verdicts = []
-    
-    verification_prompt_template = """
+VERIFICATION_PROMPT_TEMPLATE = """
     CRITICAL: You must return ONLY valid JSON. No conversational text, no explanations, no headers.
-    
+
     Instruction: Verify the following CLAIM against the provided EVIDENCE.
-    Labels: 
+    Labels:
     - "supported": Evidence directly proves the claim.
     - "weakly_supported": Evidence suggests it but isn't conclusive.
     - "unsupported": Evidence contradicts or doesn't mention the claim.
-    
+
     EVIDENCE: {evidence_text}
     CLAIM: {claim}
-    
+
     Output Format (JSON only): {{"label": "supported|weakly_supported|unsupported", "justification": "short explanation"}}
     """
-    
+
+BATCH_VERIFICATION_PROMPT_TEMPLATE = """
+    CRITICAL: You must return ONLY valid JSON. No conversational text, no explanations, no headers.
+
+    Instruction: Verify EACH of the following CLAIMS against the EVIDENCE documents it references.
+    Judge every claim independently and only against its own referenced documents.
+    Labels:
+    - "supported": Evidence directly proves the claim.
+    - "weakly_supported": Evidence suggests it but isn't conclusive.
+    - "unsupported": Evidence contradicts or doesn't mention the claim.
+
+    EVIDENCE:
+    {documents}
+
+    CLAIMS:
+    {claims}
+
+    Output Format (JSON array only, one entry per claim): [{{"claim_id": "<id>", "label": "supported|weakly_supported|unsupported", "justification": "short explanation"}}]
+    """
+
+NO_EVIDENCE = "No relevant evidence found."
+# Evidence characters sent per claim (single mode) or per document (batch mode).
+MAX_EVIDENCE_CHARS = 2000
+# Output tokens reserved per claim in a batched request, capped by the model limit.
+OUTPUT_TOKENS_PER_CLAIM = 250
+MAX_OUTPUT_TOKENS = 4096
+
+
+def _doc_key(doc: dict) -> str:
+    """
+    Identify an evidence document by its source and content.
+    """
+    raw = f"{doc.get('source', '')}\x00{doc.get('content', '')}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _verify_single(claim_text: str, documents: list) -> dict:
+    """
+    Verify one claim with a dedicated verifier call.
+    """
+    evidence_content = "\n\n".join([doc.get("content", "") for doc in documents])
+    if not evidence_content:
+        evidence_content = NO_EVIDENCE
+
+    prompt = VERIFICATION_PROMPT_TEMPLATE.format(
+        claim=claim_text, evidence_text=evidence_content[:MAX_EVIDENCE_CHARS]
+    )
+
+    try:
+        content = strip_code_fences(call_llm(prompt))
+        try:
+            data = json.loads(content)
+            return {
+                "claim": claim_text,
+                "label": data.get("label", "unsupported").lower(),
+                "justification": data.get("justification", "No justification provided.")
+            }
+        except json.JSONDecodeError:
+            print(f"Failed to parse JSON for verification: {content[:100]}...")
+            return {
+                "claim": claim_text,
+                "label": "unsupported",
+                "justification": f"Parse error on verifier response: {content[:50]}"
+            }
+
+    except Exception as e:
+        print(f"Error verifying claim '{claim_text[:20]}...': {e}")
+        return {
+            "claim": claim_text,
+            "label": "unsupported",
+            "justification": f"Error during verification: {e}"
+        }
+
+
+def _make_batches(items: list, batch_size: int, max_batch_chars: int) -> list[list]:
+    """
+    Group (position, claim_text, documents) items into verification batches.
+    Items are ordered by their evidence set so claims that share documents land
+    in the same batch; a batch is closed when it reaches batch_size claims or
+    its distinct evidence would exceed max_batch_chars.
+    """
+    ordered = sorted(items, key=lambda it: sorted(_doc_key(d) for d in it[2]))
+    batches = []
+    current = []
+    current_docs = set()
+    current_chars = 0
+    for item in ordered:
+        new_docs = {_doc_key(d): d for d in item[2] if _doc_key(d) not in current_docs}
+        new_chars = sum(len(d.get("content", "")[:MAX_EVIDENCE_CHARS]) for d in new_docs.values())
+        if current and (len(current) >= batch_size or current_chars + new_chars > max_batch_chars):
+            batches.append(current)
+            current = []
+            current_docs = set()
+            new_docs = {_doc_key(d): d for d in item[2]}
+            new_chars = sum(len(d.get("content", "")[:MAX_EVIDENCE_CHARS]) for d in new_docs.values())
+        current.append(item)
+        current_docs.update(new_docs)
+        current_chars += new_chars
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _verify_batch(batch: list) -> dict:
+    """
+    Verify several claims with one verifier call; each distinct evidence
+    document is sent once and referenced by ID from the claims that use it.
+    Returns {position: verdict} for every claim the verifier answered.
+    """
+    doc_ids = {}
+    doc_blocks = []
+    claim_lines = []
+    for n, (_, claim_text, documents) in enumerate(batch):
+        refs = []
+        for doc in documents:
+            key = _doc_key(doc)
+            if key not in doc_ids:
+                doc_ids[key] = f"D{len(doc_ids)}"
+                doc_blocks.append(f"[{doc_ids[key]}]\n{doc.get('content', '')[:MAX_EVIDENCE_CHARS]}")
+            if doc_ids[key] not in refs:
+                refs.append(doc_ids[key])
+        ref_text = ", ".join(refs) if refs else f"none ({NO_EVIDENCE})"
+        claim_lines.append(f"- claim_id: \"{n}\" | evidence: {ref_text} | claim: {claim_text}")
+
+    prompt = BATCH_VERIFICATION_PROMPT_TEMPLATE.format(
+        documents="\n\n".join(doc_blocks) if doc_blocks else NO_EVIDENCE,
+        claims="\n".join(claim_lines),
+    )
+    max_tokens = min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_CLAIM * len(batch))
+    content = strip_code_fences(call_llm(prompt, max_tokens=max_tokens))
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        print(f"Failed to parse batched JSON for verification, retrying claims individually: {content[:100]}...")
+        return {}
+    if not isinstance(data, list):
+        print("Warning: Batched verification did not return a JSON array, retrying claims individually.")
+        return {}
+
+    results = {}
+    for entry in data:
+        if not isinstance(entry, dict) or not isinstance(entry.get("label"), str):
+            continue
+        try:
+            n = int(str(entry.get("claim_id")).strip())
+        except ValueError:
+            continue
+        if 0 <= n < len(batch):
+            position, claim_text, _ = batch[n]
+            results[position] = {
+                "claim": claim_text,
+                "label": entry["label"].lower(),
+                "justification": entry.get("justification", "No justification provided.")
+            }
+    return results
+
+
+def verify_claims(state: dict) -> None:
+    """
+    Verify claims against retrieved evidence.
+    With evaluation.verification_batch_size > 1, claims are judged several per
+    verifier request (claims sharing evidence are grouped so each document is
+    sent once); claims missing from a batched reply are retried on their own.
+    Updates state["verdicts"].
+    """
+    evidence_list = state.get("evidence", [])
+    eval_config = state.get("config", {}).get("evaluation", {})
+    batch_size = max(1, int(eval_config.get("verification_batch_size", 1)))
+    max_batch_chars = int(eval_config.get("verification_batch_evidence_chars", 8000))
+
+    items = []
     for item in evidence_list:
-        claim_obj = item.get("claim", {})
-        claim_text = claim_obj.get("text", "")
-        documents = item.get("documents", [])
-        
+        claim_text = item.get("claim", {}).get("text", "")
         if not claim_text:
             continue
-            
-        evidence_content = "\n\n".join([doc.get("content", "") for doc in documents])
-        if not evidence_content:
-            evidence_content = "No relevant evidence found."
-            
-        prompt = verification_prompt_template.format(claim=claim_text, evidence_text=evidence_content[:2000]) # Truncate context if needed
-        
-        try:
-            response_json = call_llm(prompt)
-            # Clean up response
-            response_json = response_json.strip()
-            if response_json.startswith("```json"):
-                response_json = response_json[7:]
-            if response_json.startswith("```"):
-                response_json = response_json[3:]
-            # Robust JSON extraction
-            content = response_json.strip()
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                 content = content.split("```")[1].split("```")[0].strip()
-            
+        items.append((len(items), claim_text, item.get("documents", [])))
+
+    results = {}
+    if batch_size > 1:
+        for batch in _make_batches(items, batch_size, max_batch_chars):
+            if len(batch) == 1:
+                continue
             try:
-                data = json.loads(content)
-                verdicts.append({
-                    "claim": claim_text,
-                    "label": data.get("label", "unsupported").lower(),
-                    "justification": data.get("justification", "No justification provided.")
-                })
-            except json.JSONDecodeError:
-                print(f"Failed to parse JSON for verification: {content[:100]}...")
-                verdicts.append({
-                    "claim": claim_text,
-                    "label": "unsupported",
-                    "justification": f"Parse error on verifier response: {content[:50]}"
-                })
-            
-        except Exception as e:
-            print(f"Error verifying claim '{claim_text[:20]}...': {e}")
-            verdicts.append({
-                "claim": claim_text,
-                "label": "unsupported", 
-                "justification": f"Error during verification: {e}"
-            })
-            
+                results.update(_verify_batch(batch))
+            except Exception as e:
+                print(f"Error verifying batch of {len(batch)} claims: {e}")
+
+    verdicts = []
+    for position, claim_text, documents in items:
+        verdict = results.get(position)
+        if verdict is None:
+            verdict = _verify_single(claim_text, documents)
+        verdicts.append(verdict)
+
     state["verdicts"] = verdicts
     print(f"Verified {len(verdicts)} claims.")
@@ -0,0 +1,161 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Budget keys in the config's budget section; 0 or missing = unlimited
+BUDGET_LIMITS = ("max_verifier_tokens", "max_target_tokens", "max_wall_seconds", "max_llm_calls")
+# Verifier tokens assumed per claim before any verification has been measured
+DEFAULT_TOKENS_PER_CLAIM = 1500
+
+_current_budget = contextvars.ContextVar("run_budget", default=None)
+_current_role = contextvars.ContextVar("llm_role", default="verifier")
+
+
+class RunBudget:
+    """
+    Spend limits for one evaluation run: verifier tokens, target-model
+    tokens, LLM calls and wall-clock seconds. LLM wrappers charge the budget
+    of the run they are called from (see charge()); the orchestrator checks
+    exhausted() between chunks of work and sheds load instead of failing.
+    """
+
+    def __init__(self, limits: dict):
+        self.limits = {k: float(limits.get(k) or 0) for k in BUDGET_LIMITS}
+        self.tokens_per_claim = float(limits.get("tokens_per_claim", DEFAULT_TOKENS_PER_CLAIM))
+        self.started = time.monotonic()
+        self.consumed = {"verifier_tokens": 0, "target_tokens": 0, "llm_calls": 0}
+        self.limited_by: list[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RunBudget | None":
+        """
+        Budget from the config's budget section, or None if it sets no limits.
+        """
+        limits = config.get("budget", {})
+        if not any(limits.get(k) for k in BUDGET_LIMITS):
+            return None
+        return cls(limits)
+
+    def charge(self, role: str, tokens: int) -> None:
+        with self._lock:
+            self.consumed["llm_calls"] += 1
+            key = "target_tokens" if role == "target" else "verifier_tokens"
+            self.consumed[key] += int(tokens)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def exhausted(self) -> str | None:
+        """
+        Name of the first limit that has been reached, or None.
+        """
+        with self._lock:
+            usage = {
+                "max_verifier_tokens": self.consumed["verifier_tokens"],
+                "max_target_tokens": self.consumed["target_tokens"],
+                "max_llm_calls": self.consumed["llm_calls"],
+                "max_wall_seconds": self.elapsed(),
+            }
+        for key in BUDGET_LIMITS:
+            if self.limits[key] and usage[key] >= self.limits[key]:
+                return key
+        return None
+
+    def note(self, reason: str) -> None:
+        """
+        Record that the run was cut short or sampled because of reason.
+        """
+        with self._lock:
+            if reason not in self.limited_by:
+                self.limited_by.append(reason)
+                print(f"⚠️ Budget: {reason}")
+
+    def affordable_claims(self, calls_per_claim: float) -> int | None:
+        """
+        How many more claims the remaining verifier-token and call budgets
+        can pay for, or None if neither is limited.
+        """
+        with self._lock:
+            counts = []
+            if self.limits["max_verifier_tokens"]:
+                remaining = self.limits["max_verifier_tokens"] - self.consumed["verifier_tokens"]
+                counts.append(remaining / self.tokens_per_claim)
+            if self.limits["max_llm_calls"]:
+                remaining = self.limits["max_llm_calls"] - self.consumed["llm_calls"]
+                counts.append(remaining / max(calls_per_claim, 1e-9))
+        if not counts:
+            return None
+        return max(0, int(min(counts)))
+
+    def restore(self, report: dict) -> None:
+        """
+        Carry over what an earlier attempt of the same run spent (a report()
+        saved in its checkpoint), so a resumed run doesn't start afresh.
+        """
+        consumed = report.get("consumed", {})
+        with self._lock:
+            for key in self.consumed:
+                self.consumed[key] += int(consumed.get(key, 0))
+            self.started -= float(consumed.get("wall_seconds", 0.0))
+            for reason in report.get("limited_by", []):
+                if reason not in self.limited_by:
+                    self.limited_by.append(reason)
+
+    def report(self) -> dict:
+        with self._lock:
+            consumed = dict(self.consumed)
+        consumed["wall_seconds"] = round(self.elapsed(), 3)
+        return {
+            "limits": {k: v for k, v in self.limits.items() if v},
+            "consumed": consumed,
+            "budget_limited": bool(self.limited_by),
+            "limited_by": list(self.limited_by),
+        }
+
+
+@contextmanager
+def use_budget(budget: RunBudget | None):
+    """
+    Make budget the one charged by LLM calls made inside the with-block.
+    """
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+@contextmanager
+def llm_role(role: str):
+    """
+    Charge LLM calls inside the with-block as "target" or "verifier" usage.
+    """
+    token = _current_role.set(role)
+    try:
+        yield
+    finally:
+        _current_role.reset(token)
+
+
+def charge(tokens: int) -> None:
+    """
+    Charge one LLM call of tokens (input + output) to the current run's
+    budget, if there is one.
+    """
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.charge(_current_role.get(), tokens)
+
+
+def in_context(fn):
+    """
+    Wrap fn so that every call, e.g. on a thread-pool worker, runs in a copy
+    of the caller's context and charges the caller's budget.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
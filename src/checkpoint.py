@@ -0,0 +1,57 @@
+import json
+import os
+import re
+from src.files import atomic_write_json
+
+DEFAULT_CHECKPOINT_PATH = ".cache/checkpoints"
+
+_RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def checkpoint_file(directory: str, run_id: str) -> str:
+    """
+    Path of a run's checkpoint. run_id comes from API callers, so only
+    simple IDs are accepted.
+    """
+    if not _RUN_ID_RE.match(run_id or ""):
+        raise ValueError(f"Invalid run_id '{run_id}'")
+    return os.path.join(directory, f"{run_id}.json")
+
+
+def load_checkpoint(directory: str, run_id: str) -> dict | None:
+    """
+    Return a run's checkpoint, {"run_id", "state", "completed_stages",
+    "partial"}, or None if there is none.
+    """
+    path = checkpoint_file(directory, run_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+
+
+def save_checkpoint(directory: str, run_id: str, state: dict, completed_stages: list,
+                    partial: dict | None = None) -> None:
+    """
+    Persist everything in state except the config, the stages already
+    completed and the progress of the current stage (partial).
+    """
+    path = checkpoint_file(directory, run_id)
+    data = {
+        "version": 1,
+        "run_id": run_id,
+        "state": {k: v for k, v in state.items() if k != "config"},
+        "completed_stages": list(completed_stages),
+        "partial": partial or {},
+    }
+    atomic_write_json(path, data, default=str)
+
+
+def delete_checkpoint(directory: str, run_id: str) -> None:
+    path = checkpoint_file(directory, run_id)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,144 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from src.agents.generate_prompts import generate_prompts
+from src.agents.run_model import run_model
+from src.agents.extract_claims import extract_claims, split_claims_by_response
+from src.agents.dedupe_claims import cluster_claims
+from src.agents.retrieve_evidence import retrieve_evidence
+from src.agents.verify_claims import verify_claims
+from src.agents.score_risk import score_risk
+from src.budget import RunBudget, in_context, use_budget
+from src.wrappers.elasticsearch_helper import index_doc
+from src.orchestrator import es_safe_keys
+
+
+def _target_names(targets: list[dict]) -> list[str]:
+    """
+    Display name per target: its "name", else its model_id, made unique.
+    """
+    names = []
+    for i, target in enumerate(targets):
+        name = target.get("name") or target.get("model_id") or f"target_{i + 1}"
+        if name in names:
+            name = f"{name} ({i + 1})"
+        names.append(name)
+    return names
+
+
+def run_comparison(config: dict, targets: list[dict]) -> dict:
+    """
+    Evaluate several target models on one shared prompt set.
+    Prompts are generated once; every target answers them concurrently
+    (compare.max_parallel_targets, default all) and has its claims
+    extracted. Claims from all targets are then clustered together (exact
+    duplicates always, near-duplicates when dedup is enabled) so evidence is
+    retrieved and verified once per cluster, and each target is scored on
+    its own claims. Returns an aligned per-prompt comparison.
+    """
+    if not targets:
+        raise ValueError("At least one target model is required.")
+
+    comparison_id = str(uuid.uuid4())
+    names = _target_names(targets)
+    budget = RunBudget.from_config(config)
+
+    with use_budget(budget):
+        # 1. One prompt set for everyone
+        base = {"config": config, "run_id": comparison_id}
+        generate_prompts(base)
+        prompts = base.get("prompts", [])
+
+        # 2. Targets answer concurrently; extraction runs per target as it finishes
+        def answer(target):
+            target_state = {
+                "config": dict(config, target_model=dict(config.get("target_model", {}), **target)),
+                "prompts": prompts,
+            }
+            run_model(target_state)
+            extract_claims(target_state)
+            return target_state
+
+        workers = int(config.get("compare", {}).get("max_parallel_targets", len(targets)))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets)))) as pool:
+            target_states = list(pool.map(in_context(answer), targets))
+
+        # 3. Retrieve and verify each distinct claim once across all targets
+        all_claims = [c for ts in target_states for c in ts.get("claims", [])]
+        dedup_config = config.get("dedup", {})
+        clusters = cluster_claims(
+            all_claims,
+            threshold=float(dedup_config.get("threshold", 0.85)) if dedup_config.get("enabled", True) else 1.0,
+            num_perm=int(dedup_config.get("num_perm", 64)),
+            bands=int(dedup_config.get("bands", 16)),
+        )
+        shared = {"config": config, "claims": [all_claims[members[0]] for members in clusters]}
+        print(f"Comparing {len(targets)} targets: {len(all_claims)} claims, {len(clusters)} to verify.")
+        retrieve_evidence(shared)
+        verify_claims(shared)
+
+        verdict_by_text = {v.get("claim"): v for v in shared.get("verdicts", [])}
+        verdict_for = {}
+        for members in clusters:
+            verdict = verdict_by_text.get(all_claims[members[0]].get("text", ""))
+            for position in members:
+                verdict_for[position] = verdict
+
+    # 4. Score each target on its own claims
+    models = []
+    aligned = [{"prompt": p, "models": {}} for p in prompts]
+    offset = 0
+    for name, ts in zip(names, target_states):
+        claims = ts.get("claims", [])
+        claim_verdicts = {}
+        seen = set()
+        for i, claim in enumerate(claims):
+            verdict = verdict_for.get(offset + i)
+            if verdict is not None:
+                claim_verdicts[id(claim)] = dict(verdict, claim=claim.get("text", ""))
+                if id(verdict) in seen:
+                    claim_verdicts[id(claim)]["duplicate_of"] = verdict.get("claim", "")
+                seen.add(id(verdict))
+        offset += len(claims)
+        ts["verdicts"] = list(claim_verdicts.values())
+        score_risk(ts)
+        models.append({
+            "name": name,
+            "target_model": ts["config"]["target_model"],
+            "score": ts["score"],
+            "details": {
+                "num_responses": len(ts.get("responses", [])),
+                "num_claims": len(claims),
+                "verdicts": ts["verdicts"],
+            },
+        })
+
+        # 5. Align responses and verdicts per prompt
+        responses = ts.get("responses", [])
+        for i, (response, response_claims) in enumerate(zip(responses, split_claims_by_response(responses, claims))):
+            aligned[i]["models"][name] = {
+                "response": response.get("response", ""),
+                "verdicts": [claim_verdicts[id(c)] for c in response_claims if id(c) in claim_verdicts],
+            }
+
+    result = {
+        "comparison_id": comparison_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "num_prompts": len(prompts),
+        "shared": {
+            "total_claims": len(all_claims),
+            "verified_claims": len(clusters),
+            "verifications_saved": len(all_claims) - len(clusters),
+        },
+        "models": models,
+        "prompts": aligned,
+    }
+    if budget is not None:
+        result["budget"] = budget.report()
+
+    try:
+        index_doc("evaluation_comparisons", comparison_id, es_safe_keys(result), config=config)
+        print(f"Comparison {comparison_id} logged to Elasticsearch.")
+    except Exception as e:
+        print(f"Failed to write comparison log: {e}")
+    return result
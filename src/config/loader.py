@@ -1,15 +1,101 @@
 import yaml
 import os
+import threading
 from typing import Dict, Any
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+def _thaw(value):
+    if isinstance(value, dict):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError("Config snapshots are read-only; use copy() or copy.deepcopy() to modify.")
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict used for cached config snapshots. It still serializes like
+    a dict (JSON, Elasticsearch documents); copy()/deepcopy() return plain,
+    mutable dicts (all the way down) for callers that need to modify a config.
+    """
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+    __ior__ = _readonly
+
+    def copy(self) -> dict:
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (dict, (_thaw(self),))
+
+
+class FrozenList(list):
+    """
+    Read-only list for config snapshots. Still a list (isinstance checks,
+    `+ [...]` and serialization behave as before); copy()/deepcopy() return
+    plain, mutable lists.
+    """
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __iadd__ = _readonly
+    __imul__ = _readonly
+    append = _readonly
+    extend = _readonly
+    insert = _readonly
+    pop = _readonly
+    remove = _readonly
+    clear = _readonly
+    sort = _readonly
+    reverse = _readonly
+
+    def copy(self) -> list:
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (list, (_thaw(self),))
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(_freeze(v) for v in value)
+    return value
+
+
+# resolved path -> (mtime_ns, size, snapshot)
+_config_cache: dict[str, tuple[int, int, FrozenDict]] = {}
+_config_cache_lock = threading.Lock()
+
+
+def clear_config_cache() -> None:
+    """
+    Drop all cached config snapshots so the next load re-reads from disk.
+    """
+    with _config_cache_lock:
+        _config_cache.clear()
+
+
 def load_config(path: str | None = None) -> Dict[str, Any]:
     """
     Load configuration from a YAML file.
     Searches for .llm-reliability.yaml first, then config.yaml.
+    The parsed config is cached per resolved path and reused until the file's
+    mtime or size changes; the returned snapshot is read-only.
     """
     if path is None:
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -31,8 +117,18 @@ def load_config(path: str | None = None) -> Dict[str, Any]:
     if not os.path.exists(path):
         raise FileNotFoundError(f"Configuration file not found at: {path}")
 
-    with open(path, "r") as f:
+    resolved = os.path.realpath(path)
+    stat = os.stat(resolved)
+    with _config_cache_lock:
+        cached = _config_cache.get(resolved)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(resolved, "r") as f:
         config = yaml.safe_load(f)
+    # Only cache what was read if the file didn't change while reading it
+    after = os.stat(resolved)
+    cacheable = (after.st_mtime_ns, after.st_size) == (stat.st_mtime_ns, stat.st_size)
 
     required_keys = [
         "use_case",
@@ -47,4 +143,8 @@ def load_config(path: str | None = None) -> Dict[str, Any]:
         if key not in config:
             raise ValueError(f"Missing required configuration key: {key}")
 
-    return config
+    snapshot = _freeze(config)
+    if cacheable:
+        with _config_cache_lock:
+            _config_cache[resolved] = (stat.st_mtime_ns, stat.st_size, snapshot)
+    return snapshot
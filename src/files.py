@@ -0,0 +1,21 @@
+import json
+import os
+import tempfile
+
+
+def atomic_write_json(path: str, data, **dump_options) -> None:
+    """
+    Write data as JSON to path, creating its directory. The JSON goes to a
+    temp file beside path that is then renamed over it, so a crash never
+    leaves the file half-written. dump_options are passed to json.dump.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
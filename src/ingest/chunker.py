@@ -0,0 +1,112 @@
+from typing import Iterator
+
+# Rough characters-per-token ratio used to size chunks without a tokenizer.
+CHARS_PER_TOKEN = 4
+READ_SIZE = 64 * 1024
+
+
+def _find_boundary(buffer: str, max_chars: int, min_chars: int) -> tuple[int, bool]:
+    """
+    Pick where to end a chunk within buffer[min_chars:max_chars].
+    Prefers, in order: just before a markdown heading, a paragraph break,
+    a sentence end, any whitespace. Returns (cut, at_heading).
+    """
+    window = buffer[:max_chars]
+
+    pos = window.rfind("\n#", min_chars)
+    if pos != -1:
+        return pos + 1, True
+
+    pos = window.rfind("\n\n", min_chars)
+    if pos != -1:
+        return pos + 2, False
+
+    best = -1
+    for end in (". ", "! ", "? ", ".\n"):
+        best = max(best, window.rfind(end, min_chars))
+    if best != -1:
+        return best + 2, False
+
+    for ws in (" ", "\n", "\t"):
+        best = max(best, window.rfind(ws, min_chars))
+    if best != -1:
+        return best + 1, False
+
+    return max_chars, False
+
+
+def _last_heading(text: str) -> str | None:
+    heading = None
+    for line in text.splitlines():
+        if line.startswith("#"):
+            heading = line.lstrip("#").strip() or heading
+    return heading
+
+
+def iter_chunks(file_path: str, max_chars: int = 2000, overlap: int = 200,
+                read_size: int = READ_SIZE) -> Iterator[dict]:
+    """
+    Stream a text file as overlapping chunks of at most max_chars characters.
+    The file is read incrementally, so memory stays bounded by
+    max_chars + read_size regardless of file size. Chunks end on heading,
+    paragraph or sentence boundaries where possible; consecutive chunks share
+    up to overlap characters, except across a heading boundary. overlap is
+    capped at max_chars // 4 so every chunk advances by at least a quarter
+    of max_chars.
+
+    Yields dicts with: text, chunk_index, start_offset, end_offset (character
+    offsets into the file) and heading (the markdown section the chunk starts in).
+    """
+    # Cuts land at or after min_chars, so with this cap each chunk moves on
+    # by at least min_chars - overlap (an overlap near max_chars / 2 would
+    # emit a near-identical chunk every few characters)
+    overlap = max(0, min(overlap, max_chars // 4))
+    min_chars = max_chars // 2
+
+    buffer = ""
+    buffer_start = 0
+    chunk_index = 0
+    heading = None
+    eof = False
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        while True:
+            while not eof and len(buffer) < max_chars + 1:
+                data = f.read(read_size)
+                if not data:
+                    eof = True
+                else:
+                    buffer += data
+            if not buffer:
+                break
+
+            if eof and len(buffer) <= max_chars:
+                cut, at_heading = len(buffer), False
+            else:
+                cut, at_heading = _find_boundary(buffer, max_chars, min_chars)
+
+            text = buffer[:cut]
+            if text.lstrip().startswith("#"):
+                heading = _last_heading(text.lstrip().splitlines()[0])
+            if text.strip():
+                yield {
+                    "text": text,
+                    "chunk_index": chunk_index,
+                    "start_offset": buffer_start,
+                    "end_offset": buffer_start + cut,
+                    "heading": heading,
+                }
+                chunk_index += 1
+
+            if eof and cut >= len(buffer):
+                break
+
+            next_start = cut if at_heading else max(cut - overlap, 1)
+            if next_start < cut:
+                # Start the overlap on a word boundary
+                space = buffer.find(" ", next_start, cut)
+                if space != -1:
+                    next_start = space + 1
+            heading = _last_heading(buffer[:next_start]) or heading
+            buffer = buffer[next_start:]
+            buffer_start += next_start
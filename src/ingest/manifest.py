@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+from src.files import atomic_write_json
+
+DEFAULT_MANIFEST_PATH = ".cache/ingest_manifest.json"
+
+
+def file_sha256(path: str, read_size: int = 1024 * 1024) -> str:
+    """
+    Hash a file's bytes without loading it whole.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(read_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(file_path: str, chunk_index: int, text: str) -> str:
+    """
+    Deterministic document ID for a chunk: the same text at the same position
+    of the same file always maps to the same ID, so re-ingesting upserts
+    instead of duplicating.
+    """
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    raw = f"{os.path.normpath(file_path)}\x00{chunk_index}\x00{text_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str, index: str) -> dict:
+    """
+    Return the per-file manifest for an index:
+    {file_path: {"sha256", "mtime_ns", "size", "chunk_ids"}}.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable ingest manifest {path}: {e}")
+        return {}
+    return data.get("indexes", {}).get(index, {}).get("files", {})
+
+
+def save_manifest(path: str, index: str, files: dict) -> None:
+    """
+    Persist the per-file manifest for an index, keeping other indexes intact.
+    """
+    data = {"version": 1, "indexes": {}}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+    data.setdefault("indexes", {})[index] = {"files": files}
+    atomic_write_json(path, data, indent=2, sort_keys=True)
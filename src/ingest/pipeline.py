@@ -1,74 +1,203 @@
 import os
 from src.config.loader import load_config
-from src.wrappers.elasticsearch_helper import index_doc, clear_index
-from src.wrappers.bedrock import embed
-import uuid
+from src.wrappers.elasticsearch_helper import bulk_index, clear_index, delete_docs, ensure_index
+from src.wrappers.bedrock import embed_many
+from src.ingest.chunker import iter_chunks, CHARS_PER_TOKEN
+from src.ingest.manifest import (
+    DEFAULT_MANIFEST_PATH, chunk_id, file_sha256, load_manifest, save_manifest,
+)
 
-def run_ingest(config_path: str | None = None, clear_first: bool = False) -> dict:
+INGEST_MODES = ("full", "incremental")
+
+
+def _iter_source_files(sources: list):
     """
-    Run document ingestion pipeline.
+    Walk the configured doc sources and yield the path of every ingestible file.
     """
-    config = load_config(config_path)
-    if clear_first:
-        es_config = config.get("elasticsearch", {})
-        index_name = es_config.get("index", "trusted_docs")
-        clear_index(index_name)
-
-    sources = config.get("doc_sources", [])
-    es_config = config.get("elasticsearch", {})
-    index_name = es_config.get("index", "trusted_docs")
-    
-    stats = {"indexed": 0, "errors": 0}
-    
     for source in sources:
         source_type = source.get("type")
         source_path = source.get("path")
-        
+
         if source_type == "file" and source_path:
-             # Basic implementation: read all .txt files in directory
-             if os.path.isdir(source_path):
-                 for root, _, files in os.walk(source_path):
-                     for file in files:
-                         if file.endswith(".txt") or file.endswith(".md"):
-                             file_path = os.path.join(root, file)
-                             try:
-                                 with open(file_path, 'r', encoding='utf-8') as f:
-                                     content = f.read()
-                                     
-                                 # Chunking logic (simple split by paragraphs or chars)
-                                 # For demo, taking whole file if small, or chunks
-                                 chunks = [content] # Simplified
-                                 
-                                 for i, chunk in enumerate(chunks):
-                                     if not chunk.strip():
-                                         continue
-                                         
-                                     # Embed
-                                     try:
-                                         embedding = embed(chunk)
-                                     except Exception as e:
-                                         print(f"Embedding failed for {file}: {e}")
-                                         # Continue without embedding? Or skip?
-                                         # ES helper might require embedding for vector search
-                                         # If we fail, we probably can't index properly for vector search
-                                         continue
-                                     
-                                     doc_id = str(uuid.uuid4())
-                                     doc_body = {
-                                         "content": chunk,
-                                         "source": file_path,
-                                         "embedding": embedding
-                                     }
-                                     
-                                     index_doc(index_name, doc_id, doc_body)
-                                     stats["indexed"] += 1
-                                     
-                             except Exception as e:
-                                 print(f"Error processing file {file_path}: {e}")
-                                 stats["errors"] += 1
-             else:
-                 print(f"Source path {source_path} is not a directory.")
+            # Basic implementation: read all .txt/.md files in directory
+            if os.path.isdir(source_path):
+                for root, _, files in os.walk(source_path):
+                    for file in sorted(files):
+                        if file.endswith(".txt") or file.endswith(".md"):
+                            yield os.path.join(root, file)
+            else:
+                print(f"Source path {source_path} is not a directory.")
         else:
             print(f"Source type {source_type} not supported or path missing.")
-            
+
+
+def _iter_file_chunks(file_paths: list, stats: dict, file_errors: dict, max_chars: int, overlap: int):
+    """
+    Yield (file_path, chunk) for every non-empty chunk of the given files.
+    Read failures are counted in stats and per file in file_errors.
+    """
+    for file_path in file_paths:
+        try:
+            for chunk in iter_chunks(file_path, max_chars=max_chars, overlap=overlap):
+                if chunk["text"].strip():
+                    yield file_path, chunk
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+            stats["errors"] += 1
+            file_errors[file_path] = file_errors.get(file_path, 0) + 1
+
+
+def _iter_source_docs(config: dict, chunks, stats: dict, file_errors: dict,
+                      file_chunk_ids: dict, embed_batch: int):
+    """
+    Yield (doc_id, body) pairs ready for indexing. Chunks are embedded
+    embed_batch at a time through embed_many and get deterministic IDs,
+    recorded per file in file_chunk_ids; embedding failures are counted in
+    stats and file_errors and the chunk is skipped.
+    """
+    pending = []
+
+    def _flush():
+        embeddings = embed_many([chunk["text"] for _, chunk in pending], config=config)
+        for (file_path, chunk), embedding in zip(pending, embeddings):
+            if embedding is None:
+                # Without an embedding the chunk can't serve vector search
+                print(f"Embedding failed for {file_path} chunk {chunk['chunk_index']}")
+                stats["errors"] += 1
+                file_errors[file_path] = file_errors.get(file_path, 0) + 1
+                continue
+            doc_id = chunk_id(file_path, chunk["chunk_index"], chunk["text"])
+            file_chunk_ids.setdefault(file_path, []).append(doc_id)
+            yield doc_id, {
+                "content": chunk["text"],
+                "source": file_path,
+                "chunk_index": chunk["chunk_index"],
+                "start_offset": chunk["start_offset"],
+                "end_offset": chunk["end_offset"],
+                "heading": chunk["heading"],
+                "embedding": embedding
+            }
+        pending.clear()
+
+    for file_path, chunk in chunks:
+        pending.append((file_path, chunk))
+        if len(pending) >= embed_batch:
+            yield from _flush()
+    if pending:
+        yield from _flush()
+
+
+def run_ingest(config_path: str | None = None, clear_first: bool = False,
+               mode: str = "full") -> dict:
+    """
+    Run document ingestion pipeline.
+    Files are split by a streaming, boundary-aware chunker (ingest.chunk_chars
+    or ingest.chunk_tokens, with ingest.chunk_overlap_chars) and embedded in
+    batches of ingest.embed_batch via embed_many. Chunks are streamed into
+    Elasticsearch with the bulk API (batch limits and worker count from the
+    config's ingest section) and the index is refreshed once at the end.
+
+    Chunk IDs are derived from file path and content, and a manifest of file
+    hashes (ingest.manifest_path) records which chunks each file produced.
+    mode="incremental" skips files whose size/mtime or content hash is
+    unchanged; in both modes chunks that a changed or deleted file no
+    longer produces are removed from the index.
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode '{mode}'. Expected one of {INGEST_MODES}.")
+
+    config = load_config(config_path)
+    es_config = config.get("elasticsearch", {})
+    index_name = es_config.get("index", "trusted_docs")
+    ingest_config = config.get("ingest", {})
+    manifest_path = ingest_config.get("manifest_path", DEFAULT_MANIFEST_PATH)
+
+    if clear_first:
+        clear_index(index_name, config=config)
+        manifest = {}
+    else:
+        ensure_index(index_name, config=config)
+        manifest = load_manifest(manifest_path, index_name)
+
+    # Chunk size may be given in tokens (approximate) or characters
+    if "chunk_tokens" in ingest_config:
+        max_chars = int(ingest_config["chunk_tokens"]) * CHARS_PER_TOKEN
+    else:
+        max_chars = int(ingest_config.get("chunk_chars", 2000))
+    overlap = int(ingest_config.get("chunk_overlap_chars", 200))
+    if overlap > max_chars // 4:
+        print(f"chunk_overlap_chars {overlap} is over a quarter of the chunk size; using {max_chars // 4}.")
+        overlap = max_chars // 4
+    embed_batch = int(ingest_config.get("embed_batch", 64))
+
+    stats = {
+        "indexed": 0, "errors": 0, "failures": [],
+        "files_changed": 0, "files_skipped": 0, "files_deleted": 0, "chunks_removed": 0,
+    }
+
+    # 1. Decide which files need (re)indexing
+    seen = set()
+    changed = {}
+    for file_path in _iter_source_files(config.get("doc_sources", [])):
+        seen.add(file_path)
+        entry = manifest.get(file_path)
+        try:
+            st = os.stat(file_path)
+            if mode == "incremental" and entry and entry.get("sha256") \
+                    and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+                stats["files_skipped"] += 1
+                continue
+            digest = file_sha256(file_path)
+        except OSError as e:
+            print(f"Error processing file {file_path}: {e}")
+            stats["errors"] += 1
+            continue
+        if mode == "incremental" and entry and entry.get("sha256") == digest:
+            # Touched but not modified
+            entry.update({"mtime_ns": st.st_mtime_ns, "size": st.st_size})
+            stats["files_skipped"] += 1
+            continue
+        changed[file_path] = {"sha256": digest, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    stats["files_changed"] = len(changed)
+
+    # 2. Chunk, embed and bulk-index the changed files
+    file_errors = {}
+    file_chunk_ids = {}
+    failed_ids = set()
+    if changed:
+        chunks = _iter_file_chunks(list(changed), stats, file_errors, max_chars, overlap)
+        bulk_stats = bulk_index(
+            index_name,
+            _iter_source_docs(config, chunks, stats, file_errors, file_chunk_ids, embed_batch),
+            chunk_size=int(ingest_config.get("bulk_docs", 500)),
+            max_chunk_bytes=int(ingest_config.get("bulk_bytes", 10 * 1024 * 1024)),
+            thread_count=int(ingest_config.get("bulk_workers", 4)),
+            config=config,
+        )
+        stats["indexed"] += bulk_stats["indexed"]
+        stats["errors"] += bulk_stats["errors"]
+        stats["failures"].extend(bulk_stats["failures"])
+        failed_ids = set(bulk_stats.get("failed_ids", []))
+
+    # 3. Update the manifest and drop chunks that are no longer produced
+    stale_ids = []
+    for file_path, info in changed.items():
+        old_ids = set(manifest.get(file_path, {}).get("chunk_ids", []))
+        new_ids = file_chunk_ids.get(file_path, [])
+        if file_errors.get(file_path) or failed_ids.intersection(new_ids):
+            # Keep old chunks and leave the hash unset so the next run retries this file
+            manifest[file_path] = dict(info, sha256=None, chunk_ids=sorted(old_ids | set(new_ids)))
+            continue
+        stale_ids.extend(old_ids - set(new_ids))
+        manifest[file_path] = dict(info, chunk_ids=new_ids)
+
+    for file_path in [p for p in manifest if p not in seen]:
+        stale_ids.extend(manifest.pop(file_path).get("chunk_ids", []))
+        stats["files_deleted"] += 1
+
+    if stale_ids:
+        stats["chunks_removed"] = delete_docs(index_name, stale_ids, config=config)
+
+    save_manifest(manifest_path, index_name, manifest)
     return stats
@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobManager:
+    """
+    Bounded queue of evaluation jobs served by a fixed pool of worker threads.
+
+    runner(run_id, payload, emit) does the work and returns the job result;
+    emit(event) records progress events (dicts with a "type") that are kept
+    per job for status queries and streaming. Finished jobs beyond
+    max_history are forgotten, oldest first.
+    """
+
+    def __init__(self, runner, workers: int = 2, queue_size: int = 20, max_history: int = 200):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_history = max_history
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    def _ensure_workers(self) -> None:
+        with self._cond:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                t = threading.Thread(target=self._work, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, payload: dict, run_id: str | None = None) -> dict:
+        """
+        Queue a job and return its status without waiting for it to run.
+        Raises JobQueueFull if the queue is at capacity and ValueError if a
+        job with the same run_id is still queued or running.
+        """
+        self._ensure_workers()
+        run_id = run_id or str(uuid.uuid4())
+        job = {
+            "run_id": run_id,
+            "status": "queued",
+            "stage": None,
+            "counts": {},
+            "submitted_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "events": [],
+            "payload": payload,
+        }
+        with self._cond:
+            existing = self._jobs.get(run_id)
+            if existing is not None and existing["status"] not in FINISHED_STATUSES:
+                raise ValueError(f"Run '{run_id}' is already {existing['status']}")
+            try:
+                self._queue.put_nowait(run_id)
+            except queue.Full:
+                raise JobQueueFull(f"Job queue is full ({self._queue.maxsize} waiting)")
+            self._jobs.pop(run_id, None)  # a resubmitted run_id moves to the end
+            self._jobs[run_id] = job
+            self._append(job, {"type": "status", "status": "queued"})
+        return self.get(run_id)
+
+    def get(self, run_id: str) -> dict | None:
+        """
+        Snapshot of a job's status, current stage, counts and result.
+        """
+        with self._cond:
+            job = self._jobs.get(run_id)
+            if job is None:
+                return None
+            snapshot = {k: v for k, v in job.items() if k not in ("events", "payload")}
+            snapshot["counts"] = dict(job["counts"])
+            if job["status"] == "queued":
+                waiting = list(self._queue.queue)
+                snapshot["queue_position"] = waiting.index(run_id) if run_id in waiting else 0
+            return snapshot
+
+    def emit(self, run_id: str, event: dict) -> None:
+        """
+        Record a progress event. "stage" events update the current stage and
+        counts; "verdict" events bump the verdict count.
+        """
+        with self._cond:
+            job = self._jobs.get(run_id)
+            if job is not None:
+                self._append(job, event)
+
+    def _append(self, job: dict, event: dict) -> None:
+        # Caller holds self._cond
+        event = dict(event, seq=len(job["events"]), time=time.time())
+        if event.get("type") == "stage":
+            job["stage"] = event.get("stage")
+            job["counts"].update(event.get("counts", {}))
+        elif event.get("type") == "verdict":
+            job["counts"]["verdicts"] = job["counts"].get("verdicts", 0) + 1
+        job["events"].append(event)
+        self._cond.notify_all()
+
+    def events(self, run_id: str, start: int = 0, heartbeat: float = 15.0):
+        """
+        Yield a job's events from position start, waiting for new ones until
+        the job finishes. Yields a {"type": "heartbeat"} event when nothing
+        happened for heartbeat seconds so idle connections stay open.
+        """
+        position = start
+        while True:
+            timed_out = False
+            with self._cond:
+                job = self._jobs.get(run_id)
+                if job is None:
+                    return
+                if position >= len(job["events"]):
+                    if job["status"] in FINISHED_STATUSES:
+                        return
+                    timed_out = not self._cond.wait(timeout=heartbeat)
+                pending = job["events"][position:]
+                position += len(pending)
+            if timed_out and not pending:
+                yield {"type": "heartbeat", "time": time.time()}
+            for event in pending:
+                yield event
+
+    def _work(self) -> None:
+        while True:
+            run_id = self._queue.get()
+            with self._cond:
+                job = self._jobs.get(run_id)
+                if job is None:
+                    continue
+                job["status"] = "running"
+                job["started_at"] = datetime.utcnow().isoformat()
+                self._append(job, {"type": "status", "status": "running"})
+            try:
+                result = self.runner(run_id, job["payload"], lambda event: self.emit(run_id, event))
+                status, error = "completed", None
+            except Exception as e:
+                print(f"Job {run_id} failed: {e}")
+                result, status, error = None, "failed", str(e)
+            with self._cond:
+                job.update(status=status, result=result, error=error,
+                           finished_at=datetime.utcnow().isoformat())
+                self._append(job, {"type": "status", "status": status, "error": error})
+                self._trim()
+
+    def _trim(self) -> None:
+        # Caller holds self._cond
+        finished = [rid for rid, job in self._jobs.items() if job["status"] in FINISHED_STATUSES]
+        for rid in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[rid]
@@ -1,16 +1,117 @@
+from contextlib import asynccontextmanager
+import json
+import threading
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from src.orchestrator import run_workflow, build_response
-from src.ingest.pipeline import run_ingest
+from src.compare import run_comparison
+from src.jobs import JobManager, JobQueueFull
+from src.checkpoint import DEFAULT_CHECKPOINT_PATH, load_checkpoint
+from src.prompt_sets import (
+    DEFAULT_PROMPT_SETS_PATH, get_prompt_set, invalidate_prompt_sets, list_prompt_sets, pin_prompt_set,
+)
+from src.ingest.pipeline import run_ingest, INGEST_MODES
 from src.config.loader import load_config
+from src.wrappers.bedrock import prewarm_clients
+from src.wrappers.ollama import close_clients as close_ollama_clients, ollama_settings, prewarm_ollama
+from src.agents.run_model import target_settings
+from src.wrappers.llm_cache import cache_stats
+from src.wrappers.rate_governor import governor_stats
+from src import metrics
 import uvicorn
 
-app = FastAPI(title="LLM Reliability Gate")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-warm pooled Bedrock clients so the first evaluation doesn't pay for setup
+    try:
+        regions = prewarm_clients()
+        print(f"Bedrock clients warmed for: {', '.join(regions)}")
+    except Exception as e:
+        print(f"Bedrock client pre-warm skipped: {e}")
+    # Load a local target model and pin it with keep_alive before the first run
+    try:
+        config = load_config()
+        target = config.get("target_model", {})
+        if target.get("provider") == "ollama":
+            _, model_id, _, ollama_base = target_settings(config)
+            prewarm_ollama(model_id, ollama_base, ollama_settings(config))
+            print(f"Ollama model {model_id} loaded.")
+    except Exception as e:
+        print(f"Ollama pre-warm skipped: {e}")
+    yield
+    # Release pooled Ollama connections
+    await close_ollama_clients()
+
+
+app = FastAPI(title="LLM Reliability Gate", lifespan=lifespan)
 
 
 class EvaluationRequest(BaseModel):
     use_case: str = "default"
     config_path: str | None = None  # optional override
+    resume_run_id: str | None = None  # continue a checkpointed run instead of starting over
+
+
+class CompareTarget(BaseModel):
+    provider: str = "bedrock"
+    model_id: str
+    name: str | None = None  # label in the comparison, defaults to model_id
+
+
+class CompareRequest(BaseModel):
+    targets: list[CompareTarget]
+    use_case: str = "default"
+    config_path: str | None = None
+
+
+def _new_state(config: dict) -> dict:
+    return {
+        "config": config,
+        "prompts": [],
+        "responses": [],
+        "claims": [],
+        "evidence": [],
+        "verdicts": [],
+        "score": {},
+    }
+
+
+def _run_job(run_id: str, payload: dict, emit) -> dict:
+    """
+    Job runner: the same full pipeline as /evaluate, reporting progress through emit.
+    """
+    config = load_config(payload.get("config_path"))
+    state = _new_state(config)
+    state["run_id"] = run_id
+    run_workflow(state, on_event=emit, resume=bool(payload.get("resume")))
+    return build_response(state)
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    Shared job manager, sized from the config's jobs section on first use.
+    """
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            try:
+                jobs_config = load_config().get("jobs", {})
+            except Exception as e:
+                print(f"Could not load jobs config, using defaults: {e}")
+                jobs_config = {}
+            _job_manager = JobManager(
+                _run_job,
+                workers=int(jobs_config.get("workers", 2)),
+                queue_size=int(jobs_config.get("queue_size", 20)),
+                max_history=int(jobs_config.get("max_history", 200)),
+            )
+    return _job_manager
 
 
 @app.get("/health")
@@ -23,23 +124,23 @@ def evaluate(request: EvaluationRequest):
     """
     Full pipeline: load config → generate prompts → run model → extract claims
     → retrieve evidence → verify claims → score risk → audit log → return result.
-    No partial runs. No flags. No debug mode.
+    With resume_run_id set, a failed run continues from its checkpoint instead:
+    completed stages are skipped and the interrupted stage picks up where it
+    stopped (404 if the run has no checkpoint).
     """
+    if request.resume_run_id:
+        _require_checkpoint(request.config_path, request.resume_run_id)
     try:
         config = load_config(request.config_path)
+        state = _new_state(config)
 
-        state = {
-            "config": config,
-            "prompts": [],
-            "responses": [],
-            "claims": [],
-            "evidence": [],
-            "verdicts": [],
-            "score": {},
-        }
-
-        # Full sequential pipeline — every step runs, no shortcuts
-        run_workflow(state)
+        if request.resume_run_id:
+            # Finish a checkpointed run from its last completed stage
+            state["run_id"] = request.resume_run_id
+            run_workflow(state, resume=True)
+        else:
+            # Full sequential pipeline — every step runs, no shortcuts
+            run_workflow(state)
 
         # Single JSON response, returned exactly once
         response = build_response(state)
@@ -49,10 +150,182 @@ def evaluate(request: EvaluationRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/compare")
+def compare(request: CompareRequest):
+    """
+    Evaluate several target models on one prompt set. Prompts are generated
+    once, the targets run concurrently, and claims that match across models
+    are verified once. Returns per-model scores plus per-prompt responses
+    and verdicts aligned across models.
+    """
+    if not request.targets:
+        raise HTTPException(status_code=400, detail="At least one target model is required.")
+    try:
+        config = load_config(request.config_path)
+        targets = [t.model_dump(exclude_none=True) for t in request.targets]
+        return run_comparison(config, targets)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _require_checkpoint(config_path: str | None, run_id: str) -> None:
+    """
+    Reject resume requests for runs without a checkpoint up front.
+    """
+    try:
+        config = load_config(config_path)
+        checkpoint_dir = config.get("checkpoint", {}).get("path", DEFAULT_CHECKPOINT_PATH)
+        found = load_checkpoint(checkpoint_dir, run_id) is not None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail=f"No checkpoint found for run '{run_id}'")
+
+
+def _submit(payload: dict, run_id: str | None, resume: bool) -> dict:
+    if resume:
+        _require_checkpoint(payload.get("config_path"), run_id)
+    try:
+        job = get_job_manager().submit(dict(payload, resume=resume), run_id=run_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"run_id": job["run_id"], "status": job["status"]}
+
+
+@app.post("/runs", status_code=202)
+def submit_run(request: EvaluationRequest):
+    """
+    Queue the full pipeline as a background job and return its run_id
+    immediately. Poll GET /runs/{run_id} or stream GET /runs/{run_id}/events.
+    With resume_run_id, the checkpointed run is continued instead.
+    """
+    return _submit(request.model_dump(), request.resume_run_id, resume=bool(request.resume_run_id))
+
+
+@app.post("/runs/{run_id}/resume", status_code=202)
+def resume_run(run_id: str, config_path: str | None = None):
+    """
+    Queue a checkpointed run to continue from its last completed stage and item.
+    """
+    return _submit({"config_path": config_path}, run_id, resume=True)
+
+
+@app.get("/runs/{run_id}")
+def get_run(run_id: str):
+    """
+    Job status, current stage, partial counts and, once completed, the
+    same result /evaluate returns.
+    """
+    job = get_job_manager().get(run_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run_id '{run_id}'")
+    return job
+
+
+@app.get("/runs/{run_id}/events")
+def stream_run_events(run_id: str, since: int = 0):
+    """
+    Stream the job's events as NDJSON: status changes, stage transitions
+    and verdicts as they land. Events already recorded (from position
+    `since`) are replayed first; the stream ends when the job finishes.
+    """
+    manager = get_job_manager()
+    if manager.get(run_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run_id '{run_id}'")
+    lines = (json.dumps(event, default=str) + "\n" for event in manager.events(run_id, start=since))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: stage and call latency histograms, LLM
+    call/token/retry/throttle counters, plus cache hit rates and rate
+    governor state read at scrape time.
+    """
+    caches = cache_stats()
+    governors = governor_stats()
+    gauges = {
+        "cache_hits": ("Cache hits since process start.",
+                       [({"cache": path}, s["hits"]) for path, s in caches.items()]),
+        "cache_misses": ("Cache misses since process start.",
+                         [({"cache": path}, s["misses"]) for path, s in caches.items()]),
+        "cache_hit_rate": ("Cache hit rate since process start.",
+                           [({"cache": path}, s["hit_rate"]) for path, s in caches.items()]),
+        "governor_concurrency_limit": ("Current AIMD concurrency limit per model.",
+                                       [({"model": m}, s["concurrency_limit"]) for m, s in governors.items()]),
+        "governor_in_flight": ("Calls currently in flight per model.",
+                               [({"model": m}, s["in_flight"]) for m, s in governors.items()]),
+    }
+    return PlainTextResponse(metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+
+def _prompt_sets_dir(config_path: str | None) -> str:
+    return load_config(config_path).get("prompt_sets", {}).get("path", DEFAULT_PROMPT_SETS_PATH)
+
+
+@app.get("/prompt-sets")
+def get_prompt_sets(index: str | None = None, config_path: str | None = None):
+    """
+    Stored prompt sets (without their prompts), newest first.
+    """
+    return {"prompt_sets": list_prompt_sets(_prompt_sets_dir(config_path), index=index)}
+
+
+@app.get("/prompt-sets/{key}")
+def get_prompt_set_by_key(key: str, config_path: str | None = None):
+    try:
+        data = get_prompt_set(_prompt_sets_dir(config_path), key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Unknown prompt set '{key}'")
+    return data
+
+
+@app.put("/prompt-sets/{key}/pin")
+def pin_prompt_set_by_key(key: str, pinned: bool = True, config_path: str | None = None):
+    """
+    Pin a prompt set so runs on its index and parameters keep using it even
+    after the corpus changes (pinned=false to unpin).
+    """
+    try:
+        data = pin_prompt_set(_prompt_sets_dir(config_path), key, pinned=pinned)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Unknown prompt set '{key}'")
+    return data
+
+
+@app.delete("/prompt-sets")
+def invalidate_prompt_sets_endpoint(key: str | None = None, index: str | None = None,
+                                    include_pinned: bool = False, config_path: str | None = None):
+    """
+    Delete one prompt set (key) or all of them (optionally of one index) so
+    the next run generates fresh prompts. Pinned sets are kept unless
+    include_pinned.
+    """
+    try:
+        deleted = invalidate_prompt_sets(_prompt_sets_dir(config_path), key=key, index=index,
+                                         include_pinned=include_pinned)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"deleted": deleted}
+
+
 @app.post("/ingest")
-def ingest_documents(clear_first: bool = False):
+def ingest_documents(clear_first: bool = False, mode: str = "full"):
+    """
+    Ingest trusted docs. mode="incremental" only re-indexes files whose
+    content changed since the last ingest and removes chunks of deleted files.
+    """
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {INGEST_MODES}")
     try:
-        stats = run_ingest(clear_first=clear_first)
+        stats = run_ingest(clear_first=clear_first, mode=mode)
         return {"status": "success", "stats": stats}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
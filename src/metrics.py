@@ -0,0 +1,167 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Metric names, types and help text, exposed with the llm_gate_ prefix.
+METRICS = {
+    "stage_seconds": ("histogram", "Wall time of each workflow stage."),
+    "call_seconds": ("histogram", "Latency of calls to Bedrock, Ollama and Elasticsearch."),
+    "llm_calls_total": ("counter", "LLM calls by backend, model and outcome."),
+    "llm_tokens_total": ("counter", "LLM tokens reported by the backend, by direction."),
+    "llm_retries_total": ("counter", "Bedrock calls retried by the rate governor."),
+    "llm_throttles_total": ("counter", "Bedrock throttling errors."),
+    "ttft_seconds": ("histogram", "Time to first token of streamed Ollama generations."),
+    "llm_truncations_total": ("counter", "Generations cut off, by reason (max_tokens, deadline, error)."),
+}
+PREFIX = "llm_gate_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+# (name, labels) -> [bucket counts..., +Inf count, sum]
+_histograms: dict[tuple, list] = {}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """
+    Add amount to a counter.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Record a value (seconds) in a histogram.
+    """
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0]
+            _histograms[key] = series
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                series[i] += 1
+        series[len(DEFAULT_BUCKETS)] += 1
+        series[-1] += value
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """
+    Observe the wall time of the with-block, also when it raises.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def snapshot() -> dict:
+    """
+    Plain-dict copy of every series:
+    {"counters": {name: [{"labels", "value"}]},
+     "histograms": {name: [{"labels", "count", "sum"}]}}.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(series) for key, series in _histograms.items()}
+    result = {"counters": {}, "histograms": {}}
+    for (name, labels), value in sorted(counters.items()):
+        result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+    for (name, labels), series in sorted(histograms.items()):
+        result["histograms"].setdefault(name, []).append(
+            {"labels": dict(labels), "count": series[len(DEFAULT_BUCKETS)], "sum": round(series[-1], 6)}
+        )
+    return result
+
+
+def diff(before: dict, after: dict) -> dict:
+    """
+    What changed between two snapshots, e.g. the calls and tokens of one run.
+    Series that did not change are left out.
+    """
+    def index(entries, field):
+        return {tuple(sorted(e["labels"].items())): e[field] for e in entries}
+
+    result = {"counters": {}, "histograms": {}}
+    for name, entries in after["counters"].items():
+        old = index(before["counters"].get(name, []), "value")
+        for e in entries:
+            delta = e["value"] - old.get(tuple(sorted(e["labels"].items())), 0)
+            if delta:
+                result["counters"].setdefault(name, []).append({"labels": e["labels"], "value": delta})
+    for name, entries in after["histograms"].items():
+        old_counts = index(before["histograms"].get(name, []), "count")
+        old_sums = index(before["histograms"].get(name, []), "sum")
+        for e in entries:
+            labels = tuple(sorted(e["labels"].items()))
+            count = e["count"] - old_counts.get(labels, 0)
+            if count:
+                result["histograms"].setdefault(name, []).append({
+                    "labels": e["labels"], "count": count,
+                    "sum": round(e["sum"] - old_sums.get(labels, 0.0), 6),
+                })
+    return result
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(gauges: dict | None = None) -> str:
+    """
+    All series in the Prometheus text exposition format (version 0.0.4).
+    gauges maps a metric name to (help, [(labels dict, value)]) for values
+    that are read at scrape time rather than accumulated.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(series) for key, series in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        if kind == "counter":
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+        else:
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                for bound, count in zip(DEFAULT_BUCKETS, series):
+                    lines.append(f"{full}_bucket{_format_labels(labels, (('le', bound),))} {count}")
+                total = series[len(DEFAULT_BUCKETS)]
+                lines.append(f"{full}_bucket{_format_labels(labels, (('le', '+Inf'),))} {total}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+                lines.append(f"{full}_count{_format_labels(labels)} {total}")
+
+    for name, (help_text, samples) in (gauges or {}).items():
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} gauge")
+        for labels, value in samples:
+            lines.append(f"{full}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
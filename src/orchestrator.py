@@ -1,43 +1,290 @@
-from src.agents.score_risk import score_risk
+from src.agents.score_risk import decision_settled, score_risk
 from src.agents.generate_prompts import generate_prompts
 from src.agents.run_model import run_model
 from src.agents.extract_claims import extract_claims
+from src.agents.dedupe_claims import dedupe_claims, fan_out_verdicts
 from src.agents.retrieve_evidence import retrieve_evidence
 from src.agents.verify_claims import verify_claims
+from src.pipelined import run_pipelined_stages
+from src.budget import RunBudget, use_budget
+from src.checkpoint import DEFAULT_CHECKPOINT_PATH, delete_checkpoint, load_checkpoint, save_checkpoint
 from src.wrappers.elasticsearch_helper import index_doc
+from src.wrappers.llm_cache import cache_stats
+from src.wrappers.rate_governor import governor_stats
+from src import metrics
+from src.config.loader import load_config
+import argparse
+import json
+import random
+import time
 import uuid
 from datetime import datetime
 
 
-def run_workflow(state: dict) -> None:
+def _counts(state: dict) -> dict:
+    return {
+        "prompts": len(state.get("prompts", [])),
+        "responses": len(state.get("responses", [])),
+        "claims": len(state.get("claims", [])),
+        "verdicts": len(state.get("verdicts", [])),
+    }
+
+
+def _run_in_chunks(state: dict, agent, input_key: str, output_key: str, chunk_size: int,
+                   partial: dict, save, should_stop=None) -> None:
+    """
+    Run an order-preserving agent over state[input_key] chunk_size items at
+    a time, calling save() after each chunk so an interrupted stage resumes
+    from the last completed chunk. partial ({"done", "output"}) carries the
+    progress of a previous attempt. If should_stop() returns True before a
+    chunk, the remaining items are skipped.
+    """
+    items = state.get(input_key, [])
+    partial.setdefault("done", 0)
+    partial.setdefault("output", [])
+    if partial["done"]:
+        print(f"Resuming after {partial['done']}/{len(items)} {input_key}.")
+    for start in range(partial["done"], len(items), chunk_size):
+        if should_stop is not None and should_stop():
+            break
+        mini = {"config": state.get("config", {}), input_key: items[start:start + chunk_size]}
+        agent(mini)
+        partial["output"].extend(mini.get(output_key, []))
+        partial["done"] = min(start + chunk_size, len(items))
+        save()
+    state[output_key] = partial["output"]
+
+
+def _run_wave(state: dict, prompts: list, pipelined: bool, on_verdict, should_stop) -> None:
+    """
+    Run steps 2-5 for one wave of prompts and append its responses, claims,
+    evidence and verdicts to state. Claims are deduplicated within the wave.
+    """
+    wave = {"config": state.get("config", {}), "run_id": state.get("run_id"), "prompts": prompts}
+    if pipelined:
+        run_pipelined_stages(wave, on_verdict=on_verdict, should_stop=should_stop)
+    else:
+        run_model(wave)
+        extract_claims(wave)
+        dedupe_claims(wave)
+        retrieve_evidence(wave)
+        verify_claims(wave)
+        fan_out_verdicts(wave)
+        for verdict in wave.get("verdicts", []):
+            on_verdict(verdict)
+    for key in ("responses", "claims", "evidence", "verdicts"):
+        state[key] = list(state.get(key, [])) + wave.get(key, [])
+
+
+def es_safe_keys(value):
+    """
+    Copy of value with dots in object keys replaced by "_", for documents
+    written to Elasticsearch. It expands dotted keys (cache paths, Bedrock
+    model IDs, model names) into nested objects, or rejects them.
+    """
+    if isinstance(value, dict):
+        return {str(k).replace(".", "_"): es_safe_keys(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [es_safe_keys(item) for item in value]
+    return value
+
+
+def _wave_settled(state: dict, min_claims: int) -> bool:
     """
-    Run the complete evaluation workflow. Sequential. No async.
-    Updates state in-place.
+    Whether the verdicts so far settle the deploy/warn/reject decision.
+    min_claims counts distinct verifications, not fanned-out copies.
     """
-    run_id = str(uuid.uuid4())
+    interim = {"config": state.get("config", {}), "verdicts": state.get("verdicts", [])}
+    score_risk(interim)
+    if interim["score"]["samples"] < min_claims:
+        return False
+    return decision_settled(interim["score"], state.get("config", {}).get("thresholds", {}))
+
+
+def _sample_claims_for_budget(state: dict, budget: RunBudget) -> None:
+    """
+    Keep only as many claims as the remaining verifier budget can pay for,
+    chosen at random (seeded by run_id) and kept in their original order.
+    Runs once per run: state["budget_sampled"] records that state["claims"]
+    is already the sampled list, so a resumed run keeps it.
+    """
+    state["budget_sampled"] = True
+    claims = state.get("claims", [])
+    batch_size = max(1, int(state.get("config", {}).get("evaluation", {}).get("verification_batch_size", 1)))
+    affordable = budget.affordable_claims(calls_per_claim=1 / batch_size)
+    if affordable is None or affordable >= len(claims):
+        return
+    keep = sorted(random.Random(state.get("run_id")).sample(range(len(claims)), affordable))
+    state["claims"] = [claims[i] for i in keep]
+    budget.note(f"verifier budget covers {affordable} of {len(claims)} claims, sampled")
+
+
+def run_workflow(state: dict, on_event=None, resume: bool = False) -> None:
+    """
+    Run the complete evaluation workflow. No async.
+    With execution.mode "pipelined", steps 2-5 run as a streaming pipeline
+    (see run_pipelined_stages); otherwise every step runs to completion
+    before the next starts.
+    on_event, if given, is called with {"type": "stage", "stage", "counts"}
+    at every step and {"type": "verdict", "verdict"} as verdicts land.
+
+    With checkpoint.enabled, state is saved under checkpoint.path after every
+    stage and, in sequential mode, after every checkpoint.item_batch items
+    of steps 2-5. resume=True reloads the checkpoint of state["run_id"] and
+    continues from the last completed stage and item.
+
+    The config's budget section (max_verifier_tokens, max_target_tokens,
+    max_llm_calls, max_wall_seconds) caps the run: claims are sampled down
+    to what the verifier budget can pay for, and work stops early once a
+    limit is reached. Consumption is reported in state["budget"] and
+    score["budget_limited"] is set.
+    Uses state["run_id"] if already set. Updates state in-place.
+    """
+    budget = RunBudget.from_config(state.get("config", {}))
+    with use_budget(budget):
+        _run_workflow(state, on_event, resume, budget)
+
+
+def _run_workflow(state: dict, on_event, resume: bool, budget: RunBudget | None) -> None:
+    """
+    run_workflow's body, run with budget as the current run budget.
+    """
+    config = state.get("config", {})
+    checkpoint_config = config.get("checkpoint", {})
+    checkpoint_dir = checkpoint_config.get("path", DEFAULT_CHECKPOINT_PATH)
+    checkpointing = checkpoint_config.get("enabled", False)
+    item_batch = max(1, int(checkpoint_config.get("item_batch", 25)))
+
+    run_id = state.get("run_id") or str(uuid.uuid4())
+    completed = []
+    partials = {}
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_dir, run_id)
+        if checkpoint is None:
+            raise ValueError(f"No checkpoint found for run '{run_id}'")
+        state.update(checkpoint["state"])
+        completed = checkpoint.get("completed_stages", [])
+        partials = checkpoint.get("partial", {})
+        print(f"Resuming run {run_id} after stages: {', '.join(completed) or 'none'}")
+        checkpointing = True
+        if budget is not None and "budget" in state:
+            # Spending of the interrupted attempt counts against this one too
+            budget.restore(state["budget"])
+    else:
+        state["timestamp"] = datetime.utcnow().isoformat()
     state["run_id"] = run_id
-    state["timestamp"] = datetime.utcnow().isoformat()
+    stage_seconds = state.setdefault("stage_seconds", {})
+    metrics_before = metrics.snapshot()
+
+    def save(partial_stage=None):
+        if checkpointing:
+            if budget is not None:
+                state["budget"] = budget.report()
+            partial = {partial_stage: partials[partial_stage]} if partial_stage else {}
+            save_checkpoint(checkpoint_dir, run_id, state, completed, partial)
 
-    print("Step 1: Generating Prompts...")
-    generate_prompts(state)
+    def verdict_landed(verdict):
+        if on_event is not None:
+            on_event({"type": "verdict", "verdict": verdict})
 
-    print("Step 2: Running Model...")
-    run_model(state)
+    def step(name, message, fn):
+        if name in completed:
+            print(f"{message} (done, restored from checkpoint)")
+            return
+        print(message)
+        if on_event is not None:
+            on_event({"type": "stage", "stage": name, "counts": _counts(state)})
+        started = time.perf_counter()
+        try:
+            fn()
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("stage_seconds", elapsed, stage=name)
+            # Accumulates across resumed attempts of the same stage
+            stage_seconds[name] = round(stage_seconds.get(name, 0.0) + elapsed, 3)
+        completed.append(name)
+        save()
 
-    print("Step 3: Extracting Claims...")
-    extract_claims(state)
+    def over_budget(name):
+        reason = budget.exhausted() if budget is not None else None
+        if reason:
+            budget.note(f"{reason} reached during {name}, remaining work skipped")
+        return reason is not None
 
-    print("Step 4: Retrieving Evidence...")
-    retrieve_evidence(state)
+    def chunked(name, agent, input_key, output_key):
+        # Without checkpointing or a budget, agents see the whole stage at once
+        if not checkpointing and budget is None:
+            agent(state)
+            return
+        partial = partials.setdefault(name, {})
+        _run_in_chunks(state, agent, input_key, output_key, item_batch, partial,
+                       lambda: save(name), should_stop=lambda: over_budget(name))
 
-    print("Step 5: Verifying Claims...")
-    verify_claims(state)
+    def retrieve_step():
+        if budget is not None and not state.get("budget_sampled"):
+            _sample_claims_for_budget(state, budget)
+            save()  # persist the sampled claims before any evidence is retrieved
+        chunked("retrieving_evidence", retrieve_evidence, "claims", "evidence")
 
-    print("Step 6: Scoring Risk...")
-    score_risk(state)
+    def extract_step():
+        chunked("extracting_claims", extract_claims, "responses", "claims")
+        dedupe_claims(state)
+
+    def verify_step():
+        chunked("verifying_claims", verify_claims, "evidence", "verdicts")
+        fan_out_verdicts(state)
+        for verdict in state.get("verdicts", []):
+            verdict_landed(verdict)
+
+    step("generating_prompts", "Step 1: Generating Prompts...", lambda: generate_prompts(state))
+
+    pipelined = config.get("execution", {}).get("mode", "sequential") == "pipelined"
+    sequential_config = config.get("evaluation", {}).get("sequential", {})
+    if sequential_config.get("enabled", False):
+        # Waves of prompts until the interval settles the decision
+        wave_size = max(1, int(sequential_config.get("wave_size", 10)))
+        min_claims = int(sequential_config.get("min_claims", 20))
+        prompts = state.get("prompts", [])
+        waves = state.setdefault("waves", {"waves_run": 0, "prompts_used": 0, "stopped_early": False})
+        for number, start in enumerate(range(0, len(prompts), wave_size), 1):
+            name = f"wave_{number}"
+            if name not in completed:
+                if _wave_settled(state, min_claims):
+                    waves["stopped_early"] = True
+                    print(f"Decision settled after {waves['prompts_used']} of {len(prompts)} prompts.")
+                    break
+                if over_budget(name):
+                    break
+            wave_prompts = prompts[start:start + wave_size]
+
+            def run_wave(wave_prompts=wave_prompts, name=name):
+                _run_wave(state, wave_prompts, pipelined, verdict_landed, lambda: over_budget(name))
+                waves["waves_run"] += 1
+                waves["prompts_used"] += len(wave_prompts)
+
+            step(name, f"Steps 2-5: Wave {number} ({len(wave_prompts)} prompts)...", run_wave)
+    elif pipelined:
+        step("pipelined", "Steps 2-5: Running Model, Extracting, Retrieving and Verifying (pipelined)...",
+             lambda: run_pipelined_stages(state, on_verdict=verdict_landed,
+                                          should_stop=lambda: over_budget("pipelined")))
+    else:
+        step("running_model", "Step 2: Running Model...",
+             lambda: chunked("running_model", run_model, "prompts", "responses"))
+        step("extracting_claims", "Step 3: Extracting Claims...", extract_step)
+        step("retrieving_evidence", "Step 4: Retrieving Evidence...", retrieve_step)
+        step("verifying_claims", "Step 5: Verifying Claims...", verify_step)
+
+    step("scoring_risk", "Step 6: Scoring Risk...", lambda: score_risk(state))
+    if "waves" in state:
+        state["score"].update(state["waves"])
+    if budget is not None:
+        state["budget"] = budget.report()
+        state["score"]["budget_limited"] = state["budget"]["budget_limited"]
 
     # Step 7 — Audit log to Elasticsearch
     print("Step 7: Audit Logging...")
+    if on_event is not None:
+        on_event({"type": "stage", "stage": "audit_logging", "counts": _counts(state)})
     try:
         log_entry = {
             "run_id": run_id,
@@ -53,12 +300,24 @@ def run_workflow(state: dict) -> None:
             "responses": state.get("responses", []),
             "claims": state.get("claims", []),
             "verdicts": state.get("verdicts", []),
+            "budget": state.get("budget"),
+            "prompt_set": state.get("prompt_set"),
+            "llm_cache": cache_stats(),
+            "rate_governor": governor_stats(),
+            "metrics": {
+                "stage_seconds": stage_seconds,
+                # Calls, tokens, retries and latencies recorded while this run was
+                # active (includes other runs sharing the process at the same time)
+                "during_run": metrics.diff(metrics_before, metrics.snapshot()),
+            },
         }
-        index_doc("evaluation_runs", run_id, log_entry)
+        index_doc("evaluation_runs", run_id, es_safe_keys(log_entry), config=state.get("config"))
         print(f"Run {run_id} logged to Elasticsearch.")
     except Exception as e:
         print(f"Failed to write audit log: {e}")
 
+    if checkpointing and not checkpoint_config.get("keep_completed", False):
+        delete_checkpoint(checkpoint_dir, run_id)
     print("Workflow complete.")
 
 
@@ -70,7 +329,7 @@ def build_response(state: dict) -> dict:
     claims = state.get("claims", [])
     verdicts = state.get("verdicts", [])
 
-    return {
+    response = {
         "run_id": state.get("run_id"),
         "timestamp": state.get("timestamp"),
         "score": score,
@@ -81,3 +340,23 @@ def build_response(state: dict) -> dict:
             "verdicts": verdicts,
         },
     }
+    if "budget" in state:
+        response["budget"] = state["budget"]
+    if "prompt_set" in state:
+        response["prompt_set"] = state["prompt_set"]
+    return response
+
+
+if __name__ == "__main__":
+    # CLI: python -m src.orchestrator [--config PATH] [--resume RUN_ID]
+    parser = argparse.ArgumentParser(description="Run an evaluation without the API server.")
+    parser.add_argument("--config", dest="config_path", default=None, help="config file to use")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None,
+                        help="continue a checkpointed run from its last completed stage")
+    args = parser.parse_args()
+
+    cli_state = {"config": load_config(args.config_path)}
+    if args.resume:
+        cli_state["run_id"] = args.resume
+    run_workflow(cli_state, resume=bool(args.resume))
+    print(json.dumps(build_response(cli_state), indent=2, default=str))
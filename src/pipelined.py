@@ -0,0 +1,219 @@
+import queue
+import threading
+from src.agents.run_model import run_prompt, target_settings
+from src.wrappers.ollama import ollama_settings
+from src.agents.extract_claims import extract_claims, split_claims_by_response
+from src.agents.dedupe_claims import online_deduper
+from src.agents.retrieve_evidence import retrieve_evidence
+from src.agents.verify_claims import verify_claims
+from src.budget import in_context
+
+# Default worker threads per stage; the model stage uses target_model.concurrency
+DEFAULT_WORKERS = {
+    "extract": 2,
+    "retrieve": 2,
+    "verify": 4,
+}
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+def _start_stage(name: str, in_queue: queue.Queue, out_queue: queue.Queue | None,
+                 handler, workers: int, batch_size: int) -> threading.Thread:
+    """
+    Start `workers` threads that take micro-batches of up to batch_size items
+    from in_queue (whatever is already waiting, never blocking for more) and
+    pass them to handler. Once every worker has seen the end marker, the
+    marker is forwarded to out_queue. Returns the thread that does so.
+    """
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                in_queue.put(_DONE)  # let sibling workers see it too
+                return
+            batch = [item]
+            finished = False
+            while len(batch) < batch_size:
+                try:
+                    item = in_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    in_queue.put(_DONE)
+                    finished = True
+                    break
+                batch.append(item)
+            try:
+                handler(batch)
+            except Exception as e:
+                print(f"Error in {name} stage on batch of {len(batch)}: {e}")
+            if finished:
+                return
+
+    # Workers charge the caller's run budget
+    threads = [threading.Thread(target=in_context(worker), daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+
+    def close():
+        for t in threads:
+            t.join()
+        if out_queue is not None:
+            out_queue.put(_DONE)
+
+    closer = threading.Thread(target=close, daemon=True)
+    closer.start()
+    return closer
+
+
+def run_pipelined_stages(state: dict, on_verdict=None, should_stop=None) -> None:
+    """
+    Run the model, claim extraction, dedup, evidence retrieval and
+    verification as a streaming pipeline. Stages are connected by bounded
+    queues (execution.queue_size) and each has its own worker pool
+    (execution.workers.extract/retrieve/verify; the model stage uses
+    target_model.concurrency), so a response is extracted, retrieved and
+    verified while later prompts are still being answered.
+    Items are micro-batched with the existing batch sizes and handed to the
+    regular agents, and results are reassembled in prompt order, so state
+    ends up with the same responses, claims, evidence and verdicts as the
+    sequential workflow. Near-duplicate claims are matched online against
+    earlier representatives and only those are retrieved and verified.
+    on_verdict, if given, is called with each representative's verdict as
+    soon as it is verified. Once should_stop() returns True, no further
+    prompts are sent and queued work is dropped.
+    Updates state["responses"], state["claims"], state["evidence"] and state["verdicts"].
+    """
+    config = state.get("config", {})
+    exec_config = config.get("execution", {})
+    workers = dict(DEFAULT_WORKERS, **exec_config.get("workers", {}))
+    queue_size = int(exec_config.get("queue_size", 64))
+    eval_config = config.get("evaluation", {})
+
+    provider, model_id, concurrency, ollama_base = target_settings(config)
+    ollama = ollama_settings(config)
+    prompts = state.get("prompts", [])
+    deduper = online_deduper(config)
+
+    lock = threading.Lock()
+    responses = {}        # prompt position -> response
+    claims = {}           # prompt position -> [(claim, representative or None)]
+    representatives = {}  # representative -> claim
+    evidence = {}         # representative -> evidence item
+    verdicts = {}         # representative -> verdict
+
+    prompt_queue = queue.Queue(maxsize=queue_size)
+    extract_queue = queue.Queue(maxsize=queue_size)
+    retrieve_queue = queue.Queue(maxsize=queue_size)
+    verify_queue = queue.Queue(maxsize=queue_size)
+
+    def stopped():
+        return should_stop is not None and should_stop()
+
+    def answer(batch):
+        for position, prompt in batch:
+            # Prompts still queued when the budget runs out are dropped unanswered
+            if stopped():
+                return
+            response = run_prompt(prompt, provider, model_id, ollama_base, ollama)
+            with lock:
+                responses[position] = response
+            extract_queue.put((position, response))
+
+    def extract(batch):
+        if stopped():
+            return
+        mini = {"config": config, "responses": [r for _, r in batch]}
+        extract_claims(mini)
+        for (position, _), item_claims in zip(batch, split_claims_by_response([r for _, r in batch], mini["claims"])):
+            assigned = []
+            new_reps = []
+            for claim in item_claims:
+                rep = None
+                if claim.get("text", ""):
+                    rep, is_new = deduper.add(claim["text"])
+                    if is_new:
+                        new_reps.append(rep)
+                        with lock:
+                            representatives[rep] = claim
+                assigned.append((claim, rep))
+            with lock:
+                claims[position] = assigned
+            for rep in new_reps:
+                retrieve_queue.put(rep)
+
+    def retrieve(batch):
+        if stopped():
+            return
+        mini = {"config": config, "claims": [representatives[rep] for rep in batch]}
+        retrieve_evidence(mini)
+        with lock:
+            for rep, item in zip(batch, mini["evidence"]):
+                evidence[rep] = item
+        for rep in batch:
+            verify_queue.put(rep)
+
+    def verify(batch):
+        if stopped():
+            return
+        mini = {"config": config, "evidence": [evidence[rep] for rep in batch]}
+        verify_claims(mini)
+        with lock:
+            for rep, verdict in zip(batch, mini["verdicts"]):
+                verdicts[rep] = verdict
+        if on_verdict is not None:
+            for verdict in mini["verdicts"]:
+                on_verdict(verdict)
+
+    print(f"Running pipelined stages ({provider}/{model_id}, model concurrency {concurrency}, "
+          f"workers {workers})...")
+    stages = [
+        _start_stage("model", prompt_queue, extract_queue, answer, concurrency, 1),
+        _start_stage("extract", extract_queue, retrieve_queue, extract, int(workers["extract"]),
+                     max(1, int(eval_config.get("extraction_batch_size", 1)))),
+        _start_stage("retrieve", retrieve_queue, verify_queue, retrieve, int(workers["retrieve"]),
+                     max(1, int(config.get("retrieval", {}).get("msearch_batch_size", 50)))),
+        _start_stage("verify", verify_queue, None, verify, int(workers["verify"]),
+                     max(1, int(eval_config.get("verification_batch_size", 1)))),
+    ]
+
+    for position, prompt in enumerate(prompts):
+        item = (position, prompt)
+        # Wait for room a little at a time so a stop is noticed while the queue is full
+        while not stopped():
+            try:
+                prompt_queue.put(item, timeout=0.05)
+                break
+            except queue.Full:
+                continue
+        if stopped():
+            break
+    prompt_queue.put(_DONE)
+    for stage in stages:
+        stage.join()
+
+    # Reassemble in prompt order, matching the sequential workflow's output
+    # Prompts never sent (budget stop) have no response, as in sequential mode
+    state["responses"] = [responses[i] for i in range(len(prompts)) if i in responses]
+    ordered = [pair for i in range(len(prompts)) for pair in claims.get(i, [])]
+    state["claims"] = [claim for claim, _ in ordered]
+
+    rep_order = list(dict.fromkeys(rep for _, rep in ordered if rep is not None))
+    state["evidence"] = [evidence[rep] for rep in rep_order if rep in evidence]
+
+    state["verdicts"] = []
+    seen = set()
+    for claim, rep in ordered:
+        if rep is None or rep not in verdicts:
+            continue
+        verdict = dict(verdicts[rep])
+        verdict["claim"] = claim.get("text", "")
+        if rep in seen:
+            verdict["duplicate_of"] = verdicts[rep].get("claim", "")
+        seen.add(rep)
+        state["verdicts"].append(verdict)
+
+    print(f"Pipeline finished: {len(state['responses'])} responses, {len(state['claims'])} claims, "
+          f"{len(rep_order)} unique, {len(state['verdicts'])} verdicts.")
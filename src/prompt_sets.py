@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from src.files import atomic_write_json
+
+DEFAULT_PROMPT_SETS_PATH = ".cache/prompt_sets"
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def prompt_set_key(index: str, fingerprint: dict, num_prompts: int, categories: list,
+                   generator_model: str) -> str:
+    """
+    Content-address a prompt set: sha256 over the index, its corpus
+    fingerprint and the generation parameters.
+    """
+    payload = json.dumps(
+        {"index": index, "fingerprint": fingerprint, "num_prompts": int(num_prompts),
+         "categories": list(categories), "generator_model": generator_model},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _set_file(directory: str, key: str) -> str:
+    # Keys come from API callers, so only well-formed ones map to a path
+    if not _KEY_RE.match(key or ""):
+        raise ValueError(f"Invalid prompt set key '{key}'")
+    return os.path.join(directory, f"{key}.json")
+
+
+def _write(directory: str, data: dict) -> None:
+    atomic_write_json(_set_file(directory, data["key"]), data, indent=2)
+
+
+def _same_slot(a: dict, b: dict) -> bool:
+    # Same index and generation parameters, corpus fingerprint aside
+    fields = ("index", "num_prompts", "categories", "generator_model")
+    return all(a.get(f) == b.get(f) for f in fields)
+
+
+def get_prompt_set(directory: str, key: str) -> dict | None:
+    path = _set_file(directory, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable prompt set {path}: {e}")
+        return None
+
+
+def list_prompt_sets(directory: str, index: str | None = None) -> list[dict]:
+    """
+    Metadata of every stored prompt set (prompts left out), newest first,
+    optionally only those of one index.
+    """
+    if not os.path.isdir(directory):
+        return []
+    sets = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        data = get_prompt_set(directory, name[:-len(".json")])
+        if data is None or (index is not None and data.get("index") != index):
+            continue
+        summary = {k: v for k, v in data.items() if k != "prompts"}
+        summary["num_stored"] = len(data.get("prompts", []))
+        sets.append(summary)
+    return sorted(sets, key=lambda s: s.get("created_at", ""), reverse=True)
+
+
+def save_prompt_set(directory: str, index: str, fingerprint: dict, num_prompts: int,
+                    categories: list, generator_model: str, prompts: list) -> dict:
+    """
+    Store a generated prompt set under its key and return it.
+    """
+    key = prompt_set_key(index, fingerprint, num_prompts, categories, generator_model)
+    data = {
+        "key": key,
+        "index": index,
+        "fingerprint": fingerprint,
+        "num_prompts": int(num_prompts),
+        "categories": list(categories),
+        "generator_model": generator_model,
+        "created_at": datetime.utcnow().isoformat(),
+        "pinned": False,
+        "prompts": list(prompts),
+    }
+    _write(directory, data)
+    return data
+
+
+def find_prompt_set(directory: str, index: str, fingerprint: dict, num_prompts: int,
+                    categories: list, generator_model: str) -> dict | None:
+    """
+    The prompt set to reuse for these parameters: the one pinned for this
+    index and parameters, whatever corpus it was generated from, else the
+    one generated from exactly this corpus. None if neither exists.
+    """
+    wanted = {"index": index, "num_prompts": int(num_prompts), "categories": list(categories),
+              "generator_model": generator_model}
+    for summary in list_prompt_sets(directory, index=index):
+        if summary.get("pinned") and _same_slot(summary, wanted):
+            return get_prompt_set(directory, summary["key"])
+    return get_prompt_set(directory, prompt_set_key(index, fingerprint, num_prompts, categories, generator_model))
+
+
+def pin_prompt_set(directory: str, key: str, pinned: bool = True) -> dict | None:
+    """
+    Pin (or unpin) a prompt set. A pinned set is reused for its index and
+    parameters even after the corpus changes, and survives invalidation
+    unless explicitly included. Pinning unpins any other set in the same slot.
+    Returns the set's metadata, or None if it does not exist.
+    """
+    data = get_prompt_set(directory, key)
+    if data is None:
+        return None
+    if pinned:
+        for other in list_prompt_sets(directory, index=data.get("index")):
+            if other["key"] != key and other.get("pinned") and _same_slot(other, data):
+                other_data = get_prompt_set(directory, other["key"])
+                other_data["pinned"] = False
+                _write(directory, other_data)
+    data["pinned"] = pinned
+    _write(directory, data)
+    return {k: v for k, v in data.items() if k != "prompts"}
+
+
+def invalidate_prompt_sets(directory: str, key: str | None = None, index: str | None = None,
+                           include_pinned: bool = False) -> int:
+    """
+    Delete one prompt set by key, or every set (of one index, if given).
+    Pinned sets are kept unless include_pinned. Returns how many were deleted.
+    """
+    if key is not None:
+        data = get_prompt_set(directory, key)
+        candidates = [data] if data is not None else []
+    else:
+        candidates = list_prompt_sets(directory, index=index)
+
+    deleted = 0
+    for data in candidates:
+        if data.get("pinned") and not include_pinned:
+            continue
+        os.remove(_set_file(directory, data["key"]))
+        deleted += 1
+    return deleted
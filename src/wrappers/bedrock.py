@@ -1,52 +1,155 @@
 import boto3
+import hashlib
 import json
 import os
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from src.config.loader import load_config
+from src.wrappers.llm_cache import cache_key, get_cache
+from src.wrappers.rate_governor import get_governor
+from src import metrics
+from src.budget import charge as charge_budget
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 
-# Global client
-_bedrock_runtime = None
+# Shared runtime clients, one per region. boto3 clients are thread-safe once
+# built, so concurrent callers reuse the same connection pool.
+_clients: dict = {}
+_clients_lock = threading.Lock()
 
-def _get_client(region=None):
-    global _bedrock_runtime
-    
-    # If a specific region is requested, we might need a separate client
-    # but for simplicity, we'll stick to a primary client unless it's a global call.
+DEFAULT_CLIENT_SETTINGS = {
+    "max_pool_connections": 50,
+    "tcp_keepalive": True,
+    "connect_timeout": 10,
+    "read_timeout": 120,
+}
+_client_settings = dict(DEFAULT_CLIENT_SETTINGS)
+
+# Rough characters-per-token ratio for charging the tokens/minute bucket.
+CHARS_PER_TOKEN = 4
+
+def _region_for_model(model_id: str) -> str:
+    region = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
+    if model_id.startswith("global."):
+        region = "us-east-1"  # Global profiles typically rooted in us-east-1 or us-west-2
+    return region
+
+def configure_clients(settings: dict | None) -> None:
+    """
+    Apply connection settings from the config's bedrock section
+    (max_pool_connections, tcp_keepalive, connect_timeout, read_timeout).
+    Clients built with different settings are dropped and rebuilt lazily.
+    """
+    new_settings = dict(DEFAULT_CLIENT_SETTINGS)
+    new_settings.update({k: v for k, v in (settings or {}).items() if k in DEFAULT_CLIENT_SETTINGS})
+    with _clients_lock:
+        if new_settings != _client_settings:
+            _client_settings.clear()
+            _client_settings.update(new_settings)
+            _clients.clear()
+
+def _get_client(region=None, config: dict | None = None):
+    """
+    Return the pooled bedrock-runtime client for region, creating it on first use.
+    A new client is built with the bedrock section of config (the default
+    config if not given), so CLI and ingest runs get the same pool settings
+    as the API.
+    """
     if region is None:
         region = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
-        
-    # Always use us-east-1 for global profiles if current region isn't us-east-1
-    # or if strictly required by the profile type.
-    
-    return boto3.client(service_name="bedrock-runtime", region_name=region)
 
-def call_llm(prompt: str, system: str = "", model_id_override: str = None) -> str:
+    client = _clients.get(region)
+    if client is not None:
+        return client
+
+    if config is None:
+        config = _load_config_or_empty()
+    configure_clients(config.get("bedrock"))
+    with _clients_lock:
+        client = _clients.get(region)
+        if client is None:
+            client_config = BotoConfig(
+                max_pool_connections=int(_client_settings["max_pool_connections"]),
+                tcp_keepalive=bool(_client_settings["tcp_keepalive"]),
+                connect_timeout=_client_settings["connect_timeout"],
+                read_timeout=_client_settings["read_timeout"],
+                # Retries are handled by the rate governor, which needs to see throttles
+                retries={"total_max_attempts": 1},
+            )
+            client = boto3.session.Session().client(
+                service_name="bedrock-runtime", region_name=region, config=client_config
+            )
+            _clients[region] = client
+    return client
+
+def prewarm_clients(config: dict | None = None) -> list[str]:
+    """
+    Build the clients the configured models will use so credential resolution
+    and endpoint setup happen at startup rather than on the first claim.
+    Returns the regions that were warmed.
+    """
+    if config is None:
+        config = load_config()
+    configure_clients(config.get("bedrock"))
+
+    regions = {os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+    for section in ("verification_model", "target_model"):
+        model = config.get(section, {})
+        if model.get("provider", "bedrock") == "bedrock" and model.get("model_id"):
+            regions.add(_region_for_model(model["model_id"]))
+
+    for region in sorted(regions):
+        _get_client(region=region, config=config)
+    return sorted(regions)
+
+def _get_llm_cache(config: dict | None):
+    """
+    Resolve the completion cache, loading config if the caller did not.
+    A missing or unreadable config simply disables caching.
+    """
+    if config is None:
+        try:
+            config = load_config()
+        except Exception:
+            return None
+    return get_cache(config)
+
+def call_llm(prompt: str, system: str = "", model_id_override: str = None,
+             max_tokens: int = 1000, use_cache: bool = True) -> str:
     """
     Call Bedrock LLM.
+    Completions are served from the on-disk llm_cache when it is enabled in
+    config (see src.wrappers.llm_cache); pass use_cache=False or set
+    LLM_CACHE_BYPASS=1 to always call the model.
     Args:
         prompt: The user prompt
         system: System instruction
         model_id_override: Optional model ID to use instead of config default
+        max_tokens: Maximum number of tokens to generate
+        use_cache: Whether to read/write the completion cache
     """
+    config = None
     if model_id_override:
         model_id = model_id_override
     else:
         config = load_config()
         model_id = config.get("verification_model", {}).get("model_id", "anthropic.claude-v2")
 
-    # Determine region based on model_id
-    region = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
-    if model_id.startswith("global."):
-        region = "us-east-1"  # Global profiles typically rooted in us-east-1 or us-west-2
-    
-    client = _get_client(region=region)
+    cache = _get_llm_cache(config) if use_cache else None
+    key = None
+    if cache is not None:
+        key = cache_key(model_id, system, prompt, {"max_tokens": max_tokens})
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    client = _get_client(region=_region_for_model(model_id), config=config)
     
     # Claude Messages API format (v3, v2, and inference profiles with 'claude')
     if "claude" in model_id:
         body = json.dumps({
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
+            "max_tokens": max_tokens,
             "messages": [
                 {
                     "role": "user",
@@ -56,63 +159,172 @@ def call_llm(prompt: str, system: str = "", model_id_override: str = None) -> st
             "system": system
         })
         
-        # Invoke model with retry logic for throttling
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = client.invoke_model(
+        # Invoke model through the rate governor (buckets, AIMD concurrency, backoff)
+        governor = get_governor(model_id, config if config is not None else _load_config_or_empty())
+
+        def invoke():
+            with metrics.timed("call_seconds", backend="bedrock", op="invoke_model", model=model_id):
+                return client.invoke_model(
                     modelId=model_id,
                     body=body, # body is already a JSON string
                     accept="application/json",
                     contentType="application/json"
                 )
-                response_body = json.loads(response.get("body").read())
-                
-                # Claude 3 (Messages API)
-                if "content" in response_body:
-                    return response_body["content"][0]["text"]
-                # Claude 2 (Completion API)
-                elif "completion" in response_body:
-                    return response_body["completion"].strip()
-                else:
-                    return str(response_body)
-                    
-            except ClientError as e:
-                if "ThrottlingException" in str(e) and attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2
-                    print(f"⚠️ Throttled by Bedrock. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                print(f"Error calling Bedrock: {e}")
-                raise e
-            except Exception as e:
-                print(f"An unexpected error occurred: {e}")
-                raise e
+
+        try:
+            response = governor.call(invoke, tokens=len(system + prompt) // CHARS_PER_TOKEN + max_tokens)
+            response_body = json.loads(response.get("body").read())
+        except ClientError as e:
+            metrics.inc("llm_calls_total", backend="bedrock", model=model_id, outcome="error")
+            print(f"Error calling Bedrock: {e}")
+            raise e
+        except Exception as e:
+            metrics.inc("llm_calls_total", backend="bedrock", model=model_id, outcome="error")
+            print(f"An unexpected error occurred: {e}")
+            raise e
+
+        metrics.inc("llm_calls_total", backend="bedrock", model=model_id, outcome="ok")
+        usage = response_body.get("usage", {})
+        metrics.inc("llm_tokens_total", usage.get("input_tokens", 0), model=model_id, direction="input")
+        metrics.inc("llm_tokens_total", usage.get("output_tokens", 0), model=model_id, direction="output")
+        # Charge the run budget; estimate from text length if usage is missing
+        charge_budget(
+            usage.get("input_tokens", len(system + prompt) // CHARS_PER_TOKEN)
+            + usage.get("output_tokens", max_tokens)
+        )
+
+        # Claude 3 (Messages API)
+        if "content" in response_body:
+            text = response_body["content"][0]["text"]
+        # Claude 2 (Completion API)
+        elif "completion" in response_body:
+            text = response_body["completion"].strip()
+        else:
+            return str(response_body)
+
+        if cache is not None:
+            cache.put(key, text)
+        return text
     else:
         # Fallback for Titan Text or others (simplified)
         raise NotImplementedError(f"Model {model_id} interaction not implemented.")
 
-def embed(text: str) -> list[float]:
+EMBEDDING_CACHE_PATH = ".cache/embedding_cache.sqlite3"
+
+# Output dimensions of the supported Titan embedding models
+EMBEDDING_DIMS = {
+    "amazon.titan-embed-text-v1": 1536,
+    "amazon.titan-embed-text-v2:0": 1024,
+    "amazon.titan-embed-g1-text-02": 1536,
+}
+
+def _embedding_model_id() -> str:
+    # Use config or env var for model ID
+    return os.environ.get("BEDROCK_EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v1")
+
+def embedding_dims() -> int:
     """
-    Generate embeddings using Titan Embeddings from config or default.
+    Vector size produced by the configured embedding model.
     """
-    client = _get_client()
-    # Use config or env var for model ID
-    model_id = os.environ.get("BEDROCK_EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v1")
-    
+    return EMBEDDING_DIMS.get(_embedding_model_id(), 1536)
+
+def _embedding_cache_key(model_id: str, text: str) -> str:
+    return f"{model_id}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+def _invoke_embed(text: str, model_id: str, config: dict | None = None) -> list[float]:
+    client = _get_client(config=config)
     body = json.dumps({
         "inputText": text
     })
-    
+    governor = get_governor(model_id, config if config is not None else _load_config_or_empty())
+
+    def invoke():
+        with metrics.timed("call_seconds", backend="bedrock", op="embed", model=model_id):
+            return client.invoke_model(
+                body=body,
+                modelId=model_id,
+                accept="application/json",
+                contentType="application/json"
+            )
+
     try:
-        response = client.invoke_model(
-            body=body,
-            modelId=model_id,
-            accept="application/json",
-            contentType="application/json"
-        )
+        response = governor.call(invoke, tokens=len(text) // CHARS_PER_TOKEN)
         response_body = json.loads(response.get("body").read())
-        return response_body["embedding"]
     except ClientError as e:
+        metrics.inc("llm_calls_total", backend="bedrock", model=model_id, outcome="error")
         print(f"Error calling Bedrock Embeddings: {e}")
         raise e
+    metrics.inc("llm_calls_total", backend="bedrock", model=model_id, outcome="ok")
+    metrics.inc("llm_tokens_total", response_body.get("inputTextTokenCount", 0),
+                model=model_id, direction="input")
+    return response_body["embedding"]
+
+def _load_config_or_empty() -> dict:
+    try:
+        return load_config()
+    except Exception:
+        return {}
+
+def embed(text: str) -> list[float]:
+    """
+    Generate embeddings using Titan Embeddings from config or default.
+    Served from the embedding_cache when it is enabled in config.
+    """
+    model_id = _embedding_model_id()
+    config = _load_config_or_empty()
+    cache = get_cache(config, "embedding_cache", EMBEDDING_CACHE_PATH)
+    if cache is not None:
+        key = _embedding_cache_key(model_id, text)
+        cached = cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+
+    embedding = _invoke_embed(text, model_id, config)
+    if cache is not None:
+        cache.put(key, json.dumps(embedding))
+    return embedding
+
+def embed_many(texts: list[str], config: dict | None = None) -> list[list[float] | None]:
+    """
+    Embed a batch of texts, in order.
+    Identical texts are embedded once, cached vectors (embedding_cache,
+    keyed by model id and sha256 of the text) are reused, and the remaining
+    texts are sent concurrently, bounded by bedrock.embed_concurrency.
+    A text whose embedding fails gets None in its slot.
+    """
+    if config is None:
+        config = _load_config_or_empty()
+    model_id = _embedding_model_id()
+    cache = get_cache(config, "embedding_cache", EMBEDDING_CACHE_PATH)
+    concurrency = max(1, int(config.get("bedrock", {}).get("embed_concurrency", 8)))
+
+    vectors: dict[str, list[float] | None] = {}
+    pending = []
+    for text in texts:
+        key = _embedding_cache_key(model_id, text)
+        if key in vectors:
+            continue
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            vectors[key] = json.loads(cached)
+        else:
+            vectors[key] = None
+            pending.append(key)
+
+    if pending:
+        by_key = {_embedding_cache_key(model_id, t): t for t in texts}
+
+        def _embed_one(key):
+            try:
+                return key, _invoke_embed(by_key[key], model_id, config)
+            except Exception as e:
+                print(f"Embedding failed for text '{by_key[key][:30]}…': {e}")
+                return key, None
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as pool:
+            for key, embedding in pool.map(_embed_one, pending):
+                vectors[key] = embedding
+                if embedding is not None and cache is not None:
+                    cache.put(key, json.dumps(embedding))
+
+    return [vectors[_embedding_cache_key(model_id, t)] for t in texts]
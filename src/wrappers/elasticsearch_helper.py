@@ -1,9 +1,52 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
+from typing import Iterable, Protocol
 from src.config.loader import load_config
+from src import metrics
+import hashlib
 import os
+import time
+
+# Retrieval backends behind this module's functions: "elasticsearch" (default)
+# or "local", an in-process index persisted to disk (src.wrappers.local_index).
+# Selected with retrieval.backend in the config.
+RETRIEVAL_BACKENDS = ("elasticsearch", "local")
+
+# Fields returned for evidence hits; the embedding vector is never fetched back
+SOURCE_FIELDS = ["content", "source", "heading", "chunk_index", "start_offset", "end_offset"]
+
+# Retries (with exponential backoff from the initial delay, in seconds) for
+# bulk items Elasticsearch rejects with 429 Too Many Requests
+BULK_MAX_RETRIES = 3
+BULK_INITIAL_BACKOFF = 2
 
 _es_client = None
 
+class RetrievalBackend(Protocol):
+    """
+    Storage and search behind this module's helpers. Searches take
+    Elasticsearch request bodies (see _bm25_body/_knn_body) and return
+    Elasticsearch-shaped hits ({"_id", "_score", "_source"}).
+    """
+
+    def index_doc(self, index: str, doc_id: str, body: dict) -> None: ...
+
+    def bulk_index(self, index: str, docs: Iterable[tuple[str, dict]], chunk_size: int,
+                   max_chunk_bytes: int, thread_count: int, max_failures_reported: int) -> dict: ...
+
+    def delete_docs(self, index: str, doc_ids: Iterable[str], chunk_size: int) -> int: ...
+
+    def ensure_index(self, index: str, dims: int | None) -> None: ...
+
+    def clear_index(self, index: str, dims: int | None) -> None: ...
+
+    def search(self, index: str, body: dict) -> list[dict]: ...
+
+    def msearch(self, index: str, bodies: list[dict], batch_size: int) -> list[list[dict]]: ...
+
+    def sample(self, index: str, size: int, seed: int | None) -> list[dict]: ...
+
+    def doc_ids(self, index: str, scan_size: int) -> list[str]: ...
+
 def _get_es_client():
     global _es_client
     if _es_client is None:
@@ -15,66 +58,436 @@ def _get_es_client():
         _es_client = Elasticsearch(f"http://{host}:{port}")
     return _es_client
 
-def index_doc(index: str, doc_id: str, body: dict) -> None:
+def get_backend(config: dict | None = None) -> RetrievalBackend:
     """
-    Index a document in Elasticsearch.
+    The retrieval backend selected by config's retrieval.backend. config is
+    the run's config; the default config is loaded if not given.
     """
-    client = _get_es_client()
-    client.index(index=index, id=doc_id, document=body)
-    client.indices.refresh(index=index)
+    if config is None:
+        config = load_config()
+    retrieval_config = config.get("retrieval", {})
+    backend = retrieval_config.get("backend", "elasticsearch")
+    if backend not in RETRIEVAL_BACKENDS:
+        raise ValueError(f"Unknown retrieval backend '{backend}'. Expected one of {RETRIEVAL_BACKENDS}.")
+    if backend == "elasticsearch":
+        return ElasticsearchBackend(config)
+    # Imported lazily so NumPy is only needed for the local backend
+    from src.wrappers.local_index import DEFAULT_LOCAL_PATH, LocalBackend
+    return LocalBackend(
+        base_path=retrieval_config.get("local_path", DEFAULT_LOCAL_PATH),
+        ivf_min_docs=int(retrieval_config.get("ivf_min_docs", 20000)),
+        ivf_nprobe=int(retrieval_config.get("ivf_nprobe", 8)),
+    )
 
-def clear_index(index: str) -> None:
+def index_definition(dims: int) -> dict:
     """
-    Delete and recreate an index to clear all data.
+    Settings and mappings for a trusted-docs index: English-stemmed text
+    analysis for BM25 and an HNSW-indexed dense_vector for kNN.
     """
-    client = _get_es_client()
-    if client.indices.exists(index=index):
-        client.indices.delete(index=index)
-    client.indices.create(index=index)
-    print(f"Index '{index}' cleared.")
+    return {
+        "settings": {
+            "analysis": {
+                "filter": {
+                    "docs_english_stemmer": {"type": "stemmer", "language": "english"},
+                    "docs_english_stop": {"type": "stop", "stopwords": "_english_"},
+                },
+                "analyzer": {
+                    "docs_text": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding", "docs_english_stop", "docs_english_stemmer"],
+                    }
+                },
+            }
+        },
+        "mappings": {
+            "properties": {
+                "content": {
+                    "type": "text",
+                    "analyzer": "docs_text",
+                    # Unstemmed copy for exact identifiers and parameter names
+                    "fields": {"exact": {"type": "text", "analyzer": "standard"}},
+                },
+                "source": {"type": "keyword"},
+                "heading": {"type": "text", "analyzer": "docs_text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}},
+                "chunk_index": {"type": "integer"},
+                "start_offset": {"type": "long"},
+                "end_offset": {"type": "long"},
+                "embedding": {
+                    "type": "dense_vector",
+                    "dims": dims,
+                    "index": True,
+                    "similarity": "cosine",
+                    "index_options": {"type": "hnsw", "m": 16, "ef_construction": 100},
+                },
+            }
+        },
+    }
+
+def _resolve_dims(dims: int | None, config: dict | None = None) -> int:
+    if dims is not None:
+        return dims
+    if config is None:
+        config = load_config()
+    configured = config.get("elasticsearch", {}).get("embedding_dims")
+    if configured:
+        return int(configured)
+    from src.wrappers.bedrock import embedding_dims
+    return embedding_dims()
 
-def search_docs(query: str, index: str = "trusted_docs") -> list[dict]:
+class ElasticsearchBackend:
     """
-    Search documents using a simple text query.
+    RetrievalBackend on the shared Elasticsearch client. config is the
+    run's config, used to size new indexes.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    def index_doc(self, index: str, doc_id: str, body: dict) -> None:
+        client = _get_es_client()
+        with metrics.timed("call_seconds", backend="elasticsearch", op="index"):
+            client.index(index=index, id=doc_id, document=body)
+            client.indices.refresh(index=index)
+
+    def bulk_index(self, index: str, docs: Iterable[tuple[str, dict]], chunk_size: int,
+                   max_chunk_bytes: int, thread_count: int, max_failures_reported: int) -> dict:
+        client = _get_es_client()
+        stats = {"indexed": 0, "errors": 0, "failures": [], "failed_ids": []}
+
+        def record(ok, info):
+            if ok:
+                stats["indexed"] += 1
+                return
+            stats["errors"] += 1
+            item = next(iter(info.values()), {}) if isinstance(info, dict) else {}
+            stats["failed_ids"].append(item.get("_id"))
+            if len(stats["failures"]) < max_failures_reported:
+                stats["failures"].append({
+                    "id": item.get("_id"),
+                    "status": item.get("status"),
+                    "error": item.get("error", str(info)),
+                })
+
+        def actions(pairs, in_flight=None):
+            for doc_id, body in pairs:
+                if in_flight is not None:
+                    in_flight[doc_id] = body
+                yield {"_op_type": "index", "_index": index, "_id": doc_id, "_source": body}
+
+        started = time.perf_counter()
+        rejected = []
+        if thread_count > 1:
+            # parallel_bulk has no retries: docs rejected with 429 are resent
+            # afterwards through streaming_bulk's backoff. Only bodies still
+            # awaiting their result are held, so memory stays bounded.
+            in_flight = {}
+            for ok, info in helpers.parallel_bulk(
+                client, actions(docs, in_flight), thread_count=thread_count, chunk_size=chunk_size,
+                max_chunk_bytes=max_chunk_bytes, raise_on_error=False, raise_on_exception=False,
+            ):
+                item = next(iter(info.values()), {}) if isinstance(info, dict) else {}
+                body = in_flight.pop(item.get("_id"), None)
+                if not ok and item.get("status") == 429 and body is not None:
+                    rejected.append((item["_id"], body))
+                else:
+                    record(ok, info)
+            if rejected:
+                print(f"Retrying {len(rejected)} docs rejected with 429...")
+                time.sleep(BULK_INITIAL_BACKOFF)
+        if thread_count <= 1 or rejected:
+            for ok, info in helpers.streaming_bulk(
+                client, actions(rejected or docs), chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                raise_on_error=False, raise_on_exception=False,
+                max_retries=BULK_MAX_RETRIES, initial_backoff=BULK_INITIAL_BACKOFF,
+            ):
+                record(ok, info)
+
+        client.indices.refresh(index=index)
+        # Includes time spent producing docs (e.g. embedding), since bulk pulls them lazily
+        metrics.observe("call_seconds", time.perf_counter() - started, backend="elasticsearch", op="bulk")
+        return stats
+
+    def delete_docs(self, index: str, doc_ids: Iterable[str], chunk_size: int) -> int:
+        client = _get_es_client()
+        actions = ({"_op_type": "delete", "_index": index, "_id": doc_id} for doc_id in doc_ids)
+        deleted = 0
+        for ok, info in helpers.streaming_bulk(
+            client, actions, chunk_size=chunk_size, raise_on_error=False,
+            raise_on_exception=False, ignore_status=(404,),
+        ):
+            item = info.get("delete", {}) if isinstance(info, dict) else {}
+            if ok and item.get("result") == "deleted":
+                deleted += 1
+            elif not ok:
+                print(f"Failed to delete {item.get('_id')}: {item.get('error')}")
+        client.indices.refresh(index=index)
+        return deleted
+
+    def ensure_index(self, index: str, dims: int | None) -> None:
+        client = _get_es_client()
+        if not client.indices.exists(index=index):
+            client.indices.create(index=index, **index_definition(_resolve_dims(dims, self.config)))
+            print(f"Index '{index}' created.")
+
+    def clear_index(self, index: str, dims: int | None) -> None:
+        client = _get_es_client()
+        if client.indices.exists(index=index):
+            client.indices.delete(index=index)
+        client.indices.create(index=index, **index_definition(_resolve_dims(dims, self.config)))
+
+    def search(self, index: str, body: dict) -> list[dict]:
+        client = _get_es_client()
+        op = "knn_search" if "knn" in body else "search"
+        with metrics.timed("call_seconds", backend="elasticsearch", op=op):
+            response = client.search(index=index, **body)
+        return response["hits"]["hits"]
+
+    def msearch(self, index: str, bodies: list[dict], batch_size: int) -> list[list[dict]]:
+        client = _get_es_client()
+        results = []
+        for start in range(0, len(bodies), batch_size):
+            batch = bodies[start:start + batch_size]
+            searches = []
+            for body in batch:
+                searches.append({"index": index})
+                searches.append(body)
+            try:
+                with metrics.timed("call_seconds", backend="elasticsearch", op="msearch"):
+                    responses = client.msearch(searches=searches)["responses"]
+            except Exception as e:
+                print(f"Multi-search batch of {len(batch)} failed: {e}")
+                results.extend([] for _ in batch)
+                continue
+            for response in responses:
+                if "error" in response:
+                    print(f"Search in multi-search batch failed: {response['error']}")
+                    results.append([])
+                else:
+                    results.append(response["hits"]["hits"])
+        return results
+
+    def sample(self, index: str, size: int, seed: int | None) -> list[dict]:
+        random_score = {"seed": seed, "field": "_seq_no"} if seed is not None else {}
+        return self.search(index, {
+            "query": {"function_score": {"query": {"match_all": {}}, "random_score": random_score,
+                                         "boost_mode": "replace"}},
+            "size": size,
+            "_source": {"includes": SOURCE_FIELDS},
+        })
+
+    def doc_ids(self, index: str, scan_size: int) -> list[str]:
+        client = _get_es_client()
+        with metrics.timed("call_seconds", backend="elasticsearch", op="scan"):
+            return [
+                hit["_id"] for hit in helpers.scan(
+                    client, index=index, query={"query": {"match_all": {}}}, _source=False, size=scan_size,
+                )
+            ]
+
+def index_doc(index: str, doc_id: str, body: dict, config: dict | None = None) -> None:
     """
-    client = _get_es_client()
-    response = client.search(index=index, query={"match": {"content": query}})
-    return [hit["_source"] for hit in response["hits"]["hits"]]
+    Index a document and refresh so it is searchable right away.
+    """
+    get_backend(config).index_doc(index, doc_id, body)
 
-def vector_search(text: str, index: str = "trusted_docs", k: int = 5) -> list[dict]:
+def bulk_index(index: str, docs: Iterable[tuple[str, dict]], chunk_size: int = 500,
+               max_chunk_bytes: int = 10 * 1024 * 1024, thread_count: int = 4,
+               max_failures_reported: int = 100, config: dict | None = None) -> dict:
     """
-    Search documents using vector similarity (Must be implemented with embeddings).
-    This function assumes the index has a dense_vector mapping and documents have embeddings.
-    
-    Note: 'text' input needs to be embedded first. This wrapper accepts text and calls embed().
-    Using separate Bedrock wrapper for embedding to avoid circular deps if possible, 
-    but commonly this helper might just take the vector.
-    However, the signature says `text: str`. So we import embed.
+    Stream (doc_id, body) pairs into an index with the bulk API.
+    Requests are flushed every chunk_size docs or max_chunk_bytes bytes,
+    sent by thread_count parallel workers, and the index is refreshed once
+    at the end. Per-item failures are counted, the IDs of all failed docs
+    are returned in stats["failed_ids"] and details of the first
+    max_failures_reported in stats["failures"].
     """
-    # Avoid circular import by importing inside function if needed, 
-    # but bedrock wrapper is a sibling.
-    from src.wrappers.bedrock import embed
-    
-    vector = embed(text)
-    
-    client = _get_es_client()
-    
-    # KNN search query for Elasticsearch 8.x+
-    # Adjust query based on ES version. Assuming >= 8.0
-    query = {
+    return get_backend(config).bulk_index(index, docs, chunk_size, max_chunk_bytes, thread_count,
+                                          max_failures_reported)
+
+def delete_docs(index: str, doc_ids: Iterable[str], chunk_size: int = 500,
+                config: dict | None = None) -> int:
+    """
+    Delete documents by ID with the bulk API, ignoring IDs that are already
+    gone, then refresh the index. Returns the number of documents deleted.
+    """
+    return get_backend(config).delete_docs(index, doc_ids, chunk_size)
+
+def ensure_index(index: str, dims: int | None = None, config: dict | None = None) -> None:
+    """
+    Create the index with the managed mapping if it doesn't exist yet.
+    """
+    get_backend(config).ensure_index(index, dims)
+
+def clear_index(index: str, dims: int | None = None, config: dict | None = None) -> None:
+    """
+    Delete and recreate an index to clear all data.
+    The index is recreated with the managed mapping (see index_definition);
+    dims defaults to elasticsearch.embedding_dims or the embedding model's size.
+    """
+    get_backend(config).clear_index(index, dims)
+    print(f"Index '{index}' cleared.")
+
+def _bm25_body(query: str, size: int) -> dict:
+    return {
+        "query": {"match": {"content": query}},
+        "size": size,
+        "_source": {"includes": SOURCE_FIELDS},
+    }
+
+def _knn_body(vector: list[float], k: int, num_candidates: int) -> dict:
+    return {
         "knn": {
             "field": "embedding",
             "query_vector": vector,
             "k": k,
-            "num_candidates": 100
-        }
+            "num_candidates": max(num_candidates, k),
+        },
+        "size": k,
+        "_source": {"includes": SOURCE_FIELDS},
     }
-    
+
+def msearch_hits(bodies: list[dict], index: str, batch_size: int = 50,
+                 config: dict | None = None) -> list[list[dict]]:
+    """
+    Run search bodies through _msearch, batch_size searches per request.
+    Returns the hits of each search in order; a search (or batch) that fails
+    yields [] so one bad query doesn't sink the rest.
+    """
+    return get_backend(config).msearch(index, bodies, batch_size)
+
+def search_docs(query: str, index: str = "trusted_docs", config: dict | None = None) -> list[dict]:
+    """
+    Search documents using a simple text query.
+    """
+    return [hit["_source"] for hit in get_backend(config).search(index, _bm25_body(query, 10))]
+
+def vector_search(text: str, index: str = "trusted_docs", k: int = 5,
+                  num_candidates: int = 100, config: dict | None = None) -> list[dict]:
+    """
+    Search documents by embedding similarity (kNN on the dense_vector field).
+    The text is embedded with the Bedrock embedding model first.
+    Returns [] if the index has no usable vector mapping.
+    """
+    # Imported here: the bedrock wrapper is a sibling module
+    from src.wrappers.bedrock import embed
+
+    vector = embed(text)
+
     try:
-        response = client.search(index=index, body=query)
-        return [hit["_source"] for hit in response["hits"]["hits"]]
+        hits = get_backend(config).search(index, _knn_body(vector, k, num_candidates))
+        return [hit["_source"] for hit in hits]
     except Exception as e:
-        # Fallback for older ES versions or different valid query structure
-        # Script score query common for older versions
         print(f"Vector search failed (maybe index mapping missing or ES version mismatch): {e}")
         return []
+
+def rrf_fuse(result_lists: list[list[dict]], rrf_k: int = 60) -> list[dict]:
+    """
+    Reciprocal rank fusion of ranked hit lists: each hit scores
+    sum(1 / (rrf_k + rank)) over the lists it appears in, keyed by _id.
+    """
+    scores = {}
+    hits_by_id = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            doc_id = hit["_id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+            hits_by_id.setdefault(doc_id, hit)
+    ranked = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+    return [hits_by_id[doc_id] for doc_id in ranked]
+
+def hybrid_search(text: str, index: str = "trusted_docs", k: int = 10,
+                  num_candidates: int = 100, rrf_k: int = 60,
+                  vector: list[float] | None = None, config: dict | None = None) -> list[dict]:
+    """
+    Hybrid retrieval: BM25 and kNN result lists (k each) fused with
+    reciprocal rank fusion. Pass a precomputed vector to skip embedding.
+    Degrades to BM25 only if the kNN side fails.
+    """
+    backend = get_backend(config)
+    bm25 = backend.search(index, _bm25_body(text, k))
+    try:
+        if vector is None:
+            from src.wrappers.bedrock import embed
+            vector = embed(text)
+        knn = backend.search(index, _knn_body(vector, k, num_candidates))
+    except Exception as e:
+        print(f"kNN side of hybrid search failed, using BM25 only: {e}")
+        knn = []
+    return [hit["_source"] for hit in rrf_fuse([bm25, knn], rrf_k=rrf_k)]
+
+def multi_search_docs(texts: list[str], index: str = "trusted_docs", mode: str = "bm25",
+                      k: int = 10, num_candidates: int = 100, rrf_k: int = 60,
+                      vectors: list[list[float] | None] | None = None,
+                      batch_size: int = 50, config: dict | None = None) -> list[list[dict]]:
+    """
+    Retrieve documents for many queries with batched _msearch requests.
+    mode="bm25" runs one match query per text; mode="hybrid" also runs a
+    kNN query for every text with a vector and fuses both lists with RRF.
+    Returns one list of _source dicts (without embeddings) per text.
+    """
+    bodies = [_bm25_body(text, k) for text in texts]
+    knn_slots = []
+    if mode == "hybrid" and vectors is not None:
+        for i, vector in enumerate(vectors):
+            if vector is not None:
+                knn_slots.append(i)
+                bodies.append(_knn_body(vector, k, num_candidates))
+
+    hits = msearch_hits(bodies, index, batch_size=batch_size, config=config)
+    bm25_hits = hits[:len(texts)]
+    knn_hits = {i: h for i, h in zip(knn_slots, hits[len(texts):])}
+
+    results = []
+    for i, text_hits in enumerate(bm25_hits):
+        if i in knn_hits:
+            text_hits = rrf_fuse([text_hits, knn_hits[i]], rrf_k=rrf_k)
+        results.append([hit["_source"] for hit in text_hits])
+    return results
+
+def _stratify(docs: list[dict], size: int, field: str) -> list[dict]:
+    """
+    Take up to size docs round-robin across the values of field (e.g. one
+    per source file in turn), keeping the input order within each value.
+    """
+    groups: dict = {}
+    for doc in docs:
+        groups.setdefault(doc.get(field), []).append(doc)
+    picked = []
+    queues = [iter(group) for group in groups.values()]
+    while queues and len(picked) < size:
+        remaining = []
+        for group in queues:
+            doc = next(group, None)
+            if doc is not None:
+                picked.append(doc)
+                remaining.append(group)
+                if len(picked) == size:
+                    break
+        queues = remaining
+    return picked
+
+def sample_docs(index: str = "trusted_docs", size: int = 10, seed: int | None = None,
+                stratify_by: str | None = None, oversample: int = 4,
+                config: dict | None = None) -> list[dict]:
+    """
+    Return up to size random documents (_source without embeddings) from an
+    index, scored with random_score (reproducible for a given seed). With
+    stratify_by, size * oversample random docs are fetched and spread
+    round-robin across that field's values so every source is represented.
+    """
+    fetch = min(size * oversample, 10000) if stratify_by else size
+    docs = [hit["_source"] for hit in get_backend(config).sample(index, fetch, seed)]
+    return _stratify(docs, size, stratify_by) if stratify_by else docs
+
+def corpus_fingerprint(index: str = "trusted_docs", scan_size: int = 5000,
+                       config: dict | None = None) -> dict:
+    """
+    Identify the current contents of an index: {"doc_count", "digest"}, where
+    digest is a sha256 over the sorted document IDs. Ingested chunk IDs are
+    derived from file path, position and text, so any content change moves
+    the digest. Only IDs are read, no sources.
+    """
+    doc_ids = get_backend(config).doc_ids(index, scan_size)
+    digest = hashlib.sha256("\n".join(sorted(doc_ids)).encode("utf-8")).hexdigest()
+    return {"doc_count": len(doc_ids), "digest": digest}
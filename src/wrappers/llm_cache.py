@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Setting this env var to a truthy value skips the cache for every call.
+BYPASS_ENV_VAR = "LLM_CACHE_BYPASS"
+
+DEFAULT_PATH = ".cache/llm_cache.sqlite3"
+
+
+def cache_key(model_id: str, system: str, prompt: str, params: dict) -> str:
+    """
+    Content-address an LLM call: sha256 over the model, system prompt,
+    user prompt and generation parameters.
+    """
+    payload = json.dumps(
+        {"model_id": model_id, "system": system, "prompt": prompt, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    On-disk SQLite store for LLM completions with TTL expiry and
+    least-recently-used eviction once max_entries or max_bytes is exceeded.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = 50000,
+                 max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float | None = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+        self._conn.commit()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> str | None:
+        """
+        Return the cached value for key, or None on a miss or expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """
+        Store value under key and evict entries beyond the configured limits.
+        """
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from least to most recently used, dropping until within limits
+        to_delete = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_caches: dict[str, LLMCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(config: dict, section: str = "llm_cache",
+              default_path: str = DEFAULT_PATH) -> LLMCache | None:
+    """
+    Return the shared cache described by the given config section
+    (llm_cache by default), or None when caching is disabled or bypassed
+    via LLM_CACHE_BYPASS.
+    """
+    cache_config = config.get(section, {}) or {}
+    if not cache_config.get("enabled", False):
+        return None
+    if os.environ.get(BYPASS_ENV_VAR, "").lower() in ("1", "true", "yes"):
+        return None
+
+    path = cache_config.get("path", default_path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = LLMCache(
+                path=path,
+                max_entries=int(cache_config.get("max_entries", 50000)),
+                max_bytes=int(cache_config.get("max_bytes", 256 * 1024 * 1024)),
+                ttl_seconds=cache_config.get("ttl_seconds"),
+            )
+            _caches[path] = cache
+    return cache
+
+
+def cache_stats() -> dict:
+    """
+    Hit/miss counters and size for every cache opened in this process.
+    """
+    with _caches_lock:
+        return {path: cache.stats() for path, cache in _caches.items()}
@@ -0,0 +1,402 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import numpy as np
+
+DEFAULT_LOCAL_PATH = ".cache/local_index"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with",
+}
+
+
+def _tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LocalIndex:
+    """
+    In-process replacement for an Elasticsearch index, persisted to a local
+    directory. Text search is BM25 over NumPy posting arrays; vector search is
+    cosine similarity over a memory-mapped matrix of normalized embeddings,
+    brute force for small corpora and IVF (k-means lists) above ivf_min_docs.
+
+    Writes are buffered in memory and persisted on refresh(), like an
+    Elasticsearch refresh. Refreshes that add or remove only docs without
+    vectors are appended to docs.jsonl instead of rewriting it, and the
+    search structures are rebuilt on the first read after a refresh, so an
+    index that is only written to (e.g. the audit log) never pays for them.
+    """
+
+    def __init__(self, directory: str, k1: float = 1.2, b: float = 0.75,
+                 ivf_min_docs: int = 20000, ivf_nprobe: int = 8):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.ivf_min_docs = ivf_min_docs
+        self.ivf_nprobe = ivf_nprobe
+        self._lock = threading.RLock()
+        self._docs: dict[str, dict] = {}
+        self._vectors: dict[str, np.ndarray] = {}
+        self._dirty = False
+        self._changed: dict[str, None] = {}  # IDs written since the last persist, in order
+        self._rewrite = False                 # vector rows moved: append is not enough
+        self._log_lines = 0                   # records in docs.jsonl, incl. superseded ones
+        self._load()
+
+    # -- persistence ---------------------------------------------------------
+
+    @property
+    def _docs_path(self) -> str:
+        return os.path.join(self.directory, "docs.jsonl")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    def _load(self) -> None:
+        has_vector = {}
+        if os.path.exists(self._docs_path):
+            with open(self._docs_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._log_lines += 1
+                    # Later records (appended refreshes) supersede earlier ones
+                    if record.get("deleted"):
+                        self._docs.pop(record["_id"], None)
+                        has_vector.pop(record["_id"], None)
+                    else:
+                        self._docs[record["_id"]] = record["_source"]
+                        has_vector[record["_id"]] = record.get("has_vector", False)
+        if os.path.exists(self._vectors_path):
+            matrix = np.load(self._vectors_path, mmap_mode="r")
+            row = 0
+            for doc_id in self._docs:
+                if has_vector[doc_id]:
+                    self._vectors[doc_id] = matrix[row]
+                    row += 1
+        self._snapshot()
+
+    def _record(self, doc_id: str) -> str:
+        if doc_id not in self._docs:
+            return json.dumps({"_id": doc_id, "deleted": True}) + "\n"
+        return json.dumps({
+            "_id": doc_id,
+            "_source": self._docs[doc_id],
+            "has_vector": doc_id in self._vectors,
+        }) + "\n"
+
+    def _persist(self) -> None:
+        """
+        Append the changed records to docs.jsonl when the vector rows are
+        unchanged; rewrite both files otherwise, or once superseded records
+        make up over half the log.
+        """
+        appendable = (not self._rewrite and os.path.exists(self._docs_path)
+                      and self._log_lines + len(self._changed) <= 2 * max(len(self._docs), 1))
+        if appendable:
+            with open(self._docs_path, "a", encoding="utf-8") as f:
+                f.write("".join(self._record(doc_id) for doc_id in self._changed))
+            self._log_lines += len(self._changed)
+        else:
+            self._rewrite_files()
+        self._changed.clear()
+        self._rewrite = False
+
+    def _rewrite_files(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        ids = list(self._docs)
+        with_vectors = [doc_id for doc_id in ids if doc_id in self._vectors]
+        if with_vectors:
+            # Rows are stored L2-normalized so search is a plain dot product
+            matrix = np.stack([np.asarray(self._vectors[i], dtype=np.float32) for i in with_vectors])
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            tmp = self._vectors_path + ".tmp.npy"
+            np.save(tmp, matrix)
+            os.replace(tmp, self._vectors_path)
+        elif os.path.exists(self._vectors_path):
+            os.remove(self._vectors_path)
+
+        tmp = self._docs_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for doc_id in ids:
+                f.write(self._record(doc_id))
+        os.replace(tmp, self._docs_path)
+        self._log_lines = len(ids)
+
+        # Re-open the matrix memory-mapped so it isn't held twice in RAM
+        if with_vectors:
+            matrix = np.load(self._vectors_path, mmap_mode="r")
+            self._vectors = {doc_id: matrix[row] for row, doc_id in enumerate(with_vectors)}
+
+    # -- index structures ----------------------------------------------------
+
+    def _snapshot(self) -> None:
+        """
+        Freeze the refreshed state for searches, which see it even while
+        writes are pending; the structures over it are built on first read.
+        """
+        self._refreshed = (dict(self._docs), set(self._vectors))
+        self._built = False
+
+    def _ensure_built(self) -> None:
+        if not self._built:
+            self._rebuild()
+            self._built = True
+
+    def _rebuild(self) -> None:
+        docs, vector_ids = self._refreshed
+        self._ids = list(docs)
+        self._sources = [docs[doc_id] for doc_id in self._ids]
+        position = {doc_id: i for i, doc_id in enumerate(self._ids)}
+
+        # BM25 postings: term -> (doc positions, term frequencies)
+        postings: dict[str, dict[int, int]] = {}
+        lengths = np.zeros(len(self._ids), dtype=np.float32)
+        for i, doc_id in enumerate(self._ids):
+            tokens = _tokenize(str(docs[doc_id].get("content", "")))
+            lengths[i] = len(tokens)
+            for token in tokens:
+                tf = postings.setdefault(token, {})
+                tf[i] = tf.get(i, 0) + 1
+        self._lengths = lengths
+        self._avgdl = float(lengths.mean()) if len(lengths) else 0.0
+        n = len(self._ids)
+        self._postings = {
+            term: (
+                np.fromiter(tf.keys(), dtype=np.int64, count=len(tf)),
+                np.fromiter(tf.values(), dtype=np.float32, count=len(tf)),
+                math.log(1 + (n - len(tf) + 0.5) / (len(tf) + 0.5)),
+            )
+            for term, tf in postings.items()
+        }
+
+        # Memory-mapped matrix of normalized vectors, row i <-> _vec_positions[i]
+        self._vec_positions = np.array(
+            [position[doc_id] for doc_id in self._ids if doc_id in vector_ids], dtype=np.int64
+        )
+        if len(self._vec_positions) and os.path.exists(self._vectors_path):
+            self._matrix = np.load(self._vectors_path, mmap_mode="r")
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._build_ivf()
+
+    def _build_ivf(self, iterations: int = 10) -> None:
+        self._centroids = None
+        self._lists = None
+        n = self._matrix.shape[0]
+        if n < self.ivf_min_docs:
+            return
+        nlist = int(math.sqrt(n))
+        rng = np.random.default_rng(0)
+        centroids = self._matrix[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(self._matrix @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = self._matrix[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        assignment = np.argmax(self._matrix @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.nonzero(assignment == c)[0] for c in range(nlist)]
+
+    # -- writes --------------------------------------------------------------
+
+    def upsert(self, doc_id: str, body: dict) -> None:
+        with self._lock:
+            source = {k: v for k, v in body.items() if k != "embedding"}
+            self._docs[doc_id] = source
+            self._rewrite = self._rewrite or doc_id in self._vectors
+            if body.get("embedding") is not None:
+                self._vectors[doc_id] = np.asarray(body["embedding"], dtype=np.float32)
+                self._rewrite = True
+            else:
+                self._vectors.pop(doc_id, None)
+            self._changed[doc_id] = None
+            self._dirty = True
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            existed = self._docs.pop(doc_id, None) is not None
+            self._rewrite = self._rewrite or self._vectors.pop(doc_id, None) is not None
+            if existed:
+                self._changed[doc_id] = None
+            self._dirty = self._dirty or existed
+            return existed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._docs.clear()
+            self._vectors.clear()
+            self._rewrite = True
+            self._dirty = True
+            self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Persist pending writes and make them visible to searches.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._persist()
+            self._snapshot()
+            self._dirty = False
+
+    # -- reads ---------------------------------------------------------------
+
+    def _hit(self, position: int, score: float) -> dict:
+        return {"_id": self._ids[position], "_score": float(score), "_source": self._sources[position]}
+
+    def search(self, query: str, size: int = 10) -> list[dict]:
+        """
+        BM25 top-size hits for a free-text query.
+        """
+        with self._lock:
+            self._ensure_built()
+            if not self._ids:
+                return []
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self._lengths / max(self._avgdl, 1e-9))
+            for term in set(_tokenize(query)):
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                positions, tf, idf = posting
+                scores[positions] += idf * tf * (self.k1 + 1) / (tf + norm[positions])
+            matched = np.nonzero(scores > 0)[0]
+            if not len(matched):
+                return []
+            top = matched[np.argsort(-scores[matched], kind="stable")[:size]]
+            return [self._hit(p, scores[p]) for p in top]
+
+    def knn(self, vector: list[float], k: int = 10, num_candidates: int = 100) -> list[dict]:
+        """
+        Cosine-similarity top-k hits. With IVF lists built, only the
+        ivf_nprobe closest lists are scanned.
+        """
+        with self._lock:
+            self._ensure_built()
+            if not len(self._vec_positions):
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / max(np.linalg.norm(query), 1e-12)
+
+            if self._centroids is not None:
+                probe = np.argsort(-(self._centroids @ query))[:self.ivf_nprobe]
+                rows = np.concatenate([self._lists[c] for c in probe])
+            else:
+                rows = np.arange(len(self._vec_positions))
+            if not len(rows):
+                return []
+
+            # The probed IVF lists may hold fewer than k vectors
+            k = max(0, min(int(k), len(rows)))
+            if k == 0:
+                return []
+            similarity = self._matrix[rows] @ query
+            top = np.argpartition(-similarity, k - 1)[:k]
+            top = top[np.argsort(-similarity[top], kind="stable")]
+            # Same scale as Elasticsearch's cosine score
+            return [self._hit(self._vec_positions[rows[i]], (1 + similarity[i]) / 2) for i in top]
+
+    def sample(self, size: int, seed: int | None = None) -> list[dict]:
+        with self._lock:
+            self._ensure_built()
+            positions = np.arange(len(self._ids))
+            if seed is not None:
+                np.random.default_rng(seed).shuffle(positions)
+            return [self._hit(p, 1.0) for p in positions[:size]]
+
+    def count(self) -> int:
+        with self._lock:
+            self._ensure_built()
+            return len(self._ids)
+
+    def doc_ids(self) -> list[str]:
+        with self._lock:
+            self._ensure_built()
+            return list(self._ids)
+
+
+_indexes: dict[str, LocalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_local_index(index: str, base_path: str = DEFAULT_LOCAL_PATH, **options) -> LocalIndex:
+    """
+    Shared LocalIndex for an index name, stored under base_path/index.
+    """
+    directory = os.path.join(base_path, index)
+    with _indexes_lock:
+        local = _indexes.get(directory)
+        if local is None:
+            local = LocalIndex(directory, **options)
+            _indexes[directory] = local
+    return local
+
+
+class LocalBackend:
+    """
+    RetrievalBackend (src.wrappers.elasticsearch_helper) on LocalIndex
+    instances stored under base_path, one per index name.
+    """
+
+    def __init__(self, base_path: str = DEFAULT_LOCAL_PATH, **options):
+        self.base_path = base_path
+        self.options = options
+
+    def _index(self, index: str) -> LocalIndex:
+        return get_local_index(index, base_path=self.base_path, **self.options)
+
+    def index_doc(self, index: str, doc_id: str, body: dict) -> None:
+        local = self._index(index)
+        local.upsert(doc_id, body)
+        local.refresh()
+
+    def bulk_index(self, index: str, docs, chunk_size: int, max_chunk_bytes: int, thread_count: int,
+                   max_failures_reported: int) -> dict:
+        local = self._index(index)
+        stats = {"indexed": 0, "errors": 0, "failures": [], "failed_ids": []}
+        for doc_id, body in docs:
+            local.upsert(doc_id, body)
+            stats["indexed"] += 1
+        local.refresh()
+        return stats
+
+    def delete_docs(self, index: str, doc_ids, chunk_size: int) -> int:
+        local = self._index(index)
+        deleted = sum(1 for doc_id in doc_ids if local.delete(doc_id))
+        local.refresh()
+        return deleted
+
+    def ensure_index(self, index: str, dims: int | None) -> None:
+        pass  # Created on first write
+
+    def clear_index(self, index: str, dims: int | None) -> None:
+        self._index(index).clear()
+
+    def search(self, index: str, body: dict) -> list[dict]:
+        """
+        Answer an Elasticsearch match or knn search body in-process.
+        """
+        local = self._index(index)
+        if "knn" in body:
+            knn = body["knn"]
+            return local.knn(knn["query_vector"], k=knn["k"], num_candidates=knn["num_candidates"])
+        return local.search(body["query"]["match"]["content"], size=body["size"])
+
+    def msearch(self, index: str, bodies: list[dict], batch_size: int) -> list[list[dict]]:
+        return [self.search(index, body) for body in bodies]
+
+    def sample(self, index: str, size: int, seed: int | None) -> list[dict]:
+        return self._index(index).sample(size, seed=seed if seed is not None else random.randrange(2**32))
+
+    def doc_ids(self, index: str, scan_size: int) -> list[str]:
+        return self._index(index).doc_ids()
@@ -1,25 +1,317 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+import weakref
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from src.config.loader import load_config
+from src import metrics
+from src.budget import charge as charge_budget
 
+# Settings from the config's ollama section
+DEFAULT_OLLAMA_SETTINGS = {
+    "stream": True,            # stream tokens so the limits below apply mid-generation
+    "max_tokens": 1024,        # num_predict: output tokens per response
+    "timeout_seconds": 120,    # wall-clock cutoff per response
+    "connect_timeout": 5,
+    "keep_alive": "30m",       # keep the model loaded between prompts
+    "pool_connections": 4,     # pooled keep-alive connections per Ollama host
+    "stop": [],
+    "temperature": None,       # None = model default
+}
 
-def call_ollama(prompt: str, model_id: str = "llama3.2", system: str = "",
-                base_url: str = "http://localhost:11434") -> str:
+# Rough characters-per-token ratio for charging prompts cut off before Ollama reports usage
+CHARS_PER_TOKEN = 4
+
+# One pooled session per base URL; requests sessions are safe to share for posts
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+# One httpx.AsyncClient per event loop and base URL (clients are bound to their loop)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def ollama_settings(config: dict | None = None) -> dict:
     """
-    Call a local (or remote) Ollama instance.
-    base_url can be overridden via OLLAMA_BASE_URL env var for CI.
+    The ollama config section over the defaults; loads config if not given.
+    A missing or unreadable config leaves the defaults.
     """
-    url = f"{base_url}/api/generate"
+    if config is None:
+        try:
+            config = load_config()
+        except Exception:
+            config = {}
+    settings = dict(DEFAULT_OLLAMA_SETTINGS)
+    settings.update({k: v for k, v in (config.get("ollama") or {}).items() if k in DEFAULT_OLLAMA_SETTINGS})
+    return settings
+
+
+def _get_session(base_url: str, pool_connections: int) -> requests.Session:
+    session = _sessions.get(base_url)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_connections)))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[base_url] = session
+    return session
+
+
+def _get_async_client(base_url: str, settings: dict) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(base_url)
+    if client is None:
+        limits = httpx.Limits(max_connections=max(1, int(settings["pool_connections"])),
+                              max_keepalive_connections=max(1, int(settings["pool_connections"])))
+        client = httpx.AsyncClient(base_url=base_url, limits=limits)
+        clients[base_url] = client
+    return client
+
+
+async def close_clients() -> None:
+    """
+    Close the pooled sessions and this event loop's async clients (on
+    shutdown). Clients of other loops are dropped; they cannot be awaited
+    from here and go away with their loop.
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    _async_clients.clear()
+    for client in clients.values():
+        await client.aclose()
+
 
-    payload = {
+def _payload(prompt: str, model_id: str, system: str, settings: dict) -> dict:
+    options = {"num_predict": int(settings["max_tokens"])}
+    if settings["stop"]:
+        options["stop"] = list(settings["stop"])
+    if settings["temperature"] is not None:
+        options["temperature"] = float(settings["temperature"])
+    return {
         "model": model_id,
         "prompt": prompt,
         "system": system,
-        "stream": False,
+        "stream": bool(settings["stream"]),
+        "keep_alive": settings["keep_alive"],
+        "options": options,
     }
 
+
+class _Generation:
+    """
+    Accumulates one generation from Ollama's NDJSON chunks (or its single
+    non-streamed reply), enforcing the output-token and wall-clock limits.
+    """
+
+    def __init__(self, prompt: str, settings: dict):
+        self.prompt = prompt
+        self.streaming = bool(settings["stream"])
+        self.max_tokens = int(settings["max_tokens"])
+        self.started = time.perf_counter()
+        self.deadline = self.started + float(settings["timeout_seconds"])
+        self.parts: list[str] = []
+        self.tokens = 0
+        self.ttft = None
+        self.final: dict = {}
+        self.truncated = None
+        self.expired = False  # set when the deadline timer closed the stream
+
+    def feed(self, chunk: dict) -> bool:
+        """
+        Take one chunk; True once generation should stop reading.
+        """
+        text = chunk.get("response", "")
+        if text:
+            if self.ttft is None and self.streaming:
+                self.ttft = time.perf_counter() - self.started
+            self.parts.append(text)
+            self.tokens += 1
+        if chunk.get("done"):
+            self.final = chunk
+            if chunk.get("done_reason") == "length":
+                self.truncated = "max_tokens"
+            return True
+        if self.tokens >= self.max_tokens:
+            # num_predict should stop the model first; this guards servers that ignore it
+            self.truncated = "max_tokens"
+            return True
+        if time.perf_counter() >= self.deadline:
+            self.truncated = "deadline"
+            return True
+        return False
+
+    def result(self, model_id: str) -> dict:
+        elapsed = time.perf_counter() - self.started
+        input_tokens = self.final.get("prompt_eval_count", len(self.prompt) // CHARS_PER_TOKEN)
+        output_tokens = self.final.get("eval_count", self.tokens)
+
+        metrics.observe("call_seconds", elapsed, backend="ollama", op="generate", model=model_id)
+        if self.ttft is not None:
+            metrics.observe("ttft_seconds", self.ttft, backend="ollama", model=model_id)
+        if self.truncated:
+            metrics.inc("llm_truncations_total", backend="ollama", model=model_id, reason=self.truncated)
+        metrics.inc("llm_calls_total", backend="ollama", model=model_id, outcome="ok")
+        metrics.inc("llm_tokens_total", input_tokens, model=model_id, direction="input")
+        metrics.inc("llm_tokens_total", output_tokens, model=model_id, direction="output")
+        charge_budget(input_tokens + output_tokens)
+        return {
+            "text": "".join(self.parts),
+            "ttft_seconds": self.ttft,
+            "seconds": elapsed,
+            "output_tokens": output_tokens,
+            "truncated": self.truncated,
+        }
+
+
+def _remaining(generation: _Generation) -> float:
+    return max(0.0, generation.deadline - time.perf_counter())
+
+
+def _expire_at_deadline(response: requests.Response, generation: _Generation) -> threading.Timer:
+    """
+    Close the response once the generation's deadline passes. feed() only
+    checks the deadline when a chunk arrives, so without this a stream
+    stalling just before it would run on until the read timeout.
+    """
+    def expire():
+        generation.expired = True
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+        try:
+            if sock is not None:
+                sock.shutdown(socket.SHUT_RDWR)  # wakes the blocked read
+        except OSError:
+            pass
+        response.close()
+
+    timer = threading.Timer(_remaining(generation), expire)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def _failed(model_id: str, error: Exception) -> dict:
+    metrics.inc("llm_calls_total", backend="ollama", model=model_id, outcome="error")
+    print(f"Ollama error: {error}")
+    return {"text": f"ERROR: Ollama call failed: {error}", "ttft_seconds": None, "seconds": None,
+            "output_tokens": 0, "truncated": None, "error": str(error)}
+
+
+def generate_ollama(prompt: str, model_id: str = "llama3.2", system: str = "",
+                    base_url: str = "http://localhost:11434", settings: dict | None = None) -> dict:
+    """
+    Run one generation on a pooled keep-alive session and return
+    {"text", "ttft_seconds", "seconds", "output_tokens", "truncated"}.
+    In streaming mode the response is cut at max_tokens or timeout_seconds
+    (truncated says which) and the partial text is kept; closing the stream
+    stops the generation server-side.
+    """
+    settings = settings or ollama_settings()
+    session = _get_session(base_url, settings["pool_connections"])
+    generation = _Generation(prompt, settings)
+    payload = _payload(prompt, model_id, system, settings)
+    try:
+        timeout = (float(settings["connect_timeout"]), float(settings["timeout_seconds"]))
+        with session.post(f"{base_url}/api/generate", json=payload, stream=payload["stream"],
+                          timeout=timeout) as response:
+            timer = _expire_at_deadline(response, generation)
+            try:
+                response.raise_for_status()
+                if payload["stream"]:
+                    for line in response.iter_lines():
+                        if line and generation.feed(json.loads(line)):
+                            break
+                else:
+                    generation.feed(dict(response.json(), done=True))
+            finally:
+                timer.cancel()
+    except (requests.RequestException, ValueError) as e:
+        if not generation.parts:
+            return _failed(model_id, TimeoutError("deadline passed") if generation.expired else e)
+        generation.truncated = "deadline" if generation.expired else "error"
+    if generation.expired and generation.truncated is None:
+        generation.truncated = "deadline"
+    return generation.result(model_id)
+
+
+async def agenerate_ollama(prompt: str, model_id: str = "llama3.2", system: str = "",
+                           base_url: str = "http://localhost:11434", settings: dict | None = None) -> dict:
+    """
+    Async generate_ollama for concurrent callers, on a pooled
+    httpx.AsyncClient per event loop. Same limits and result.
+    """
+    settings = settings or ollama_settings()
+    client = _get_async_client(base_url, settings)
+    generation = _Generation(prompt, settings)
+    payload = _payload(prompt, model_id, system, settings)
+
+    async def read():
+        timeout = httpx.Timeout(float(settings["timeout_seconds"]), connect=float(settings["connect_timeout"]))
+        async with client.stream("POST", "/api/generate", json=payload, timeout=timeout) as response:
+            response.raise_for_status()
+            if payload["stream"]:
+                async for line in response.aiter_lines():
+                    if line and generation.feed(json.loads(line)):
+                        break
+            else:
+                generation.feed(dict(json.loads(await response.aread()), done=True))
+
     try:
-        response = requests.post(url, json=payload, timeout=120)
-        response.raise_for_status()
-        return response.json().get("response", "")
-    except requests.RequestException as e:
-        print(f"Ollama error: {e}")
-        return f"ERROR: Ollama call failed: {e}"
+        # Bounds the whole generation, including a stream stalled between chunks
+        await asyncio.wait_for(read(), _remaining(generation))
+    except asyncio.TimeoutError as e:
+        if not generation.parts:
+            return _failed(model_id, e)
+        generation.truncated = "deadline"
+    except (httpx.HTTPError, ValueError) as e:
+        if generation.parts:
+            generation.truncated = "error"
+        else:
+            return _failed(model_id, e)
+    return generation.result(model_id)
+
+
+def call_ollama(prompt: str, model_id: str = "llama3.2", system: str = "",
+                base_url: str = "http://localhost:11434", settings: dict | None = None) -> str:
+    """
+    Call a local (or remote) Ollama instance.
+    base_url can be overridden via OLLAMA_BASE_URL env var for CI.
+    Limits and streaming come from settings (the run's ollama_settings(config));
+    without them, from the default config's ollama section.
+    """
+    return generate_ollama(prompt, model_id=model_id, system=system, base_url=base_url, settings=settings)["text"]
+
+
+async def acall_ollama(prompt: str, model_id: str = "llama3.2", system: str = "",
+                       base_url: str = "http://localhost:11434", settings: dict | None = None) -> str:
+    """
+    Async call_ollama.
+    """
+    result = await agenerate_ollama(prompt, model_id=model_id, system=system, base_url=base_url,
+                                    settings=settings)
+    return result["text"]
+
+
+def prewarm_ollama(model_id: str, base_url: str = "http://localhost:11434", settings: dict | None = None) -> None:
+    """
+    Load the model into memory (an empty prompt only loads it) and pin it
+    for keep_alive, so the first prompt of a run doesn't pay the load time.
+    """
+    settings = settings or ollama_settings()
+    session = _get_session(base_url, settings["pool_connections"])
+    response = session.post(
+        f"{base_url}/api/generate",
+        json={"model": model_id, "keep_alive": settings["keep_alive"]},
+        timeout=(float(settings["connect_timeout"]), float(settings["timeout_seconds"])),
+    )
+    response.raise_for_status()
@@ -0,0 +1,209 @@
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+from src import metrics
+
+# Bedrock error codes worth retrying; the first two mean we exceeded quota
+THROTTLE_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException"}
+RETRYABLE_ERROR_CODES = THROTTLE_ERROR_CODES | {
+    "ServiceUnavailableException", "ModelNotReadyException", "InternalServerException",
+}
+
+DEFAULT_LIMITS = {
+    "requests_per_minute": 0,   # 0 = unlimited
+    "tokens_per_minute": 0,     # 0 = unlimited
+    "initial_concurrency": 4,
+    "min_concurrency": 1,
+    "max_concurrency": 16,
+}
+DEFAULT_BACKOFF = {
+    "max_attempts": 8,
+    "backoff_base": 0.5,
+    "backoff_cap": 20.0,
+    "deadline_seconds": 120.0,
+}
+
+
+def error_code(error: Exception) -> str:
+    """
+    The AWS error code of a botocore ClientError, "" for anything else.
+    """
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "")
+    return ""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate_per_minute, holding at most ten seconds of
+    refill. reserve() always succeeds and returns how long the caller must
+    wait before using what it took, so callers are served in arrival order.
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * 10)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase (about +1 after a full window
+    of successful calls) and multiplicative decrease (halved on a throttle,
+    at most once per second so one burst of throttles counts once).
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= 1.0:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class RateGovernor:
+    """
+    Client-side admission control for one model: request and token buckets,
+    an AIMD concurrency limit, and full-jitter exponential backoff on
+    retryable errors, bounded by max_attempts and deadline_seconds.
+    """
+
+    def __init__(self, model_id: str, limits: dict | None = None, backoff: dict | None = None):
+        self.model_id = model_id
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.backoff = dict(DEFAULT_BACKOFF, **(backoff or {}))
+        self.requests = TokenBucket(float(limits["requests_per_minute"]))
+        self.tokens = TokenBucket(float(limits["tokens_per_minute"]))
+        self.limiter = AIMDLimiter(
+            int(limits["initial_concurrency"]),
+            int(limits["min_concurrency"]),
+            int(limits["max_concurrency"]),
+        )
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0, "attempts": 0, "throttles": 0, "retries": 0,
+            "failures": 0, "rate_wait_seconds": 0.0, "backoff_seconds": 0.0,
+        }
+
+    def _count(self, **increments) -> None:
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def call(self, fn, tokens: int = 0):
+        """
+        Run fn() under the governor and return its result. tokens is the
+        call's estimated token usage (input + max output) charged against
+        the tokens/minute bucket on every attempt.
+        """
+        started = time.monotonic()
+        deadline = started + float(self.backoff["deadline_seconds"])
+        max_attempts = max(1, int(self.backoff["max_attempts"]))
+        self._count(calls=1)
+
+        for attempt in range(max_attempts):
+            self.limiter.acquire()
+            throttled = False
+            try:
+                wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+                if wait > 0:
+                    self._count(rate_wait_seconds=wait)
+                    time.sleep(wait)
+                self._count(attempts=1)
+                return fn()
+            except Exception as e:
+                code = error_code(e)
+                throttled = code in THROTTLE_ERROR_CODES
+                if throttled:
+                    self._count(throttles=1)
+                    metrics.inc("llm_throttles_total", model=self.model_id)
+                if code not in RETRYABLE_ERROR_CODES:
+                    self._count(failures=1)
+                    raise
+                # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+                sleep = random.uniform(0, min(float(self.backoff["backoff_cap"]),
+                                              float(self.backoff["backoff_base"]) * 2 ** attempt))
+                if attempt == max_attempts - 1 or time.monotonic() + sleep > deadline:
+                    self._count(failures=1)
+                    print(f"⚠️ Giving up on {self.model_id} after {attempt + 1} attempts ({code}).")
+                    raise
+                print(f"⚠️ {code} from {self.model_id}. Retrying in {sleep:.1f}s...")
+                self._count(retries=1, backoff_seconds=sleep)
+                metrics.inc("llm_retries_total", model=self.model_id)
+            finally:
+                self.limiter.release(throttled=throttled)
+            time.sleep(sleep)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["concurrency_limit"] = int(self.limiter.limit)
+        stats["in_flight"] = self.limiter.in_flight
+        return stats
+
+
+_governors: dict[str, tuple[tuple, RateGovernor]] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(model_id: str, config: dict | None = None) -> RateGovernor:
+    """
+    Shared RateGovernor for a model, configured from the config's
+    rate_limits section: backoff settings at the top level, limits under
+    "default" and per model under "models". A governor is rebuilt when its
+    settings change.
+    """
+    rate_config = (config or {}).get("rate_limits", {})
+    limits = dict(rate_config.get("default", {}))
+    limits.update(rate_config.get("models", {}).get(model_id, {}))
+    backoff = {k: rate_config[k] for k in DEFAULT_BACKOFF if k in rate_config}
+    settings = (tuple(sorted(limits.items())), tuple(sorted(backoff.items())))
+
+    with _governors_lock:
+        entry = _governors.get(model_id)
+        if entry is None or entry[0] != settings:
+            entry = (settings, RateGovernor(model_id, limits, backoff))
+            _governors[model_id] = entry
+        return entry[1]
+
+
+def governor_stats() -> dict:
+    """
+    Per-model counters of every governor in this process.
+    """
+    with _governors_lock:
+        governors = [entry[1] for entry in _governors.values()]
+    return {g.model_id: g.stats() for g in governors}
@@ -1,5 +1,27 @@
+import copy
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
 import pytest
-from src.agents.score_risk import score_risk
+from src import budget
+from src.agents.dedupe_claims import cluster_claims, dedupe_claims, fan_out_verdicts
+from src.agents.extract_claims import extract_claims
+from src.agents.generate_prompts import FILLER_PROMPT, generate_prompts
+from src.agents.retrieve_evidence import retrieve_evidence
+from src.agents.run_model import run_model
+from src.agents.score_risk import decision_settled, reliability_interval, score_risk
+from src.agents.verify_claims import verify_claims
+from src.checkpoint import load_checkpoint
+from src.compare import run_comparison
+from src.orchestrator import build_response, run_workflow
+from src.pipelined import run_pipelined_stages
+from src.prompt_sets import invalidate_prompt_sets, list_prompt_sets, pin_prompt_set
+from src.wrappers.llm_cache import get_cache
+from src.wrappers.rate_governor import get_governor
 
 def test_score_risk_calculation():
     # Setup state
@@ -39,3 +61,569 @@ def test_score_risk_empty():
     score = state["score"]
     assert score["total_claims"] == 0
     assert score["decision"] == "unknown"
+
+def test_run_model_concurrent_keeps_order_and_errors():
+    def fake_call_llm(prompt, model_id_override=None):
+        if prompt == "boom":
+            raise RuntimeError("throttled")
+        return f"answer to {prompt}"
+
+    state = {
+        "prompts": ["p1", "boom", "p3", "p4"],
+        "config": {"target_model": {"provider": "bedrock", "model_id": "m", "concurrency": 3}},
+    }
+    with patch("src.agents.run_model.call_llm", side_effect=fake_call_llm):
+        run_model(state)
+
+    assert [r["prompt"] for r in state["responses"]] == ["p1", "boom", "p3", "p4"]
+    assert state["responses"][0]["response"] == "answer to p1"
+    assert state["responses"][1]["response"].startswith("ERROR:")
+
+def test_run_model_passes_the_runs_ollama_settings():
+    seen = []
+
+    def fake_generate_ollama(prompt, model_id="llama3.2", system="", base_url="", settings=None):
+        seen.append(settings)
+        return {"text": f"answer to {prompt}"}
+
+    state = {
+        "prompts": ["p1", "p2"],
+        "config": {"target_model": {"provider": "ollama", "model_id": "m", "concurrency": 2},
+                   "ollama": {"stream": False, "max_tokens": 64, "timeout_seconds": 9}},
+    }
+    with patch("src.wrappers.ollama.load_config", side_effect=AssertionError("default config read")), \
+         patch("src.wrappers.ollama.generate_ollama", side_effect=fake_generate_ollama):
+        run_model(state)
+
+    assert [r["response"] for r in state["responses"]] == ["answer to p1", "answer to p2"]
+    assert all((s["stream"], s["max_tokens"], s["timeout_seconds"]) == (False, 64, 9) for s in seen)
+
+def test_extract_claims_batched_falls_back_for_missing_ids():
+    calls = []
+
+    def fake_call_llm(prompt, max_tokens=1000):
+        calls.append(prompt)
+        if "[ID 0]" in prompt:
+            # Batched reply that omits the second response
+            return '```json\n{"0": ["Paris is the capital of France."]}\n```'
+        return '["Water boils at 100 C."]'
+
+    state = {
+        "responses": [
+            {"prompt": "q1", "response": "Paris is the capital of France."},
+            {"prompt": "q2", "response": "Water boils at 100 C."},
+            {"prompt": "q3", "response": "ERROR: timeout"},
+        ],
+        "config": {"evaluation": {"extraction_batch_size": 5}},
+    }
+    with patch("src.agents.extract_claims.call_llm", side_effect=fake_call_llm):
+        extract_claims(state)
+
+    assert len(calls) == 2
+    assert [(c["source_prompt"], c["text"]) for c in state["claims"]] == [
+        ("q1", "Paris is the capital of France."),
+        ("q2", "Water boils at 100 C."),
+    ]
+
+def test_verify_claims_batched_shares_evidence_and_retries_missing():
+    doc = {"content": "Paris is the capital of France.", "source": "facts.txt"}
+    calls = []
+
+    def fake_call_llm(prompt, max_tokens=1000):
+        calls.append(prompt)
+        if "CLAIMS:" in prompt:
+            assert prompt.count(doc["content"]) == 1
+            return '[{"claim_id": "0", "label": "Supported", "justification": "stated"}]'
+        return '{"label": "unsupported", "justification": "not stated"}'
+
+    state = {
+        "evidence": [
+            {"claim": {"text": "Paris is in France."}, "documents": [doc]},
+            {"claim": {"text": "Paris is the capital."}, "documents": [doc]},
+        ],
+        "config": {"evaluation": {"verification_batch_size": 5}},
+    }
+    with patch("src.agents.verify_claims.call_llm", side_effect=fake_call_llm):
+        verify_claims(state)
+
+    assert len(calls) == 2
+    assert [(v["claim"], v["label"]) for v in state["verdicts"]] == [
+        ("Paris is in France.", "supported"),
+        ("Paris is the capital.", "unsupported"),
+    ]
+
+def test_retrieve_evidence_batches_claims_through_msearch():
+    client = MagicMock()
+    client.msearch.side_effect = lambda searches: {"responses": [
+        {"hits": {"hits": [{"_id": body["query"]["match"]["content"], "_source": {"content": body["query"]["match"]["content"]}}]}}
+        for body in searches[1::2]
+    ]}
+    state = {
+        "claims": [{"text": "a"}, {"text": "b"}, {"text": "a"}, {"text": "c"}],
+        "config": {"retrieval": {"mode": "bm25", "msearch_batch_size": 2}},
+    }
+    with patch("src.wrappers.elasticsearch_helper._get_es_client", return_value=client):
+        retrieve_evidence(state)
+
+    assert client.msearch.call_count == 2
+    sent = [body for call in client.msearch.call_args_list for body in call.kwargs["searches"][1::2]]
+    assert all(body["_source"]["includes"] and "embedding" not in body["_source"]["includes"] for body in sent)
+    assert [e["documents"][0]["content"] for e in state["evidence"]] == ["a", "b", "a", "c"]
+
+def test_dedupe_claims_verifies_one_per_cluster_and_fans_out():
+    texts = [
+        "Mojo is a superset of Python designed for AI workloads.",
+        "Mojo is a superset of Python, designed for AI workloads!",
+        "Mojo was released in 2023 by Modular Inc for developers.",
+        "Mojo is a superset of python designed for ai workloads",
+        "Mojo was released in 2022 by Modular Inc for developers.",
+    ]
+    state = {
+        "claims": [{"id": str(i), "text": t} for i, t in enumerate(texts)],
+        "config": {"thresholds": {"deploy": 0.8, "warn": 0.5}},
+    }
+    dedupe_claims(state)
+    assert [c["id"] for c in state["claims"]] == ["0", "2", "4"]
+
+    labels = {"0": "supported", "2": "unsupported", "4": "weakly_supported"}
+    state["verdicts"] = [
+        {"claim": c["text"], "label": labels[c["id"]], "justification": ""} for c in state["claims"]
+    ]
+    fan_out_verdicts(state)
+    score_risk(state)
+
+    assert len(state["claims"]) == 5
+    assert [v["claim"] for v in state["verdicts"]] == texts
+    assert state["score"]["supported"] == 3 and state["score"]["total_claims"] == 5
+
+def test_cluster_claims_merges_near_duplicates():
+    texts = [
+        "Mojo is a superset of the Python language that is designed for fast AI workloads on GPUs.",
+        "Mojo is a superset of the Python language that is designed for fast AI workloads on modern GPUs.",
+        "The ocean covers most of the planet.",
+    ]
+    assert cluster_claims([{"text": t} for t in texts]) == [[0, 1], [2]]
+
+def _fake_extract_llm(prompt, max_tokens=1000):
+    answer = prompt.split("Text: ")[1].split(".")[0]
+    return f'["{answer} is true.", "Shared fact here."]'
+
+def _fake_search(texts, **kwargs):
+    return [[{"content": f"doc for {t}", "source": "s"}] for t in texts]
+
+def test_pipelined_stages_match_sequential_workflow():
+    def fake_target(prompt, model_id_override=None):
+        time.sleep(random.random() / 200)  # finish out of order
+        if prompt == "p3":
+            raise RuntimeError("throttled")
+        return f"Answer {prompt}. Shared fact here."
+
+    def fake_verify(prompt, max_tokens=1000):
+        label = "supported" if "Shared" in prompt.split("CLAIM:")[-1] else "unsupported"
+        return f'{{"label": "{label}", "justification": "j"}}'
+
+    config = {
+        "target_model": {"provider": "bedrock", "model_id": "m", "concurrency": 3},
+        "retrieval": {"mode": "bm25"},
+        "execution": {"mode": "pipelined", "queue_size": 2,
+                      "workers": {"extract": 2, "retrieve": 2, "verify": 2}},
+    }
+    prompts = [f"p{i}" for i in range(8)]
+    sequential = {"config": config, "prompts": list(prompts)}
+    pipelined = copy.deepcopy(sequential)
+
+    with patch("src.agents.run_model.call_llm", side_effect=fake_target), \
+         patch("src.agents.extract_claims.call_llm", side_effect=_fake_extract_llm), \
+         patch("src.agents.retrieve_evidence.multi_search_docs", side_effect=_fake_search), \
+         patch("src.agents.verify_claims.call_llm", side_effect=fake_verify):
+        run_model(sequential)
+        extract_claims(sequential)
+        dedupe_claims(sequential)
+        retrieve_evidence(sequential)
+        verify_claims(sequential)
+        fan_out_verdicts(sequential)
+        run_pipelined_stages(pipelined)
+
+    strip = lambda claims: [{k: v for k, v in c.items() if k != "id"} for c in claims]
+    assert pipelined["responses"] == sequential["responses"]
+    assert strip(pipelined["claims"]) == strip(sequential["claims"])
+    assert [e["claim"]["text"] for e in pipelined["evidence"]] == [e["claim"]["text"] for e in sequential["evidence"]]
+    assert pipelined["verdicts"] == sequential["verdicts"]
+    assert len(pipelined["verdicts"]) == 14
+
+def test_pipelined_stages_stop_sending_prompts_once_budget_is_spent():
+    answered = []
+
+    def fake_run_prompt(prompt, provider, model_id, ollama_base, ollama=None):
+        answered.append(prompt)
+        return {"prompt": prompt, "response": f"r {prompt}"}
+
+    config = {"target_model": {"provider": "bedrock", "model_id": "m", "concurrency": 1},
+              "execution": {"mode": "pipelined", "queue_size": 64}}
+    state = {"config": config, "prompts": [f"p{i}" for i in range(50)]}
+    with patch("src.pipelined.run_prompt", side_effect=fake_run_prompt), \
+         patch("src.pipelined.extract_claims") as extract:
+        run_pipelined_stages(state, should_stop=lambda: len(answered) >= 1)
+
+    assert answered == ["p0"]
+    assert state["responses"] == [{"prompt": "p0", "response": "r p0"}]
+    extract.assert_not_called()
+
+def _answer_each_prompt(state):
+    state["responses"] = [{"prompt": p, "response": f"r {p}"} for p in state["prompts"]]
+
+def _claim_per_response(state):
+    state["claims"] = [{"id": r["prompt"], "text": r["response"]} for r in state["responses"]]
+
+def _no_evidence(state):
+    state["evidence"] = [{"claim": c, "documents": []} for c in state["claims"]]
+
+def _support_all(state):
+    state["verdicts"] = [{"claim": e["claim"]["text"], "label": "supported"} for e in state["evidence"]]
+
+@contextmanager
+def _stub_stages(num_prompts, model=_answer_each_prompt, extract=_claim_per_response,
+                 retrieve=_no_evidence, verify=_support_all):
+    """
+    Replace the orchestrator's stages with fakes: prompts p0..p{num_prompts-1},
+    then the given model/extract/retrieve/verify functions. Yields the mocks
+    of run_model and index_doc.
+    """
+    def generate(state):
+        state["prompts"] = [f"p{i}" for i in range(num_prompts)]
+
+    with patch("src.orchestrator.generate_prompts", side_effect=generate), \
+         patch("src.orchestrator.run_model", side_effect=model) as model_mock, \
+         patch("src.orchestrator.extract_claims", side_effect=extract), \
+         patch("src.orchestrator.retrieve_evidence", side_effect=retrieve), \
+         patch("src.orchestrator.verify_claims", side_effect=verify), \
+         patch("src.orchestrator.index_doc") as index_doc_mock:
+        yield {"model": model_mock, "index_doc": index_doc_mock}
+
+def test_run_workflow_resumes_from_checkpointed_stage_and_item(tmp_path):
+    config = {
+        "checkpoint": {"enabled": True, "path": str(tmp_path), "item_batch": 2},
+        "dedup": {"enabled": False},
+        "thresholds": {"deploy": 0.8, "warn": 0.5},
+    }
+    verified = []
+    fail = {"verify": True}
+
+    def verify(state):
+        texts = [e["claim"]["text"] for e in state["evidence"]]
+        if fail["verify"] and "r p2" in texts:
+            raise RuntimeError("throttled")
+        verified.extend(texts)
+        _support_all(state)
+
+    with _stub_stages(5, verify=verify) as stages:
+        state = {"config": config, "run_id": "run-1"}
+        with pytest.raises(RuntimeError):
+            run_workflow(state)
+
+        checkpoint = load_checkpoint(str(tmp_path), "run-1")
+        assert checkpoint["completed_stages"] == [
+            "generating_prompts", "running_model", "extracting_claims", "retrieving_evidence",
+        ]
+        assert checkpoint["partial"]["verifying_claims"]["done"] == 2
+
+        fail["verify"] = False
+        resumed = {"config": config, "run_id": "run-1"}
+        run_workflow(resumed, resume=True)
+
+    assert stages["model"].call_count == 3  # three chunks of at most two prompts, never repeated
+    assert verified == ["r p0", "r p1", "r p2", "r p3", "r p4"]
+    assert build_response(resumed)["score"]["total_claims"] == 5
+    assert load_checkpoint(str(tmp_path), "run-1") is None
+
+def _charged_extract(state):
+    budget.charge(100 * len(state["responses"]))
+    _claim_per_response(state)
+
+def test_run_workflow_budget_samples_claims_and_stops_early():
+    config = {
+        "budget": {"max_verifier_tokens": 10000, "tokens_per_claim": 1000},
+        "checkpoint": {"item_batch": 2},
+        "dedup": {"enabled": False},
+        "thresholds": {"deploy": 0.8, "warn": 0.5},
+    }
+    verified = []
+
+    def model(state):
+        with budget.llm_role("target"):
+            for _ in state["prompts"]:
+                budget.charge(500)
+        _answer_each_prompt(state)
+
+    def verify(state):
+        budget.charge(1500 * len(state["evidence"]))  # costlier than estimated
+        verified.extend(e["claim"]["text"] for e in state["evidence"])
+        _support_all(state)
+
+    with _stub_stages(20, model=model, extract=_charged_extract, verify=verify):
+        state = {"config": config, "run_id": "budget-run"}
+        run_workflow(state)
+
+    result = build_response(state)
+    # 2000 verifier tokens spent on extraction leaves room for 8 claims; the
+    # real cost per claim is higher, so verification stops after 6
+    assert len(state["claims"]) == 8
+    assert len(verified) == 6
+    assert result["score"]["budget_limited"] is True
+    assert result["score"]["total_claims"] == 6
+    consumed = result["budget"]["consumed"]
+    assert consumed["target_tokens"] == 10000
+    assert consumed["verifier_tokens"] == 11000
+    assert len(result["budget"]["limited_by"]) == 2
+
+def test_resumed_run_keeps_sampled_claims_and_budget_spent(tmp_path):
+    config = {
+        "budget": {"max_verifier_tokens": 10000, "tokens_per_claim": 1000},
+        "checkpoint": {"enabled": True, "path": str(tmp_path), "item_batch": 2},
+        "dedup": {"enabled": False},
+        "thresholds": {"deploy": 0.8, "warn": 0.5},
+    }
+    fail = {"retrieve": True}
+    retrieved = []
+
+    def retrieve(state):
+        if fail["retrieve"] and retrieved:
+            raise RuntimeError("es down")
+        budget.charge(500)  # embedding calls
+        retrieved.extend(c["text"] for c in state["claims"])
+        _no_evidence(state)
+
+    def verify(state):
+        budget.charge(500 * len(state["evidence"]))
+        _support_all(state)
+
+    with _stub_stages(20, extract=_charged_extract, retrieve=retrieve, verify=verify):
+        state = {"config": config, "run_id": "budget-resume"}
+        with pytest.raises(RuntimeError):
+            run_workflow(state)
+        sampled = [c["text"] for c in state["claims"]]
+        assert len(sampled) == 8
+
+        fail["retrieve"] = False
+        resumed = {"config": config, "run_id": "budget-resume"}
+        run_workflow(resumed, resume=True)
+
+    # Same 8 claims, retrieval picked up where it stopped; spending carried over
+    assert [c["text"] for c in resumed["claims"]] == sampled
+    assert retrieved == sampled
+    consumed = build_response(resumed)["budget"]["consumed"]
+    assert consumed["verifier_tokens"] == 2000 + 4 * 500 + 8 * 500
+
+def test_reliability_interval_and_settled_decision():
+    low, high = reliability_interval(20, 20, 0.95)
+    assert 0.83 < low < 0.84 and high == 1.0
+    thresholds = {"deploy": 0.8, "warn": 0.5}
+    assert decision_settled({"interval": [low, high]}, thresholds)
+    assert not decision_settled({"interval": list(reliability_interval(10, 10))}, thresholds)
+    assert decision_settled({"interval": list(reliability_interval(2, 30))}, thresholds)
+
+def test_interval_counts_distinct_verifications_not_fanned_out_copies():
+    thresholds = {"deploy": 0.8, "warn": 0.5}
+    claims = [{"id": str(i), "text": f"Mojo uses fn {i}."} for i in range(30)]
+    state = {
+        "config": {"thresholds": thresholds},
+        "all_claims": claims,
+        "claim_clusters": [list(range(30))],  # one verification for all 30
+        "verdicts": [{"claim": "Mojo uses fn 0.", "label": "supported"}],
+    }
+    fan_out_verdicts(state)
+    score_risk(state)
+
+    score = state["score"]
+    assert score["total_claims"] == 30 and score["reliability"] == 1.0
+    assert score["samples"] == 1
+    assert score["interval"][0] < 0.5
+    assert not decision_settled(score, thresholds)
+    assert sum("duplicate_of" in v for v in state["verdicts"]) == 29
+
+def test_sequential_waves_stop_once_decision_is_settled():
+    config = {
+        "evaluation": {"sequential": {"enabled": True, "wave_size": 5, "min_claims": 10}},
+        "dedup": {"enabled": False},
+        "thresholds": {"deploy": 0.8, "warn": 0.5},
+    }
+
+    def extract(state):
+        state["claims"] = [
+            {"id": f"{r['prompt']}-{i}", "text": f"{r['response']} claim {i}"}
+            for r in state["responses"] for i in range(2)
+        ]
+
+    with _stub_stages(50, extract=extract) as stages:
+        state = {"config": config}
+        run_workflow(state)
+
+    score = state["score"]
+    # 10 all-supported claims leave the interval straddling 0.8; 20 settle it
+    assert stages["model"].call_count == 2
+    assert (score["prompts_used"], score["waves_run"], score["stopped_early"]) == (10, 2, True)
+    assert score["samples"] == 20 and score["decision"] == "deploy"
+    assert score["interval"][0] >= 0.8
+
+def test_run_comparison_shares_prompts_and_verifies_common_claims_once():
+    def fake_generate(state):
+        state["prompts"] = ["p1", "p2"]
+
+    def fake_target(prompt, model_id_override=None):
+        if model_id_override == "m-a":
+            return f"Answer {prompt}. Shared fact here."
+        return f"Other {prompt}. Shared fact here."
+
+    def fake_verify(prompt, max_tokens=1000):
+        claim = prompt.split("CLAIM:")[-1]
+        label = "supported" if "Shared" in claim or "Answer" in claim else "unsupported"
+        return f'{{"label": "{label}", "justification": "j"}}'
+
+    config = {
+        "target_model": {"provider": "bedrock", "model_id": "m", "concurrency": 2},
+        "retrieval": {"mode": "bm25"},
+        "thresholds": {"deploy": 0.8, "warn": 0.5},
+    }
+    targets = [{"provider": "bedrock", "model_id": "m-a", "name": "A"},
+               {"provider": "bedrock", "model_id": "vendor.m-b"}]
+
+    with patch("src.compare.generate_prompts", side_effect=fake_generate), \
+         patch("src.compare.index_doc") as mock_index_doc, \
+         patch("src.agents.run_model.call_llm", side_effect=fake_target), \
+         patch("src.agents.extract_claims.call_llm", side_effect=_fake_extract_llm), \
+         patch("src.agents.retrieve_evidence.multi_search_docs", side_effect=_fake_search), \
+         patch("src.agents.verify_claims.call_llm", side_effect=fake_verify):
+        result = run_comparison(config, targets)
+
+    # 8 claims across both models, "Shared fact here." verified once
+    assert result["shared"] == {"total_claims": 8, "verified_claims": 5, "verifications_saved": 3}
+    assert [m["name"] for m in result["models"]] == ["A", "vendor.m-b"]
+    assert result["models"][0]["score"]["reliability"] == 1.0
+    assert result["models"][1]["score"]["reliability"] == 0.5
+    assert [p["prompt"] for p in result["prompts"]] == ["p1", "p2"]
+    row = result["prompts"][1]["models"]
+    assert list(row) == ["A", "vendor.m-b"]
+    assert row["A"]["response"] == "Answer p2. Shared fact here."
+    assert [v["claim"] for v in row["vendor.m-b"]["verdicts"]] == ["Other p2 is true.", "Shared fact here."]
+    assert [v["label"] for v in row["vendor.m-b"]["verdicts"]] == ["unsupported", "supported"]
+    # The stored document has ES-safe keys; the response keeps the model names
+    stored = mock_index_doc.call_args.args[2]
+    assert _dotted_keys(stored) == []
+    assert list(stored["prompts"][1]["models"]) == ["A", "vendor_m-b"]
+
+def test_generate_prompts_reuses_stored_set_until_corpus_changes(tmp_path):
+    sets_dir = str(tmp_path / "sets")
+    config = {
+        "evaluation": {"num_prompts": 2, "prompt_categories": ["factual"]},
+        "prompt_sets": {"enabled": True, "path": sets_dir},
+    }
+    fingerprint = {"doc_count": 3, "digest": "a"}
+    generated = iter(["1. First?\n2. Second?", "1. Third?\n2. Fourth?", "1. Fifth?\n2. Sixth?"])
+
+    def run():
+        state = {"config": config}
+        with patch("src.agents.generate_prompts.corpus_fingerprint", side_effect=lambda index, config=None: fingerprint), \
+             patch("src.agents.generate_prompts.sample_docs", return_value=[{"content": "doc"}]), \
+             patch("src.agents.generate_prompts.call_llm", side_effect=lambda *a, **k: next(generated)):
+            generate_prompts(state)
+        return state
+
+    first = run()
+    assert first["prompts"] == ["First?", "Second?"]
+    assert first["prompt_set"]["reused"] is False
+    second = run()
+    assert second["prompts"] == ["First?", "Second?"]
+    assert second["prompt_set"] == {"key": first["prompt_set"]["key"], "pinned": False, "reused": True}
+
+    # Pinned sets survive a corpus change; unpinned ones are regenerated
+    pin_prompt_set(sets_dir, first["prompt_set"]["key"])
+    fingerprint = {"doc_count": 4, "digest": "b"}
+    assert run()["prompts"] == ["First?", "Second?"]
+    pin_prompt_set(sets_dir, first["prompt_set"]["key"], pinned=False)
+    assert run()["prompts"] == ["Third?", "Fourth?"]
+    assert len(list_prompt_sets(sets_dir)) == 2
+
+    assert invalidate_prompt_sets(sets_dir) == 2
+    assert run()["prompts"] == ["Fifth?", "Sixth?"]
+
+def test_generate_prompts_runs_grounded_batches_and_tops_up_duplicates():
+    lock = threading.Lock()
+    calls = []
+    samples = []
+
+    def fake_sample(index, size, seed=None, stratify_by=None, config=None):
+        samples.append((size, stratify_by))
+        return [{"content": f"chunk{len(samples)}-{i}", "source": f"s{i % 3}"} for i in range(size)]
+
+    def fake_call_llm(prompt, system="", max_tokens=1000):
+        with lock:
+            calls.append((prompt, max_tokens))
+            n = len(calls)
+        count = int(prompt.split("EXACTLY ")[1].split()[0])
+        chunk = prompt.split("chunk")[1].split()[0]
+        # Every first-round batch repeats one generic question, which dedup must drop
+        generic = n <= 3
+        lines = [f"{i + 1}. Which limit applies to {hashlib.sha1(f'{chunk}{n}{i}'.encode()).hexdigest()[:8]}?"
+                 for i in range(count - generic)]
+        return "\n".join(lines + ["- What is this product for?"] * generic)
+
+    config = {"evaluation": {"num_prompts": 45, "prompt_batch_size": 20, "prompt_docs_per_batch": 2}}
+    state = {"config": config}
+    with patch("src.agents.generate_prompts.sample_docs", side_effect=fake_sample), \
+         patch("src.agents.generate_prompts.call_llm", side_effect=fake_call_llm):
+        generate_prompts(state)
+
+    prompts = state["prompts"]
+    # 3 batches (20 + 20 + 5) grounded in different chunks, then one top-up batch
+    assert samples == [(6, "source"), (2, "source")]
+    assert len(calls) == 4
+    assert len({p.split("Text")[0].split("context for the product:")[1].split("Task")[0] for p, _ in calls[:3]}) == 3
+    assert calls[0][1] > 1000
+    assert len(prompts) == 45 and len(set(prompts)) == 45
+    assert prompts.count("What is this product for?") == 1
+    assert "What are the core features described in this documentation?" not in prompts
+
+def _dotted_keys(value, path=""):
+    """
+    Object keys Elasticsearch would expand or reject (containing a dot).
+    """
+    if isinstance(value, dict):
+        found = [f"{path}/{k}" for k in value if "." in str(k)]
+        for k, v in value.items():
+            found += _dotted_keys(v, f"{path}/{k}")
+        return found
+    if isinstance(value, list):
+        return [k for item in value for k in _dotted_keys(item, path)]
+    return []
+
+def test_audit_log_entry_has_no_dotted_keys(tmp_path):
+    get_cache({"llm_cache": {"enabled": True, "path": str(tmp_path / ".cache" / "llm.sqlite3")}})
+    get_governor("anthropic.claude-3-haiku-20240307-v1:0")
+
+    config = {"checkpoint": {"enabled": False}, "dedup": {"enabled": False},
+              "target_model": {"provider": "bedrock", "model_id": "anthropic.claude-3-haiku-20240307-v1:0"}}
+    with _stub_stages(1) as stages:
+        run_workflow({"config": config, "run_id": "run-es"})
+
+    index, _, entry = stages["index_doc"].call_args.args
+    assert index == "evaluation_runs"
+    assert any(path.endswith("llm_sqlite3") for path in entry["llm_cache"])
+    assert "anthropic_claude-3-haiku-20240307-v1:0" in entry["rate_governor"]
+    assert _dotted_keys(entry) == []
+
+def test_generate_prompts_does_not_store_padded_sets(tmp_path):
+    sets_dir = str(tmp_path / "sets")
+    config = {"evaluation": {"num_prompts": 3}, "prompt_sets": {"enabled": True, "path": sets_dir}}
+
+    def flaky_call_llm(*args, **kwargs):
+        raise RuntimeError("ThrottlingException")
+
+    state = {"config": config}
+    with patch("src.agents.generate_prompts.corpus_fingerprint", return_value={"doc_count": 1, "digest": "a"}), \
+         patch("src.agents.generate_prompts.sample_docs", return_value=[{"content": "doc", "source": "s"}]), \
+         patch("src.agents.generate_prompts.call_llm", side_effect=flaky_call_llm):
+        generate_prompts(state)
+
+    assert state["prompts"] == [FILLER_PROMPT] * 3
+    assert "prompt_set" not in state
+    assert list_prompt_sets(sets_dir) == []
@@ -33,3 +33,84 @@ def test_evaluate_endpoint(mock_load_config, mock_run_workflow):
     assert "score" in data
     assert data["score"]["decision"] == "deploy"
     assert data["details"]["num_claims"] == 1
+
+@patch('src.main.run_workflow')
+@patch('src.main.load_config')
+def test_run_job_reports_status_and_streams_events(mock_load_config, mock_run_workflow):
+    import json
+    import time
+    import src.main
+
+    mock_load_config.return_value = {"jobs": {"workers": 1, "queue_size": 5}}
+
+    def side_effect(state, on_event=None, resume=False):
+        on_event({"type": "stage", "stage": "verifying_claims", "counts": {"claims": 1}})
+        state["verdicts"] = [{"claim": "claim1", "label": "supported"}]
+        on_event({"type": "verdict", "verdict": state["verdicts"][0]})
+        state["score"] = {"decision": "deploy"}
+
+    mock_run_workflow.side_effect = side_effect
+    src.main._job_manager = None
+
+    response = client.post("/runs", json={"use_case": "test"})
+    assert response.status_code == 202
+    run_id = response.json()["run_id"]
+
+    deadline = time.time() + 5
+    while client.get(f"/runs/{run_id}").json()["status"] not in ("completed", "failed"):
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+    run = client.get(f"/runs/{run_id}").json()
+    assert run["status"] == "completed"
+    assert run["stage"] == "verifying_claims"
+    assert run["counts"] == {"claims": 1, "verdicts": 1}
+    assert run["result"]["run_id"] == run_id
+    assert run["result"]["score"]["decision"] == "deploy"
+
+    events = [json.loads(line) for line in client.get(f"/runs/{run_id}/events").text.splitlines()]
+    assert [e.get("status") or e.get("stage") or e["type"] for e in events] == [
+        "queued", "running", "verifying_claims", "verdict", "completed",
+    ]
+    assert client.get("/runs/missing").status_code == 404
+    src.main._job_manager = None
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    from src import metrics
+
+    before = metrics.snapshot()
+    metrics.observe("stage_seconds", 0.3, stage="verifying_claims")
+    metrics.inc("llm_tokens_total", 120, model="m", direction="input")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE llm_gate_stage_seconds histogram" in body
+    assert 'llm_gate_stage_seconds_bucket{stage="verifying_claims",le="0.5"}' in body
+    assert 'llm_gate_stage_seconds_bucket{stage="verifying_claims",le="+Inf"}' in body
+    assert 'llm_gate_llm_tokens_total{direction="input",model="m"}' in body
+
+    run = metrics.diff(before, metrics.snapshot())
+    assert run["counters"]["llm_tokens_total"] == [
+        {"labels": {"direction": "input", "model": "m"}, "value": 120}
+    ]
+    assert run["histograms"]["stage_seconds"][0]["count"] == 1
+
+@patch('src.main.load_config')
+def test_prompt_set_endpoints_list_pin_and_invalidate(mock_load_config, tmp_path):
+    from src.prompt_sets import save_prompt_set
+    sets_dir = str(tmp_path / "sets")
+    mock_load_config.return_value = {"prompt_sets": {"path": sets_dir}}
+    stored = save_prompt_set(sets_dir, "trusted_docs", {"doc_count": 1, "digest": "d"}, 2, [], "m", ["q1", "q2"])
+
+    listed = client.get("/prompt-sets").json()["prompt_sets"]
+    assert [s["key"] for s in listed] == [stored["key"]]
+    assert "prompts" not in listed[0] and listed[0]["num_stored"] == 2
+    assert client.get(f"/prompt-sets/{stored['key']}").json()["prompts"] == ["q1", "q2"]
+    assert client.get("/prompt-sets/not-a-key").status_code == 400
+
+    assert client.put(f"/prompt-sets/{stored['key']}/pin").json()["pinned"] is True
+    assert client.delete("/prompt-sets").json() == {"deleted": 0}
+    assert client.delete("/prompt-sets?include_pinned=true").json() == {"deleted": 1}
+    assert client.get(f"/prompt-sets/{stored['key']}").status_code == 404
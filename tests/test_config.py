@@ -0,0 +1,73 @@
+import os
+import pytest
+from src.config.loader import load_config
+
+CONFIG_TEMPLATE = """
+use_case: {use_case}
+thresholds: {{deploy: 0.8, warn: 0.5}}
+evaluation: {{num_prompts: 5}}
+target_model: {{provider: ollama, model_id: llama3.2}}
+verification_model: {{provider: bedrock, model_id: m}}
+elasticsearch: {{host: localhost, port: 9200, index: trusted_docs}}
+doc_sources:
+  - {{type: file, path: data/docs}}
+"""
+
+
+def test_load_config_memoized_until_file_changes(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(CONFIG_TEMPLATE.format(use_case="first"))
+
+    config = load_config(str(path))
+    assert load_config(str(path)) is config
+    assert config["doc_sources"][0]["path"] == "data/docs"
+    with pytest.raises(TypeError):
+        config["use_case"] = "mutated"
+
+    path.write_text(CONFIG_TEMPLATE.format(use_case="second-run"))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    reloaded = load_config(str(path))
+    assert reloaded is not config
+    assert reloaded["use_case"] == "second-run"
+
+
+def test_load_config_keeps_lists_and_copies_deeply(tmp_path):
+    import copy
+    import json
+    path = tmp_path / "config.yaml"
+    path.write_text(CONFIG_TEMPLATE.format(use_case="lists"))
+
+    config = load_config(str(path))
+    sources = config["doc_sources"]
+    assert isinstance(sources, list)
+    assert sources + [{"type": "file"}] == [{"type": "file", "path": "data/docs"}, {"type": "file"}]
+    assert json.loads(json.dumps(config))["doc_sources"] == [{"type": "file", "path": "data/docs"}]
+    with pytest.raises(TypeError):
+        sources.append({"type": "file"})
+
+    for mutable in (config.copy(), copy.deepcopy(config)):
+        mutable["doc_sources"].append({"type": "file", "path": "more"})
+        mutable["thresholds"]["deploy"] = 0.9
+        assert type(mutable["doc_sources"]) is list and type(mutable["thresholds"]) is dict
+    assert len(load_config(str(path))["doc_sources"]) == 1
+
+
+def test_load_config_does_not_cache_a_file_changed_while_reading(tmp_path, monkeypatch):
+    from src.config import loader
+    path = tmp_path / "config.yaml"
+    path.write_text(CONFIG_TEMPLATE.format(use_case="racy"))
+    real_stat = os.stat
+    calls = []
+
+    def shifting_stat(p, *args, **kwargs):
+        result = real_stat(p, *args, **kwargs)
+        calls.append(p)
+        if len(calls) > 1:  # the file "changes" after the first stat
+            os.utime(p, ns=(result.st_atime_ns, result.st_mtime_ns + 1_000_000))
+            result = real_stat(p, *args, **kwargs)
+        return result
+
+    monkeypatch.setattr(loader.os, "stat", shifting_stat)
+    loader.load_config(str(path))
+    assert os.path.realpath(path) not in loader._config_cache
@@ -0,0 +1,112 @@
+from unittest.mock import patch
+from src.ingest.pipeline import run_ingest
+
+
+def _config(docs_dir, manifest_path=None):
+    return {
+        "elasticsearch": {"index": "trusted_docs"},
+        "doc_sources": [{"type": "file", "path": str(docs_dir)}],
+        "ingest": {
+            "bulk_docs": 10,
+            "bulk_workers": 1,
+            "manifest_path": str(manifest_path or docs_dir / ".manifest.json"),
+        },
+    }
+
+
+def _fake_embed_many(texts, config=None):
+    return [[0.1, 0.2]] * len(texts)
+
+
+def test_run_ingest_streams_chunks_to_bulk_index(tmp_path):
+    (tmp_path / "a.txt").write_text("Mojo is a programming language.")
+    (tmp_path / "b.md").write_text("Mojo supports SIMD.")
+    (tmp_path / "skip.bin").write_text("ignored")
+    received = []
+
+    def fake_bulk_index(index, docs, **kwargs):
+        received.extend(docs)
+        assert kwargs["chunk_size"] == 10 and kwargs["thread_count"] == 1
+        return {"indexed": len(received), "errors": 0, "failures": [], "failed_ids": []}
+
+    with patch("src.ingest.pipeline.load_config", return_value=_config(tmp_path)), \
+            patch("src.ingest.pipeline.ensure_index"), \
+            patch("src.ingest.pipeline.embed_many", side_effect=_fake_embed_many), \
+            patch("src.ingest.pipeline.bulk_index", side_effect=fake_bulk_index):
+        stats = run_ingest()
+
+    assert stats["indexed"] == 2 and stats["errors"] == 0
+    assert sorted(body["content"] for _, body in received) == [
+        "Mojo is a programming language.", "Mojo supports SIMD."
+    ]
+
+
+def test_iter_chunks_respects_boundaries_offsets_and_headings(tmp_path):
+    from src.ingest.chunker import iter_chunks
+
+    intro = "Intro sentence number one. " * 10
+    body = "Functions are declared with fn. " * 10
+    text = f"# Overview\n{intro}\n\n# Functions\n{body}"
+    path = tmp_path / "doc.md"
+    path.write_text(text)
+
+    chunks = list(iter_chunks(str(path), max_chars=400, overlap=50, read_size=64))
+
+    assert len(chunks) > 1
+    for c in chunks:
+        assert len(c["text"]) <= 400
+        assert text[c["start_offset"]:c["end_offset"]] == c["text"]
+    assert chunks[0]["heading"] == "Overview"
+    assert any(c["text"].startswith("# Functions") for c in chunks)
+    assert chunks[-1]["heading"] == "Functions"
+    assert chunks[-1]["end_offset"] == len(text)
+
+
+def test_iter_chunks_caps_overlap_so_chunks_keep_advancing(tmp_path):
+    from src.ingest.chunker import iter_chunks
+
+    # Paragraph breaks just past the half-way mark of each window
+    text = "\n\n".join([("word " * 42).strip()] * 40)
+    path = tmp_path / "doc.md"
+    path.write_text(text)
+
+    chunks = list(iter_chunks(str(path), max_chars=400, overlap=199, read_size=64))
+
+    starts = [c["start_offset"] for c in chunks]
+    assert all(b - a >= 100 for a, b in zip(starts, starts[1:]))
+    assert len(chunks) <= len(text) // 100 + 1
+    assert chunks[-1]["end_offset"] == len(text)
+
+
+def test_run_ingest_incremental_skips_unchanged_and_removes_deleted(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("Mojo is a programming language.")
+    (docs / "b.txt").write_text("Mojo supports SIMD.")
+    config = _config(docs, tmp_path / "manifest.json")
+    indexed, deleted = [], []
+
+    def fake_bulk_index(index, docs, **kwargs):
+        batch = list(docs)
+        indexed.append(batch)
+        return {"indexed": len(batch), "errors": 0, "failures": [], "failed_ids": []}
+
+    def fake_delete_docs(index, doc_ids, config=None):
+        deleted.extend(doc_ids)
+        return len(doc_ids)
+
+    with patch("src.ingest.pipeline.load_config", return_value=config), \
+            patch("src.ingest.pipeline.ensure_index"), \
+            patch("src.ingest.pipeline.embed_many", side_effect=_fake_embed_many), \
+            patch("src.ingest.pipeline.bulk_index", side_effect=fake_bulk_index), \
+            patch("src.ingest.pipeline.delete_docs", side_effect=fake_delete_docs):
+        first = run_ingest(mode="incremental")
+        first_ids = {doc_id for doc_id, _ in indexed[0]}
+
+        (docs / "b.txt").unlink()
+        second = run_ingest(mode="incremental")
+
+    assert first["files_changed"] == 2 and first["indexed"] == 2
+    assert second["files_changed"] == 0 and second["files_skipped"] == 1
+    assert second["files_deleted"] == 1 and second["chunks_removed"] == 1
+    assert len(indexed) == 1 and len(deleted) == 1 and deleted[0] in first_ids
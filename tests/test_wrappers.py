@@ -0,0 +1,416 @@
+import time
+from src.wrappers.llm_cache import LLMCache, cache_key, get_cache
+
+
+def test_cache_key_depends_on_all_inputs():
+    base = cache_key("m", "sys", "prompt", {"max_tokens": 1000})
+    assert base == cache_key("m", "sys", "prompt", {"max_tokens": 1000})
+    assert base != cache_key("m2", "sys", "prompt", {"max_tokens": 1000})
+    assert base != cache_key("m", "", "prompt", {"max_tokens": 1000})
+    assert base != cache_key("m", "sys", "prompt", {"max_tokens": 500})
+
+
+def test_llm_cache_hits_ttl_and_lru_eviction(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "c.sqlite3"), max_entries=2)
+    cache.put("a", "A")
+    time.sleep(0.01)
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # a is now most recently used
+    cache.put("c", "C")  # evicts b
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["entries"] == 2
+
+    expiring = LLMCache(path=str(tmp_path / "t.sqlite3"), ttl_seconds=0)
+    expiring.put("a", "A")
+    time.sleep(0.01)
+    assert expiring.get("a") is None
+
+
+def test_get_cache_disabled_and_bypass(tmp_path, monkeypatch):
+    config = {"llm_cache": {"enabled": True, "path": str(tmp_path / "c.sqlite3")}}
+    assert get_cache({}) is None
+    assert get_cache(config) is not None
+    monkeypatch.setenv("LLM_CACHE_BYPASS", "1")
+    assert get_cache(config) is None
+
+
+def test_bedrock_clients_pooled_per_region(monkeypatch):
+    from src.wrappers import bedrock
+
+    monkeypatch.setattr(bedrock, "_clients", {})
+    a = bedrock._get_client("us-east-1")
+    assert bedrock._get_client("us-east-1") is a
+    assert bedrock._get_client("us-west-2") is not a
+    assert a.meta.config.max_pool_connections == bedrock._client_settings["max_pool_connections"]
+
+
+def test_bedrock_client_uses_pool_settings_from_config_without_prewarm(monkeypatch):
+    from src.wrappers import bedrock
+
+    monkeypatch.setattr(bedrock, "_clients", {})
+    monkeypatch.setattr(bedrock, "_client_settings", dict(bedrock.DEFAULT_CLIENT_SETTINGS))
+    monkeypatch.setattr(bedrock, "load_config", lambda: {"bedrock": {"max_pool_connections": 7, "read_timeout": 30}})
+
+    client = bedrock._get_client("us-east-1")
+    assert client.meta.config.max_pool_connections == 7
+    assert client.meta.config.read_timeout == 30
+
+
+def test_embed_many_dedupes_caches_and_keeps_order(tmp_path, monkeypatch):
+    from src.wrappers import bedrock
+
+    calls = []
+
+    def fake_invoke_embed(text, model_id, config=None):
+        calls.append(text)
+        if text == "bad":
+            raise RuntimeError("boom")
+        return [float(len(text))]
+
+    monkeypatch.setattr(bedrock, "_invoke_embed", fake_invoke_embed)
+    config = {"embedding_cache": {"enabled": True, "path": str(tmp_path / "e.sqlite3")}}
+
+    assert bedrock.embed_many(["a", "bb", "a", "bad"], config=config) == [[1.0], [2.0], [1.0], None]
+    assert sorted(calls) == ["a", "bad", "bb"]
+
+    calls.clear()
+    assert bedrock.embed_many(["bb", "ccc"], config=config) == [[2.0], [3.0]]
+    assert calls == ["ccc"]
+
+
+def test_rrf_fuse_ranks_docs_found_by_both_retrievers_first():
+    from src.wrappers.elasticsearch_helper import rrf_fuse
+
+    bm25 = [{"_id": "a"}, {"_id": "b"}, {"_id": "c"}]
+    knn = [{"_id": "d"}, {"_id": "b"}]
+    assert [h["_id"] for h in rrf_fuse([bm25, knn])] == ["b", "a", "d", "c"]
+
+
+def test_sample_docs_uses_seeded_random_score_and_stratifies_by_source(monkeypatch):
+    from unittest.mock import MagicMock
+    from src.wrappers import elasticsearch_helper as es
+
+    hits = [{"_source": {"source": "a.md", "content": f"a{i}"}} for i in range(6)]
+    hits += [{"_source": {"source": "b.md", "content": "b0"}}, {"_source": {"source": "c.md", "content": "c0"}}]
+    client = MagicMock()
+    client.search.return_value = {"hits": {"hits": hits}}
+    monkeypatch.setattr(es, "_get_es_client", lambda: client)
+
+    docs = es.sample_docs("docs", size=4, seed=7, stratify_by="source", config={})
+    assert [d["content"] for d in docs] == ["a0", "b0", "c0", "a1"]
+    kwargs = client.search.call_args.kwargs
+    assert kwargs["size"] == 16
+    assert kwargs["query"]["function_score"]["random_score"] == {"seed": 7, "field": "_seq_no"}
+
+
+def test_es_helpers_follow_the_run_config_not_the_default(tmp_path, monkeypatch):
+    import pytest
+    from src.wrappers import elasticsearch_helper as es
+
+    def no_es():
+        raise AssertionError("Elasticsearch must not be called for a local-backend run")
+
+    monkeypatch.setattr(es, "load_config", lambda: {"retrieval": {"backend": "elasticsearch"},
+                                                    "elasticsearch": {"embedding_dims": 1024}})
+    monkeypatch.setattr(es, "_get_es_client", no_es)
+    config = {"retrieval": {"backend": "local", "local_path": str(tmp_path)},
+              "elasticsearch": {"embedding_dims": 8}}
+
+    es.index_doc("run_docs", "d1", {"content": "local backend doc", "source": "a.md"}, config=config)
+    assert [d["content"] for d in es.sample_docs("run_docs", size=5, config=config)] == ["local backend doc"]
+    assert es.search_docs("backend", index="run_docs", config=config)[0]["source"] == "a.md"
+    assert es.corpus_fingerprint("run_docs", config=config)["doc_count"] == 1
+    assert es._resolve_dims(None, config) == 8
+
+    from src.wrappers.local_index import LocalBackend
+    assert isinstance(es.get_backend(config), LocalBackend)
+    assert isinstance(es.get_backend({}), es.ElasticsearchBackend)
+    with pytest.raises(ValueError):
+        es.get_backend({"retrieval": {"backend": "solr"}})
+
+
+def test_parallel_bulk_index_retries_docs_rejected_with_429(monkeypatch):
+    from unittest.mock import MagicMock
+    from src.wrappers import elasticsearch_helper as es
+
+    retried = {}
+
+    def fake_parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            doc_id = action["_id"]
+            if doc_id in ("d1", "d3"):
+                yield False, {"index": {"_id": doc_id, "status": 429, "error": "es_rejected_execution_exception"}}
+            elif doc_id == "d4":
+                yield False, {"index": {"_id": doc_id, "status": 400, "error": "mapper_parsing_exception"}}
+            else:
+                yield True, {"index": {"_id": doc_id, "status": 201}}
+
+    def fake_streaming_bulk(client, actions, **kwargs):
+        retried["kwargs"] = kwargs
+        retried["docs"] = [(a["_id"], a["_source"]) for a in actions]
+        for doc_id, _ in retried["docs"]:
+            yield True, {"index": {"_id": doc_id, "status": 201}}
+
+    monkeypatch.setattr(es, "_get_es_client", lambda: MagicMock())
+    monkeypatch.setattr(es.helpers, "parallel_bulk", fake_parallel_bulk)
+    monkeypatch.setattr(es.helpers, "streaming_bulk", fake_streaming_bulk)
+    monkeypatch.setattr(es.time, "sleep", lambda seconds: None)
+
+    docs = ((f"d{i}", {"content": f"doc {i}"}) for i in range(5))
+    stats = es.bulk_index("docs", docs, thread_count=4, config={})
+
+    assert retried["docs"] == [("d1", {"content": "doc 1"}), ("d3", {"content": "doc 3"})]
+    assert retried["kwargs"]["max_retries"] == es.BULK_MAX_RETRIES
+    assert (stats["indexed"], stats["errors"], stats["failed_ids"]) == (4, 1, ["d4"])
+
+
+def test_index_definition_maps_embedding_as_hnsw_dense_vector():
+    from src.wrappers.elasticsearch_helper import index_definition
+
+    embedding = index_definition(1024)["mappings"]["properties"]["embedding"]
+    assert embedding["type"] == "dense_vector" and embedding["dims"] == 1024
+    assert embedding["index_options"]["type"] == "hnsw"
+
+
+def test_local_index_bm25_knn_delete_and_persistence(tmp_path):
+    from src.wrappers.local_index import LocalIndex
+
+    index = LocalIndex(str(tmp_path / "docs"))
+    index.upsert("a", {"content": "Mojo supports SIMD vector types.", "embedding": [1.0, 0.0]})
+    index.upsert("b", {"content": "Python has dynamic typing.", "embedding": [0.0, 1.0]})
+    index.upsert("c", {"content": "Mojo functions use fn.", "embedding": [0.7, 0.7]})
+    assert index.search("mojo simd") == []  # not visible before refresh
+    index.refresh()
+
+    assert [h["_id"] for h in index.search("mojo simd")] == ["a", "c"]
+    assert "embedding" not in index.search("mojo")[0]["_source"]
+    assert [h["_id"] for h in index.knn([0.9, 0.1], k=2)] == ["a", "c"]
+
+    index.delete("a")
+    index.refresh()
+    reopened = LocalIndex(str(tmp_path / "docs"))
+    assert reopened.count() == 2
+    assert [h["_id"] for h in reopened.knn([1.0, 0.0], k=1)] == ["c"]
+    assert [h["_id"] for h in reopened.search("python typing")] == ["b"]
+
+
+def test_local_index_appends_plain_writes_and_builds_search_lazily(tmp_path, monkeypatch):
+    from src.wrappers.local_index import LocalIndex
+
+    index = LocalIndex(str(tmp_path / "runs"))
+    index.upsert("v1", {"content": "alpha doc", "embedding": [1.0, 0.0]})
+    index.upsert("v2", {"content": "beta doc", "embedding": [0.0, 1.0]})
+    index.refresh()
+
+    calls = []
+    for name in ("_rewrite_files", "_rebuild"):
+        original = getattr(index, name)
+        monkeypatch.setattr(index, name, lambda name=name, original=original: (calls.append(name), original())[1])
+
+    # Audit-log style writes: one doc without a vector per refresh
+    for i in range(5):
+        index.upsert(f"run-{i}", {"content": f"evaluation run {i}"})
+        index.refresh()
+    index.delete("run-0")
+    index.refresh()
+    assert calls == []
+
+    assert [h["_id"] for h in index.search("alpha")] == ["v1"]
+    assert calls == ["_rebuild"]
+
+    reopened = LocalIndex(str(tmp_path / "runs"))
+    assert reopened.count() == 6
+    assert [h["_id"] for h in reopened.knn([0.1, 1.0], k=1)] == ["v2"]
+    assert [h["_id"] for h in reopened.search("run 3")][0] == "run-3"
+    assert "run-0" not in reopened.doc_ids()
+
+
+def test_local_index_ivf_search_finds_nearest(tmp_path):
+    import numpy as np
+    from src.wrappers.local_index import LocalIndex
+
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(400, 8))
+    index = LocalIndex(str(tmp_path / "ivf"), ivf_min_docs=100, ivf_nprobe=20)
+    for i, v in enumerate(vectors):
+        index.upsert(str(i), {"content": f"doc {i}", "embedding": v.tolist()})
+    index.refresh()
+
+    assert index.knn(vectors[42].tolist(), k=1)[0]["_id"] == "42"
+    assert index._centroids is not None
+    assert index.knn(vectors[42].tolist(), k=0) == []
+    assert index.knn(vectors[42].tolist(), k=-3) == []
+
+    narrow = LocalIndex(str(tmp_path / "ivf"), ivf_min_docs=100, ivf_nprobe=1)
+    hits = narrow.knn(vectors[42].tolist(), k=1000)
+    assert narrow._centroids is not None
+    assert 0 < len(hits) < 400
+    assert len({h["_id"] for h in hits}) == len(hits)
+
+
+def test_rate_governor_retries_throttles_and_halves_concurrency(monkeypatch):
+    import pytest
+    from botocore.exceptions import ClientError
+    from src.wrappers import rate_governor
+
+    monkeypatch.setattr(rate_governor.time, "sleep", lambda seconds: None)
+    governor = rate_governor.RateGovernor(
+        "m", {"initial_concurrency": 8}, {"max_attempts": 3, "deadline_seconds": 60},
+    )
+    throttle = ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"}}, "InvokeModel")
+    outcomes = [throttle, "ok"]
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert governor.call(flaky, tokens=100) == "ok"
+    stats = governor.stats()
+    assert (stats["attempts"], stats["throttles"], stats["retries"]) == (2, 1, 1)
+    assert stats["concurrency_limit"] == 4  # halved once, then +1/limit on success
+
+    denied = ClientError({"Error": {"Code": "AccessDeniedException", "Message": "no"}}, "InvokeModel")
+    def fail():
+        raise denied
+    with pytest.raises(ClientError):
+        governor.call(fail)
+    assert governor.stats()["failures"] == 1
+
+    bucket = rate_governor.TokenBucket(60)  # one per second, ten-second burst
+    assert [bucket.reserve(1) for _ in range(10)] == [0.0] * 10
+    assert bucket.reserve(1) > 0.5
+
+
+def test_ollama_stream_enforces_token_limit_and_records_ttft(monkeypatch):
+    import json
+    from src.wrappers import ollama
+
+    sent = {}
+
+    class FakeResponse:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_lines(self):
+            # A model that would ramble forever
+            for i in range(1000):
+                yield json.dumps({"response": f"w{i} ", "done": False}).encode()
+
+    class FakeSession:
+        def post(self, url, json=None, stream=False, timeout=None):
+            sent.update(url=url, payload=json, stream=stream, timeout=timeout)
+            return FakeResponse()
+
+    monkeypatch.setattr(ollama, "_get_session", lambda base_url, pool: FakeSession())
+    settings = ollama.ollama_settings({"ollama": {"max_tokens": 3, "timeout_seconds": 30, "stop": ["\n\n"]}})
+    result = ollama.generate_ollama("q", model_id="m", base_url="http://ollama:11434", settings=settings)
+
+    assert result["text"] == "w0 w1 w2 "
+    assert result["truncated"] == "max_tokens"
+    assert result["ttft_seconds"] is not None and result["ttft_seconds"] <= result["seconds"]
+    assert sent["stream"] is True and sent["timeout"] == (5.0, 30.0)
+    assert sent["payload"]["options"] == {"num_predict": 3, "stop": ["\n\n"]}
+    assert sent["payload"]["keep_alive"] == "30m"
+
+
+def test_ollama_deadline_cuts_a_stalled_stream(monkeypatch):
+    import asyncio
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from src.wrappers import ollama
+
+    release = threading.Event()
+
+    class StallingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            line = (json.dumps({"response": "partial", "done": False}) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+            release.wait(5)  # then stall
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StallingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(ollama, "_sessions", {})
+    settings = ollama.ollama_settings({"ollama": {"timeout_seconds": 0.5}})
+    try:
+        sync_result = ollama.generate_ollama("q", base_url=base_url, settings=settings)
+        async_result = asyncio.run(ollama.agenerate_ollama("q", base_url=base_url, settings=settings))
+    finally:
+        release.set()
+        server.shutdown()
+
+    # The read timeout alone would let each run on to about twice timeout_seconds
+    for result in (sync_result, async_result):
+        assert (result["text"], result["truncated"]) == ("partial", "deadline")
+        assert result["seconds"] < 0.9
+
+
+def test_ollama_async_variant_streams_on_pooled_client(monkeypatch):
+    import asyncio
+    import json
+    import httpx
+    from src.wrappers import ollama
+
+    def handler(request):
+        assert json.loads(request.content)["options"]["num_predict"] == 50
+        lines = [{"response": "Hello", "done": False}, {"response": " world", "done": False},
+                 {"response": "", "done": True, "done_reason": "stop", "prompt_eval_count": 4, "eval_count": 2}]
+        return httpx.Response(200, content="\n".join(json.dumps(l) for l in lines).encode())
+
+    clients = []
+
+    def fake_client(base_url, settings):
+        if not clients:
+            clients.append(httpx.AsyncClient(base_url=base_url, transport=httpx.MockTransport(handler)))
+        return clients[0]
+
+    monkeypatch.setattr(ollama, "_get_async_client", fake_client)
+    settings = ollama.ollama_settings({"ollama": {"max_tokens": 50}})
+
+    async def run_both():
+        return await asyncio.gather(*(ollama.agenerate_ollama(p, settings=settings) for p in ("a", "b")))
+
+    results = asyncio.run(run_both())
+    assert [r["text"] for r in results] == ["Hello world", "Hello world"]
+    assert all(r["truncated"] is None and r["output_tokens"] == 2 for r in results)
+
+
+def test_ollama_close_clients_closes_pooled_clients(monkeypatch):
+    import asyncio
+    import weakref
+    from src.wrappers import ollama
+
+    monkeypatch.setattr(ollama, "_sessions", {})
+    monkeypatch.setattr(ollama, "_async_clients", weakref.WeakKeyDictionary())
+    settings = ollama.ollama_settings({})
+    session = ollama._get_session("http://ollama:11434", settings["pool_connections"])
+
+    async def open_and_close():
+        client = ollama._get_async_client("http://ollama:11434", settings)
+        await ollama.close_clients()
+        return client
+
+    client = asyncio.run(open_and_close())
+    assert client.is_closed
+    assert ollama._sessions == {} and not session.adapters["http://"].poolmanager.pools